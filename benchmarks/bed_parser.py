@@ -0,0 +1,85 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Compare the throughput of the BED parsers.
+
+Usage: python benchmarks/bed_parser.py [SIZE_IN_MB]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from chunked_scatter.parsers import BedRegion, bed_file_to_region_array, \
+    bed_file_to_regions
+
+
+def line_by_line_bed_parser(in_file):
+    """The line based parser that was used before the bulk parser."""
+    with open(in_file, "rt") as in_file_h:
+        for line in in_file_h:
+            fields = line.strip().split()
+            if fields[0] in ["browser", "track"] or len(fields) < 3:
+                continue
+            yield BedRegion(fields[0], int(fields[1]), int(fields[2]))
+
+
+def write_bed(path: Path, size: int):
+    """Write a BED file with coverage-like records of about size bytes."""
+    with path.open("wt") as bed_h:
+        written = 0
+        position = 0
+        contig = 1
+        while written < size:
+            line = (f"chr{contig}\t{position}\t{position + 150}\t"
+                    f"callable\t0\t+\n")
+            bed_h.write(line)
+            written += len(line)
+            position += 200
+            if position > 250_000_000:
+                contig += 1
+                position = 0
+
+
+def measure(name, function, path: Path):
+    size = path.stat().st_size / 1024 ** 2
+    start = time.perf_counter()
+    result = function(path)
+    if not hasattr(result, "__len__"):
+        result = list(result)
+    duration = time.perf_counter() - start
+    print(f"{name:<28}{len(result):>12} regions  {duration:8.2f} s  "
+          f"{size / duration:8.1f} MB/s")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir, "regions.bed")
+        write_bed(path, size * 1024 ** 2)
+        measure("line by line", line_by_line_bed_parser, path)
+        measure("bed_file_to_regions", bed_file_to_regions, path)
+        measure("bed_file_to_region_array", bed_file_to_region_array, path)
+
+
+if __name__ == "__main__":
+    main()
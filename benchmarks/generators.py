@@ -0,0 +1,127 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Generate synthetic inputs of realistic size for the benchmarks. All
+generators are deterministic, so runs on different machines or commits use
+the same data.
+"""
+
+import random
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+# The lengths of the GRCh38 primary assembly chromosomes.
+GRCH38_CHROMOSOMES = [
+    ("chr1", 248956422), ("chr2", 242193529), ("chr3", 198295559),
+    ("chr4", 190214555), ("chr5", 181538259), ("chr6", 170805979),
+    ("chr7", 159345973), ("chr8", 145138636), ("chr9", 138394717),
+    ("chr10", 133797422), ("chr11", 135086622), ("chr12", 133275309),
+    ("chr13", 114364328), ("chr14", 107043718), ("chr15", 101991189),
+    ("chr16", 90338345), ("chr17", 83257441), ("chr18", 80373285),
+    ("chr19", 58617616), ("chr20", 64444167), ("chr21", 46709983),
+    ("chr22", 50818468), ("chrX", 156040895), ("chrY", 57227415),
+    ("chrM", 16569),
+]
+# GRCh38 has about 170 unlocalized and unplaced contigs besides the
+# chromosomes.
+SMALL_CONTIGS = 170
+SEED = 42
+
+
+def genome_contigs(small_contigs: int = SMALL_CONTIGS, seed: int = SEED
+                   ) -> List[Tuple[str, int]]:
+    """The GRCh38 chromosomes followed by small unplaced contigs."""
+    rng = random.Random(seed)
+    unplaced = [(f"chrUn_KI{270300 + number}v1", rng.randint(1000, 200000))
+                for number in range(small_contigs)]
+    return GRCH38_CHROMOSOMES + unplaced
+
+
+def write_dict(path: Path, contigs: List[Tuple[str, int]]):
+    """Write a Picard sequence dictionary."""
+    with path.open("wt") as dict_h:
+        dict_h.write("@HD\tVN:1.6\n")
+        for contig, length in contigs:
+            dict_h.write(f"@SQ\tSN:{contig}\tLN:{length}\t"
+                         f"UR:file:/references/GRCh38.fa\n")
+
+
+def write_fai(path: Path, contigs: List[Tuple[str, int]],
+              line_bases: int = 60):
+    """Write a FASTA index for a FASTA file with lines of line_bases."""
+    offset = 0
+    with path.open("wt") as fai_h:
+        for contig, length in contigs:
+            offset += len(contig) + 2
+            fai_h.write(f"{contig}\t{length}\t{offset}\t{line_bases}\t"
+                        f"{line_bases + 1}\n")
+            offset += length + (length + line_bases - 1) // line_bases
+
+
+def exome_intervals(contigs: List[Tuple[str, int]], lines: int,
+                    seed: int = SEED) -> Iterator[Tuple[str, int, int]]:
+    """
+    Generate sorted, non-overlapping exon-like intervals of 50 to 400 bases,
+    divided over the contigs in proportion to their length.
+    """
+    rng = random.Random(seed)
+    genome_size = sum(length for _, length in contigs)
+    for contig, length in contigs:
+        count = lines * length // genome_size
+        if count == 0:
+            continue
+        spacing = length // count
+        for number in range(count):
+            start = number * spacing + rng.randrange(max(spacing - 400, 1))
+            end = min(start + rng.randint(50, 400), length,
+                      (number + 1) * spacing)
+            yield contig, start, end
+
+
+def write_bed(path: Path, intervals: Iterator[Tuple[str, int, int]]):
+    """Write intervals as a BED file with a name column."""
+    with path.open("wt") as bed_h:
+        for number, (contig, start, end) in enumerate(intervals):
+            bed_h.write(f"{contig}\t{start}\t{end}\ttarget_{number}\n")
+
+
+def write_vcf(path: Path, contigs: List[Tuple[str, int]], records: int,
+              seed: int = SEED):
+    """
+    Write a sorted single sample VCF file with SNVs divided over the contigs
+    in proportion to their length.
+    """
+    rng = random.Random(seed)
+    genome_size = sum(length for _, length in contigs)
+    with path.open("wt") as vcf_h:
+        vcf_h.write("##fileformat=VCFv4.2\n")
+        for contig, length in contigs:
+            vcf_h.write(f"##contig=<ID={contig},length={length}>\n")
+        vcf_h.write('##FORMAT=<ID=GT,Number=1,Type=String,'
+                    'Description="Genotype">\n')
+        vcf_h.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t"
+                    "sample\n")
+        for contig, length in contigs:
+            count = records * length // genome_size
+            positions = sorted(rng.sample(range(1, length + 1), count))
+            vcf_h.write("".join(
+                f"{contig}\t{position}\t.\tA\tG\t50\tPASS\t.\tGT\t0/1\n"
+                for position in positions))
@@ -0,0 +1,285 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Measure the time and peak memory of the parsers, chunkers and scatterers on
+synthetic genome scale inputs: a GRCh38-like .dict and .fai, an exome BED
+with a million targets and a VCF with a million variants (at --scale 1).
+
+Each stage runs in a fresh process, so it is not influenced by earlier
+stages. The time of a stage is the fastest of --repeat runs and does not
+include loading its input, unless loading the input is what is measured.
+The peak memory is the most memory allocated by Python during one more,
+untimed, run of the stage, on top of what was allocated for its input.
+Memory allocated by htslib is not included.
+
+Usage:
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from chunked_scatter.chunked_scatter import chunked_scatter, region_chunker
+from chunked_scatter.indexes import read_index
+from chunked_scatter.parsers import bed_file_to_region_array, \
+    bed_file_to_regions, dict_file_to_regions, fai_file_to_regions, \
+    vcf_file_to_regions
+from chunked_scatter.regions import merge_regions
+from chunked_scatter.safe_scatter import mix_small_regions, safe_scatter
+from chunked_scatter.scatter_regions import scatter_regions
+from chunked_scatter.sorting import sort_regions
+
+import generators
+
+import pysam
+
+EXOME_LINES = 1_000_000
+VCF_RECORDS = 1_000_000
+# A stage is slower or larger than the baseline when the ratio exceeds this.
+DEFAULT_THRESHOLD = 1.25
+# Differences in time below this are noise, even when the ratio is large.
+MIN_SECONDS = 0.01
+
+
+def genome(data_dir: Path) -> list:
+    return list(dict_file_to_regions(data_dir / "genome.dict"))
+
+
+def exome(data_dir: Path) -> list:
+    return list(bed_file_to_regions(data_dir / "exome.bed"))
+
+
+def consume(iterable) -> int:
+    """Exhaust an iterable and return the number of items."""
+    count = 0
+    for _ in iterable:
+        count += 1
+    return count
+
+
+# Stage name: (setup, run). The setup is not timed. Its result is passed to
+# run, whose result is the number of items produced.
+STAGES: Dict[str, Tuple[Callable[[Path], Any], Callable[[Any], int]]] = {
+    "parse_dict": (
+        lambda data_dir: data_dir / "genome.dict",
+        lambda path: consume(dict_file_to_regions(path))),
+    "parse_fai": (
+        lambda data_dir: data_dir / "genome.fai",
+        lambda path: consume(fai_file_to_regions(path))),
+    "parse_bed": (
+        lambda data_dir: data_dir / "exome.bed",
+        lambda path: len(list(bed_file_to_regions(path)))),
+    "parse_bed_region_array": (
+        lambda data_dir: data_dir / "exome.bed",
+        lambda path: len(bed_file_to_region_array(path))),
+    "parse_vcf": (
+        lambda data_dir: data_dir / "variants.vcf.gz",
+        lambda path: consume(vcf_file_to_regions(path))),
+    "parse_vcf_index": (
+        lambda data_dir: data_dir / "variants.vcf.gz",
+        lambda path: consume(vcf_file_to_regions(path, use_index=True))),
+    # With the bin sizes, as read for --weights with --use-index.
+    "read_index_sizes": (
+        lambda data_dir: data_dir / "variants.vcf.gz.tbi",
+        lambda path: sum(len(contig.bins) for contig in read_index(path))),
+    "merge_regions": (
+        exome,
+        lambda regions: consume(merge_regions(regions))),
+    "sort_regions": (
+        lambda data_dir: exome(data_dir)[::-1],
+        lambda regions: consume(sort_regions(regions))),
+    "region_chunker_genome": (
+        genome,
+        lambda regions: consume(region_chunker(regions, 10_000, 150))),
+    "region_chunker_exome": (
+        exome,
+        lambda regions: consume(region_chunker(regions, 100, 10))),
+    "chunked_scatter_genome": (
+        genome,
+        lambda regions: consume(chunked_scatter(
+            regions, 1_000_000, 150, 45_000_000))),
+    "scatter_regions_exome": (
+        exome,
+        lambda regions: consume(scatter_regions(regions, 1_000_000))),
+    "mix_small_regions_exome": (
+        exome,
+        lambda regions: len(mix_small_regions(regions, 300))),
+    "safe_scatter_genome": (
+        genome,
+        lambda regions: consume(safe_scatter(regions, 50, 10_000,
+                                             mix=True))),
+    "safe_scatter_exome": (
+        exome,
+        lambda regions: consume(safe_scatter(regions, 50, 1_000))),
+}
+
+
+def generate_data(data_dir: Path, scale: float):
+    """Write the synthetic inputs, unless they exist for this scale."""
+    marker = data_dir / "scale.txt"
+    if marker.exists() and marker.read_text() == str(scale):
+        return
+    data_dir.mkdir(parents=True, exist_ok=True)
+    contigs = generators.genome_contigs()
+    generators.write_dict(data_dir / "genome.dict", contigs)
+    generators.write_fai(data_dir / "genome.fai", contigs)
+    generators.write_bed(data_dir / "exome.bed", generators.exome_intervals(
+        contigs, int(EXOME_LINES * scale)))
+    vcf = data_dir / "variants.vcf"
+    generators.write_vcf(vcf, contigs, int(VCF_RECORDS * scale))
+    # Compresses the VCF and writes a tabix index.
+    pysam.tabix_index(str(vcf), preset="vcf", force=True)
+    marker.write_text(str(scale))
+
+
+def run_stage(name: str, data_dir: Path, repeat: int) -> Dict[str, float]:
+    """Run a stage repeat times. This is run in a fresh process."""
+    setup, run = STAGES[name]
+    durations = []
+    for _ in range(repeat):
+        stage_input = setup(data_dir)
+        start = time.perf_counter()
+        items = run(stage_input)
+        durations.append(time.perf_counter() - start)
+        del stage_input
+    # Tracing slows down allocations, so memory is measured in a separate
+    # run. Only the allocations made after the setup count.
+    stage_input = setup(data_dir)
+    tracemalloc.start()
+    run(stage_input)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": min(durations), "peak_mb": peak / 1024 ** 2,
+            "items": items}
+
+
+def run_stages(names: List[str], data_dir: Path, repeat: int
+               ) -> Dict[str, Dict[str, float]]:
+    # Spawn rather than fork, so a stage does not share memory with earlier
+    # stages or the parent.
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in names:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(run_stage, (name, data_dir, repeat))
+        print(f"{name:<28}{results[name]['items']:>12} items  "
+              f"{results[name]['seconds']:8.3f} s  "
+              f"{results[name]['peak_mb']:8.1f} MiB", flush=True)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]],
+            baseline: Dict[str, Dict[str, float]], threshold: float
+            ) -> List[str]:
+    """
+    Compare results with a baseline.
+    :return: Descriptions of the stages that are slower or use more memory
+    than the baseline by more than the threshold ratio.
+    """
+    regressions = []
+    print(f"\n{'stage':<28}{'time':>10}{'memory':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratios = {key: result[key] / baseline[name][key]
+                  if baseline[name][key] else 1.0
+                  for key in ("seconds", "peak_mb")}
+        print(f"{name:<28}{ratios['seconds']:>9.2f}x"
+              f"{ratios['peak_mb']:>9.2f}x")
+        for key, ratio in ratios.items():
+            if key == "seconds" and \
+                    result[key] - baseline[name][key] < MIN_SECONDS:
+                continue
+            if ratio > threshold:
+                regressions.append(f"{name} {key}: {baseline[name][key]:.3f} "
+                                   f"-> {result[key]:.3f}")
+    return regressions
+
+
+def argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parsers, chunkers and scatterers on "
+                    "synthetic genome scale inputs.")
+    parser.add_argument("stages", metavar="STAGE", nargs="*",
+                        help=f"The stages to run. Default: all. Choices: "
+                             f"{', '.join(STAGES)}.")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiply the size of the exome BED and the VCF "
+                             "by this factor. Default: %(default)s.")
+    parser.add_argument("--data-dir", type=Path,
+                        default=Path(__file__).parent / "data",
+                        help="Directory for the generated inputs, which are "
+                             "reused by later runs with the same scale. "
+                             "Default: %(default)s.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Run each stage this many times and report the "
+                             "fastest. Default: %(default)s.")
+    parser.add_argument("--save", type=Path,
+                        help="Write the results to this JSON file, for use "
+                             "as a baseline.")
+    parser.add_argument("--compare", type=Path,
+                        help="Compare the results with a baseline written "
+                             "with --save. Exits with status 1 when a stage "
+                             "regressed.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="The ratio to the baseline above which a stage "
+                             "has regressed. Default: %(default)s.")
+    return parser
+
+
+def main():
+    parser = argument_parser()
+    args = parser.parse_args()
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    baseline = None
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if baseline["scale"] != args.scale:
+            sys.exit(f"The baseline was made with --scale "
+                     f"{baseline['scale']}, not {args.scale}.")
+    generate_data(args.data_dir, args.scale)
+    results = run_stages(args.stages or list(STAGES), args.data_dir,
+                         args.repeat)
+    if args.save:
+        args.save.write_text(json.dumps({
+            "scale": args.scale,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "stages": results}, indent=2) + "\n")
+    if baseline is not None:
+        regressions = compare(results, baseline["stages"], args.threshold)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -53,7 +53,11 @@ setup(name="chunked-scatter",
       package_dir={'': 'src'},
       entry_points={
           "console_scripts":
-              ["chunked-scatter=chunked_scatter.chunked_scatter:main",
+              ["build-cost-profile=chunked_scatter.cost_profile:main",
+               "chunked-scatter=chunked_scatter.chunked_scatter:main",
+               "extract-scatter=chunked_scatter.manifest:main",
                "safe-scatter=chunked_scatter.safe_scatter:main",
-               "scatter-regions=chunked_scatter.scatter_regions:main"]
+               "scatter-client=chunked_scatter.client:main",
+               "scatter-regions=chunked_scatter.scatter_regions:main",
+               "scatter-server=chunked_scatter.server:main"]
       })
@@ -17,3 +17,20 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+
+import sys
+from typing import TYPE_CHECKING
+
+__all__ = ["Scatterer"]
+
+if TYPE_CHECKING or sys.version_info < (3, 7):  # pragma: no cover
+    from .scatterer import Scatterer
+else:
+    def __getattr__(name: str):
+        # Scatterer imports all modules of the package, which is not needed
+        # by the programs and slows down the start of scatter-client.
+        if name == "Scatterer":
+            from .scatterer import Scatterer
+            return Scatterer
+        raise AttributeError(f"module {__name__!r} has no attribute "
+                             f"{name!r}")
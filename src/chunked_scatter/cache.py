@@ -0,0 +1,213 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+A cache of the output files of the scatter programs. The key of an entry is a
+hash of the program name, the contents of the input files and the other
+arguments. On a hit the cached files are hardlinked (or copied) to the output
+prefix instead of reading and scattering the input again.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from .indexes import find_alignment_index, find_index
+from .manifest import manifest_index
+from .parsers import STDIN
+from .reference import file_checksum, reference_checksum
+
+# Increase this when a change in the program changes its output, so old
+# entries are no longer used.
+CACHE_VERSION = 1
+DEFAULT_CACHE_SIZE = 10**9
+# The file in each entry with the output paths, relative to the prefix.
+PATHS_FILE = "paths.json"
+# These arguments do not change the scatters.
+IGNORED_ARGUMENTS = {"prefix", "print_paths", "threads", "cache_dir",
+                     "cache_size", "sort_buffer_size", "report", "profile"}
+# These arguments are files, of which the contents are part of the key.
+FILE_ARGUMENTS = {"input", "exclude", "cut_sites", "reference", "weights",
+                  "sort_order"}
+
+
+def cache_key(program: str, args: argparse.Namespace) -> Optional[str]:
+    """
+    Calculate the key of the cache entry for a run of a program.
+    :param program: The name of the program.
+    :param args: The parsed arguments of the program.
+    :return: The key, or None if the run can not be cached because the
+    input is read from STDIN.
+    """
+    key = {"program": program, "version": CACHE_VERSION}
+    for name, value in sorted(vars(args).items()):
+        if name in IGNORED_ARGUMENTS:
+            continue
+        if name in FILE_ARGUMENTS and value is not None:
+            if value == STDIN:
+                return None
+            key[name] = _file_key(value, name == "reference",
+                                  args.use_index)
+        else:
+            key[name] = value
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def _file_key(path: str, is_reference: bool, use_index: bool) -> list:
+    """
+    The part of the cache key for an input file. Files of which only the
+    header and index are read are identified by their size, modification
+    time and the checksum of the index, so a hit does not read them.
+    """
+    if is_reference:
+        # The checksum is stored with the N-runs of the reference, so the
+        # reference is not read again while it is unchanged. The .fai index
+        # is small and determines how the reference is read.
+        fai = f"{path}.fai"
+        return [reference_checksum(path),
+                file_checksum(fai) if os.path.exists(fai) else None]
+    if path.endswith((".bam", ".cram")):
+        index_file = find_alignment_index(path)
+    else:
+        index_file = find_index(path) if use_index else None
+    if index_file is not None:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns, file_checksum(index_file)]
+    if path.endswith((".bam", ".cram")):
+        # Only the index and the header of alignment files are read.
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns, None]
+    return [file_checksum(path), None]
+
+
+def _link_or_copy(source: str, destination: str):
+    """
+    Hardlink a file, or copy it when hardlinks are not possible. The file
+    appears at the destination atomically.
+    """
+    temp_file = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        try:
+            os.link(source, temp_file)
+        except OSError:
+            shutil.copyfile(source, temp_file)
+        os.replace(temp_file, destination)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def _entry_size(entry: Path) -> int:
+    return sum(path.stat().st_size for path in entry.iterdir())
+
+
+def evict(cache_dir: str, max_size: int):
+    """
+    Remove the least recently used entries until the total size of the cache
+    is at most max_size bytes.
+    """
+    entries = []
+    for entry in Path(cache_dir).iterdir():
+        # Entries that are being written have a temporary name.
+        if entry.is_dir() and not entry.name.startswith("."):
+            entries.append((entry.stat().st_mtime, _entry_size(entry), entry))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries, key=lambda entry: entry[0]):
+        if total_size <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= size
+
+
+def restore(entry: Path, prefix: str) -> List[str]:
+    """
+    Put the files of a cache entry at the output prefix and mark the entry
+    as recently used.
+    :return: The output paths of the entry.
+    """
+    paths = json.loads((entry / PATHS_FILE).read_text())
+    parent_dir = Path(prefix).parent
+    if not parent_dir.exists():
+        parent_dir.mkdir(parents=True)
+    for path in entry.iterdir():
+        if path.name != PATHS_FILE:
+            _link_or_copy(str(path), prefix + path.name)
+    os.utime(entry)
+    return [prefix + path for path in paths]
+
+
+def store(cache_dir: str, key: str, prefix: str, out_files: List[str],
+          extra_files: List[str]):
+    """
+    Store output files in the cache. The entry is assembled under a temporary
+    name and renamed when complete, so other processes never use a partial
+    entry.
+    :param out_files: The output paths, which are returned on a hit.
+    :param extra_files: Other files written by the run, such as indexes.
+    """
+    temp_entry = tempfile.mkdtemp(prefix=f".{key}.", dir=cache_dir)
+    try:
+        names = [path[len(prefix):] for path in out_files]
+        for path in out_files + extra_files:
+            _link_or_copy(path, os.path.join(temp_entry, path[len(prefix):]))
+        Path(temp_entry, PATHS_FILE).write_text(json.dumps(names))
+        os.rename(temp_entry, os.path.join(cache_dir, key))
+    except OSError:
+        # Another process stored the same entry first, or the cache can not
+        # be written. Either way the output itself is complete.
+        shutil.rmtree(temp_entry, ignore_errors=True)
+
+
+def cached_run(program: str, args: argparse.Namespace,
+               run: Callable[[argparse.Namespace], List[str]]) -> List[str]:
+    """
+    Run a scatter program, using the cache in args.cache_dir if it is set.
+    When a report is requested the program always runs, but its output is
+    still stored.
+    :param program: The name of the program.
+    :param args: The parsed arguments of the program.
+    :param run: Writes the output files and returns their paths.
+    :return: The output paths.
+    """
+    if args.cache_dir is None:
+        return run(args)
+    key = cache_key(program, args)
+    if key is None:
+        return run(args)
+    entry = Path(args.cache_dir, key)
+    if entry.is_dir() and not args.report:
+        try:
+            return restore(entry, args.prefix)
+        except FileNotFoundError:
+            # The entry was evicted while it was restored.
+            pass
+    out_files = run(args)
+    extra_files = [manifest_index(out_files[0])] if args.manifest else []
+    os.makedirs(args.cache_dir, exist_ok=True)
+    store(args.cache_dir, key, args.prefix, out_files, extra_files)
+    evict(args.cache_dir, args.cache_size)
+    return out_files
@@ -19,13 +19,92 @@
 # SOFTWARE.
 
 import argparse
+import collections
+import os
+import threading
 from pathlib import Path
-from typing import Generator, Iterable, List
+from typing import Callable, Deque, Generator, Iterable, List, Optional, \
+    Sequence, TYPE_CHECKING, Tuple
 
+from .cache import DEFAULT_CACHE_SIZE, cached_run
+from .intervals import IntervalIndex, subtract_regions
+from .manifest import write_manifest
 from .parsers import BedRegion, SUPPORTED_EXTENSIONS_STRING, file_to_regions
+from .profiling import STDERR, profile, profiled
+from .reference import MIN_GAP_SIZE, reference_n_runs
+from .regions import RegionArray, merge_regions
+from .report import ScatterReport, StageTimer, stage, timed
+from .sorting import DEFAULT_SORT_BUFFER_SIZE, sort_regions
 
+if TYPE_CHECKING:  # pragma: no cover
+    from concurrent.futures import Future
 
-def region_chunker(regions: Iterable[BedRegion], chunk_size: int, overlap: int
+
+def chunk_boundaries(start: int, end: int, chunk_size: int, overlap: int
+                     ) -> Tuple[Sequence[int], Sequence[int]]:
+    """
+    Calculate the starts and ends of all chunks of a region at once.
+    The first chunk is exactly chunk_size in length, subsequent chunks start
+    overlap bases before the end of the previous chunk (but never before the
+    start of the region) and the last chunk is between 0.5 and 1.5 times the
+    chunk_size in length.
+    :param start: The start of the region.
+    :param end: The end of the region.
+    :param chunk_size: The size of the chunks. Must be a positive integer.
+    :param overlap: The size of the overlap between chunks.
+    :return: A tuple with a sequence of starts and a sequence of ends.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    # The number of chunk positions p = start + k * chunk_size for which
+    # p + 1.5 * chunk_size < end. The last chunk starts at the next position.
+    # Multiplying by 2 keeps the calculation in integers.
+    remainder = 2 * (end - start) - 3 * chunk_size
+    number_of_chunks = 1 + max(0, -(-remainder // (2 * chunk_size)))
+    positions = range(start, start + number_of_chunks * chunk_size,
+                      chunk_size)
+    if overlap < chunk_size:
+        # Only the first chunk can be clamped at the start of the region.
+        starts: Sequence[int] = [
+            max(start, start - overlap),
+            *range(start + chunk_size - overlap, positions[-1] - overlap + 1,
+                   chunk_size)]
+    else:
+        starts = [max(start, position - overlap) for position in positions]
+    ends = [*range(start + chunk_size, positions[-1] + 1, chunk_size), end]
+    return starts, ends
+
+
+def snap_boundaries(contig: str, start: int, end: int, ends: Sequence[int],
+                    overlap: int, cut_sites: IntervalIndex, window: int
+                    ) -> Tuple[Sequence[int], Sequence[int]]:
+    """
+    Move the cuts between chunks to the nearest allowed cut site, at most
+    window bases away. Cuts without a cut site nearby stay where they are.
+    The order of the cuts is kept, so no chunk becomes empty.
+    :param contig: The contig of the region.
+    :param start: The start of the region.
+    :param end: The end of the region.
+    :param ends: The ends of the chunks, as given by chunk_boundaries.
+    :param overlap: The size of the overlap between chunks.
+    :param cut_sites: The allowed cut sites.
+    :param window: The maximum distance a cut is moved.
+    :return: A tuple with a sequence of starts and a sequence of ends.
+    """
+    cuts: List[int] = []
+    previous = start
+    for cut in ends[:-1]:
+        previous = cut_sites.snap(contig, cut,
+                                  max(previous + 1, cut - window),
+                                  min(end - 1, cut + window))
+        cuts.append(previous)
+    starts = [start] + [max(start, cut - overlap) for cut in cuts]
+    return starts, cuts + [end]
+
+
+@profiled("region_chunker")
+def region_chunker(regions: Iterable[BedRegion], chunk_size: int, overlap: int,
+                   cut_sites: Optional[IntervalIndex] = None
                    ) -> Generator[BedRegion, None, None]:
     """
     Converts each region into chunks if the chunk_size is smaller than the
@@ -33,10 +112,33 @@ def region_chunker(regions: Iterable[BedRegion], chunk_size: int, overlap: int
     :param regions: The regions which to chunk.
     :param chunk_size: The size of the chunks.
     :param overlap: The size of the overlap between chunks.
+    :param cut_sites: Allowed cut sites. When given, the cuts between chunks
+    are moved to the nearest cut site within half a chunk_size.
     :return: The new chunked regions.
     """
+    if int(chunk_size) != chunk_size or int(overlap) != overlap:
+        if cut_sites is not None:
+            raise ValueError("Cut sites require integer chunk and overlap "
+                             "sizes.")
+        # Fractional sizes accumulate floating point errors, which only the
+        # incremental calculation reproduces.
+        yield from _fractional_region_chunker(regions, chunk_size, overlap)
+        return
+    chunk_size, overlap = int(chunk_size), int(overlap)
+    for contig, start, end in regions:
+        starts, ends = chunk_boundaries(start, end, chunk_size, overlap)
+        if cut_sites is not None and len(ends) > 1:
+            starts, ends = snap_boundaries(contig, start, end, ends, overlap,
+                                           cut_sites, chunk_size // 2)
+        for chunk_start, chunk_end in zip(starts, ends):
+            yield BedRegion(contig, chunk_start, chunk_end)
+
+
+def _fractional_region_chunker(regions: Iterable[BedRegion],
+                               chunk_size: float, overlap: float
+                               ) -> Generator[BedRegion, None, None]:
     for contig, start, end in regions:
-        position = start
+        position: float = start
         # This will cause the last chunk to be between 0.5 and 1.5
         # times the chunk_size in length, this way we avoid the
         # possibility that the last chunk ends up being to small
@@ -54,12 +156,35 @@ def region_chunker(regions: Iterable[BedRegion], chunk_size: int, overlap: int
             yield BedRegion(contig, int(position - overlap), end)
 
 
+def chunk_region_array(regions: RegionArray, chunk_size: int, overlap: int
+                       ) -> RegionArray:
+    """
+    Chunk all regions of a RegionArray, filling the columns of the result
+    directly instead of creating a BedRegion for each chunk.
+    :param regions: The regions which to chunk.
+    :param chunk_size: The size of the chunks. Must be a positive integer.
+    :param overlap: The size of the overlap between chunks.
+    :return: A RegionArray with the chunks.
+    """
+    chunks = regions.empty_copy()
+    for contig_id, start, end in zip(regions.contig_ids, regions.starts,
+                                     regions.ends):
+        starts, ends = chunk_boundaries(start, end, chunk_size, overlap)
+        chunks.contig_ids.extend([contig_id] * len(starts))
+        chunks.starts.extend(starts)
+        chunks.ends.extend(ends)
+    return chunks
+
+
+@profiled("chunked_scatter")
 def chunked_scatter(regions: Iterable[BedRegion],
                     chunk_size: int,
                     overlap: int,
                     list_size: int,
                     size_is_maximum: bool = False,
                     contigs_can_be_split: bool = False,
+                    weight: Callable[[BedRegion], float] = len,
+                    cut_sites: Optional[IntervalIndex] = None,
                     ) -> Generator[List[BedRegion], None, None]:
     """
     Scatter regions in chunks with an overlap. It returns Lists of regions
@@ -73,18 +198,21 @@ def chunked_scatter(regions: Iterable[BedRegion],
     :param size_is_maximum: Use list_size as a maximum instead of a minimum
     :param contigs_can_be_split: Whether contigs (chr1, for example) are
     allowed to be split across multiple lists.
+    :param weight: A function returning the cost of a chunk. When given,
+    list_size is expressed in this cost instead of in base pairs.
+    :param cut_sites: Allowed cut sites, chunks are cut at the nearest one.
     :return: Lists of BedRegions, which can be converted into BED files.
     """
-    current_scatter_size = 0
+    current_scatter_size: float = 0
     current_contig = None
     chunk_list: List[BedRegion] = []
-    for chunk in region_chunker(regions, chunk_size, overlap):
+    for chunk in region_chunker(regions, chunk_size, overlap, cut_sites):
         # If the next chunk is on a different contig
         if contigs_can_be_split or chunk.contig != current_contig:
             current_contig = chunk.contig
             # Yield if the minimum is reached, or if current chunk will
             # overflow the size and there is at least one chunk already.
-            size_to_check = (current_scatter_size + len(chunk)
+            size_to_check = (current_scatter_size + weight(chunk)
                              if size_is_maximum else current_scatter_size)
             if size_to_check >= list_size and len(chunk_list) > 0:
                 yield chunk_list
@@ -92,36 +220,160 @@ def chunked_scatter(regions: Iterable[BedRegion],
                 current_scatter_size = 0
         # Add the chunk to the bed file
         chunk_list.append(chunk)
-        current_scatter_size += len(chunk)
+        current_scatter_size += weight(chunk)
     # If there are leftovers yield them.
     if chunk_list:
         yield chunk_list
 
 
+def write_bed_file(out_file: str, regions: Iterable[BedRegion]):
+    """
+    Write regions to a BED file atomically. The regions are formatted into a
+    single buffer, written to a temporary file in the same directory and then
+    renamed, so the file never appears partially written.
+    :param out_file: The path of the BED file.
+    :param regions: The regions to write.
+    """
+    contents = "".join(f"{contig}\t{start}\t{end}\n"
+                       for contig, start, end in regions)
+    # The threads of scatter-server share a process id, so concurrent
+    # requests for the same prefix are told apart by the thread id.
+    temp_file = f"{out_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_file, "wt") as temp_file_h:
+            temp_file_h.write(contents)
+        os.replace(temp_file, out_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+@profiled("region_lists_to_scatter_files", writes_files=True)
 def region_lists_to_scatter_files(region_lists: Iterable[List[BedRegion]],
-                                  prefix: str) -> List[str]:
+                                  prefix: str,
+                                  threads: int = 1) -> List[str]:
     """
     Convert lists of BedRegions to '{prefix}{number}.bed' files. The number
     starts at 0 and is increased with 1 for each file.
     :param region_lists: The region lists to be converted into BED files.
     :param prefix: The filename prefix for the BedFiles
+    :param threads: The number of files that are written concurrently.
     :return: A list of filenames of the written paths.
     """
     parent_dir = Path(prefix).parent
     if not parent_dir.exists():
         parent_dir.mkdir(parents=True)
     output_files: List[str] = []
-    for scatter_number, region_list in enumerate(region_lists):
-        out_file = f"{prefix}{scatter_number}.bed"
-        with open(out_file, "wt") as out_file_h:
-            for bed_region in region_list:
-                out_file_h.write(str(bed_region) + '\n')
-        # I much prefer yield out_file instead. But this means the function
-        # won't do anything until it is iterated over, which is not nice.
-        output_files.append(out_file)
+    if threads <= 1:
+        for scatter_number, region_list in enumerate(region_lists):
+            out_file = f"{prefix}{scatter_number}.bed"
+            write_bed_file(out_file, region_list)
+            # I much prefer yield out_file instead. But this means the
+            # function won't do anything until it is iterated over, which is
+            # not nice.
+            output_files.append(out_file)
+        return output_files
+    # Only a limited number of region lists is pending at any time, so a
+    # generator of region lists is not consumed entirely up front.
+    # concurrent.futures imports logging, which slows down the start of the
+    # programs when no threads are used.
+    from concurrent.futures import ThreadPoolExecutor
+    pending: Deque["Future"] = collections.deque()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for scatter_number, region_list in enumerate(region_lists):
+            out_file = f"{prefix}{scatter_number}.bed"
+            pending.append(executor.submit(write_bed_file, out_file,
+                                           region_list))
+            output_files.append(out_file)
+            if len(pending) >= 2 * threads:
+                pending.popleft().result()
+        for future in pending:
+            future.result()
     return output_files
 
 
+def write_scatters(region_lists: Iterable[List[BedRegion]],
+                   args: argparse.Namespace,
+                   report: Optional[ScatterReport] = None) -> List[str]:
+    """
+    Write the region lists in the way requested by the common arguments:
+    either one BED file per scatter or a single manifest.
+    :param region_lists: The region lists to be written.
+    :param args: The parsed arguments of the program.
+    :param report: When given, the scatters are recorded in the report and
+    the report is written to args.report.
+    :return: A list of filenames of the written paths.
+    """
+    if report is None:
+        return _write_scatters(region_lists, args)
+    with report.timer.stage("write"):
+        out_files = _write_scatters(report.record(region_lists), args)
+    report.write(args.report, out_files)
+    return out_files
+
+
+def _write_scatters(region_lists: Iterable[List[BedRegion]],
+                    args: argparse.Namespace) -> List[str]:
+    if args.manifest:
+        return [write_manifest(region_lists, args.prefix)]
+    return region_lists_to_scatter_files(region_lists, args.prefix,
+                                         args.threads)
+
+
+def interval_options(args: argparse.Namespace,
+                     timer: Optional[StageTimer] = None
+                     ) -> Tuple[Optional[IntervalIndex],
+                                Optional[IntervalIndex]]:
+    """
+    Read the regions to exclude and the cut sites given on the command line.
+    The N-runs of the reference that are at least the minimum gap size are
+    excluded, all N-runs are cut sites.
+    :param args: The parsed arguments of the program.
+    :param timer: Times reading the files as the 'intervals' stage.
+    :return: A tuple with the excluded regions and the cut sites. Each is None
+    if there are none.
+    """
+    with stage(timer, "intervals"):
+        return _interval_options(args)
+
+
+def _interval_options(args: argparse.Namespace
+                      ) -> Tuple[Optional[IntervalIndex],
+                                 Optional[IntervalIndex]]:
+    exclude = list(file_to_regions(args.exclude)) if args.exclude else []
+    cut_sites = list(file_to_regions(args.cut_sites)) if args.cut_sites else []
+    if args.reference:
+        n_runs = reference_n_runs(args.reference)
+        exclude.extend(run for run in n_runs if len(run) >= args.min_gap_size)
+        cut_sites.extend(n_runs)
+    return (IntervalIndex(exclude) if exclude else None,
+            IntervalIndex(cut_sites) if cut_sites else None)
+
+
+def input_regions(args: argparse.Namespace,
+                  exclude: Optional[IntervalIndex] = None,
+                  timer: Optional[StageTimer] = None
+                  ) -> Iterable[BedRegion]:
+    """
+    Read the regions from the input file given on the command line, sorted
+    and merged if requested and without the excluded regions.
+    :param timer: Times the 'parse', 'sort', 'merge' and 'exclude' stages.
+    """
+    regions: Iterable[BedRegion] = timed(timer, "parse", file_to_regions(
+        args.input, args.use_index, args.threads))
+    if args.sort:
+        contig_order = (dict.fromkeys(region.contig for region in
+                                      file_to_regions(args.sort_order))
+                        if args.sort_order else None)
+        regions = timed(timer, "merge", merge_regions(timed(
+            timer, "sort", sort_regions(regions, contig_order,
+                                        args.sort_buffer_size))))
+    if exclude is None:
+        return regions
+    return timed(timer, "exclude", subtract_regions(regions, exclude))
+
+
 def common_parser() -> argparse.ArgumentParser:
     """Commmon arguments for chunked-scatter and scatter-regions."""
     parser = argparse.ArgumentParser()
@@ -132,15 +384,108 @@ def common_parser() -> argparse.ArgumentParser:
     parser.add_argument("input", metavar="INPUT", type=str,
                         help=f"The input file. The format is detected by the "
                              f"extension. Supported extensions are: "
-                             f"{SUPPORTED_EXTENSIONS_STRING}.")
+                             f"{SUPPORTED_EXTENSIONS_STRING}. Files may be "
+                             f"compressed with gzip or bgzip. Use '-' to read "
+                             f"from STDIN, the format is then detected from "
+                             f"the data.")
     parser.add_argument("-P", "--print-paths", action="store_true",
                         help="If set prints paths of the output files to "
                              "STDOUT. This makes the program usable in "
                              "scripts and worfklows.")
+    parser.add_argument("--use-index", action="store_true",
+                        help="For VCF and BCF input, derive the regions from "
+                             "the tabix or CSI index instead of reading every "
+                             "record. The regions then cover the occupied "
+                             "bins of the index (16 kb or larger) instead of "
+                             "the individual variants. Files without an index "
+                             "are read as usual.")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="The number of processes used to read the "
+                             "contigs of indexed (bgzipped) BED, VCF and BCF "
+                             "files in parallel, and the number of output "
+                             "files that are written concurrently. The output "
+                             "is the same as with a single process. "
+                             "Default 1.")
+    parser.add_argument("--manifest", action="store_true",
+                        help="Write all scatters to a single "
+                             "<PREFIX>manifest.bed file, with the scatter "
+                             "number in the fourth column, instead of a file "
+                             "per scatter. An index is written next to it, "
+                             "which extract-scatter uses to get a single "
+                             "scatter.")
+    parser.add_argument("--exclude", type=str, metavar="BED",
+                        help="A file with regions that are removed from the "
+                             "input, such as assembly gaps or regions that "
+                             "are hard to call. Any of the supported input "
+                             "formats can be used.")
+    parser.add_argument("--cut-sites", type=str, metavar="BED",
+                        help="A file with regions in which regions may be "
+                             "cut, such as assembly gaps. Cuts are moved to "
+                             "the nearest cut site within half a chunk, cuts "
+                             "without a cut site nearby are kept in place.")
+    parser.add_argument("--reference", type=str, metavar="FASTA",
+                        help="An indexed FASTA file of the reference. Runs "
+                             "of N in the reference are used as cut sites and "
+                             "runs of at least MIN_GAP_SIZE are excluded. The "
+                             "runs are stored in a <FASTA>.nruns.bed file, "
+                             "which is reused while the FASTA file does not "
+                             "change.")
+    parser.add_argument("--min-gap-size", type=int, default=MIN_GAP_SIZE,
+                        help=f"The minimum length of a run of N in the "
+                             f"reference to be excluded. Default "
+                             f"{MIN_GAP_SIZE}.")
+    parser.add_argument("--sort", action="store_true",
+                        help="Sort the input regions on contig and start and "
+                             "merge overlapping and adjacent regions before "
+                             "scattering. Inputs that do not fit in memory "
+                             "are sorted in parts in the temporary "
+                             "directory.")
+    parser.add_argument("--sort-order", type=str, metavar="FILE",
+                        help="A sequence dictionary, fasta index or other "
+                             "input file that gives the order of the contigs "
+                             "for --sort. Contigs that are not in it are put "
+                             "last. By default contigs are sorted in natural "
+                             "order, for example chr2 before chr10.")
+    parser.add_argument("--sort-buffer-size", type=int,
+                        default=DEFAULT_SORT_BUFFER_SIZE, metavar="REGIONS",
+                        help=f"The number of regions that --sort sorts in "
+                             f"memory at once. Default "
+                             f"{DEFAULT_SORT_BUFFER_SIZE}.")
+    parser.add_argument("--cache-dir", type=str, metavar="DIR",
+                        help="Cache the output in this directory. When the "
+                             "program is run again with the same input files "
+                             "and options, the output files are hardlinked "
+                             "(or copied) from the cache instead. Input from "
+                             "STDIN is not cached.")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        metavar="BYTES",
+                        help=f"The maximum size of the cache. The least "
+                             f"recently used output is removed when the "
+                             f"cache grows larger. Default "
+                             f"{DEFAULT_CACHE_SIZE}.")
+    parser.add_argument("--report", type=str, metavar="JSON",
+                        help="Write a report to this file with the number of "
+                             "bases, intervals and contigs in each scatter, "
+                             "how balanced the scatters are and the time "
+                             "spent in each stage. The cache is not read "
+                             "when a report is requested, so the times are "
+                             "those of an actual run.")
+    parser.add_argument("--profile", action="store_const", const=STDERR,
+                        help="Print the time, regions in and out and bytes "
+                             "read and written of each stage to STDERR. "
+                             "Memory allocations are counted as well when "
+                             "tracemalloc is enabled with "
+                             "PYTHONTRACEMALLOC=1.")
+    parser.add_argument("--profile-output", type=str, dest="profile",
+                        metavar="FILE",
+                        help="Write the profile of --profile to FILE "
+                             "instead. A FILE ending in .json gets a Chrome "
+                             "trace and one ending in .prof the cProfile "
+                             "statistics of the run.")
     return parser
 
 
-def parse_args():
+def argument_parser() -> argparse.ArgumentParser:
     """Argument parser for the chunked-scatter program."""
     parser = common_parser()
     parser.description = (
@@ -172,18 +517,30 @@ def parse_args():
     parser.add_argument("-S", "--split-contigs", action="store_true",
                         help="If set, contigs are allowed to be split up over "
                              "multiple files.")
-    args = parser.parse_args()
+    return parser
+
+
+def parse_args():
+    args = argument_parser().parse_args()
     return args
 
 
+def run(args: argparse.Namespace) -> List[str]:
+    """Scatter the input and write the output files."""
+    report = ScatterReport("chunked-scatter") if args.report else None
+    timer = report.timer if report is not None else None
+    exclude, cut_sites = interval_options(args, timer)
+    scattered_chunks = timed(timer, "chunk", chunked_scatter(
+        input_regions(args, exclude, timer), args.chunk_size, args.overlap,
+        args.minimum_bp_per_file, size_is_maximum=False,
+        contigs_can_be_split=args.split_contigs, cut_sites=cut_sites))
+    return write_scatters(scattered_chunks, args, report)
+
+
 def main():
     args = parse_args()
-    scattered_chunks = chunked_scatter(file_to_regions(args.input),
-                                       args.chunk_size, args.overlap,
-                                       args.minimum_bp_per_file,
-                                       size_is_maximum=False,
-                                       contigs_can_be_split=args.split_contigs)
-    out_files = region_lists_to_scatter_files(scattered_chunks, args.prefix)
+    with profile(args.profile):
+        out_files = cached_run("chunked-scatter", args, run)
     if args.print_paths:
         print("\n".join(out_files))
 
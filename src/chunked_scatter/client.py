@@ -0,0 +1,101 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+A thin client for scatter-server. It only uses the standard library, so it
+starts quickly.
+"""
+
+import json
+import os
+import socket
+import sys
+from typing import List
+
+PROGRAMS = ["chunked-scatter", "safe-scatter", "scatter-regions"]
+DEFAULT_SOCKET = os.path.join(os.environ.get("TMPDIR", "/tmp"),
+                              f"chunked-scatter-{os.getuid()}.sock")
+SOCKET_ENVIRONMENT_VARIABLE = "CHUNKED_SCATTER_SOCKET"
+
+
+class ServerError(Exception):
+    """An error returned by the scatter-server."""
+    def __init__(self, message: str, status: int = 1):
+        super().__init__(message)
+        self.status = status
+
+
+def default_socket() -> str:
+    return os.environ.get(SOCKET_ENVIRONMENT_VARIABLE, DEFAULT_SOCKET)
+
+
+def request(program: str, arguments: List[str], cwd: str,
+            socket_path: str = DEFAULT_SOCKET) -> dict:
+    """
+    Send a scatter request to a scatter-server.
+    :param program: The program, one of PROGRAMS.
+    :param arguments: The command line arguments for the program.
+    :param cwd: The directory to which paths in the arguments are relative.
+    :param socket_path: The Unix socket of the server.
+    :return: The response, with the output paths in 'paths'.
+    """
+    message = json.dumps({"program": program, "args": arguments,
+                          "cwd": cwd}).encode() + b"\n"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(message)
+        with connection.makefile("rb") as connection_h:
+            response = json.loads(connection_h.readline())
+    if "error" in response:
+        raise ServerError(response["error"], response.get("status", 1))
+    return response
+
+
+def main():
+    usage = (f"usage: scatter-client [--socket SOCKET] PROGRAM [ARGS ...]\n\n"
+             f"Run {', '.join(PROGRAMS)} on a scatter-server. The arguments "
+             f"are the same as those of the program. The socket defaults to "
+             f"${SOCKET_ENVIRONMENT_VARIABLE} or {DEFAULT_SOCKET}.")
+    # argparse is not used, so all arguments after the program are passed on
+    # unchanged.
+    arguments = sys.argv[1:]
+    socket_path = default_socket()
+    if arguments[:1] == ["--socket"] and len(arguments) > 1:
+        socket_path = arguments[1]
+        arguments = arguments[2:]
+    if not arguments or arguments[0] not in PROGRAMS:
+        print(usage, file=sys.stderr)
+        sys.exit(2)
+    try:
+        response = request(arguments[0], arguments[1:], os.getcwd(),
+                           socket_path)
+    except ServerError as error:
+        print(f"scatter-client: error: {error}", file=sys.stderr)
+        sys.exit(error.status)
+    except OSError as error:
+        print(f"scatter-client: error: can not connect to {socket_path}: "
+              f"{error}", file=sys.stderr)
+        sys.exit(1)
+    if response["print_paths"]:
+        print("\n".join(response["paths"]))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
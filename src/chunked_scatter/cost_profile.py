@@ -0,0 +1,241 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+A cost profile is a bedGraph file with the historical cost (for example the
+number of seconds) of processing each interval. It is built from the runtime
+logs of earlier scattered runs and can be given to safe-scatter with
+--weights to balance the scatters on runtime.
+"""
+
+import argparse
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Generator, Iterable, List, Optional, Tuple, Union
+
+from .parsers import bed_file_to_regions
+from .weights import read_cost_profile
+
+# Runtime logs in a directory are found with this pattern.
+RUNTIME_LOG_PATTERN = "*.tsv"
+DEFAULT_LEARNING_RATE = 0.5
+
+# A contig, start, end and cost density (cost per base).
+Density = Tuple[str, int, int, float]
+
+
+def find_runtime_logs(paths: Iterable[Union[str, os.PathLike]]
+                      ) -> List[Path]:
+    """
+    Find the runtime logs. Directories are searched recursively for files
+    matching RUNTIME_LOG_PATTERN, other paths are used as they are.
+    :param paths: Runtime logs and directories containing them.
+    :return: A list of runtime logs.
+    """
+    logs: List[Path] = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            logs.extend(sorted(path.rglob(RUNTIME_LOG_PATTERN)))
+        else:
+            logs.append(path)
+    return logs
+
+
+def read_runtime_log(log: Union[str, os.PathLike]
+                     ) -> Generator[Tuple[Path, float], None, None]:
+    """
+    Read a runtime log. Each line holds the BED file of a shard and the time
+    it took to process it, separated by a tab. Relative paths are relative to
+    the directory of the log. Empty lines and lines starting with '#' are
+    skipped.
+    :param log: The runtime log.
+    :return: A generator of tuples of BED file and runtime.
+    """
+    log_dir = Path(log).parent
+    with open(log, "rt") as log_h:
+        for line_number, line in enumerate(log_h, start=1):
+            if not line.strip() or line.startswith("#"):
+                continue
+            try:
+                bed_file, runtime = line.rstrip("\n").rsplit("\t", 1)
+                seconds = float(runtime)
+            except ValueError:
+                raise ValueError(f"Invalid runtime log line {line_number} "
+                                 f"in '{log}': {line!r}.")
+            yield log_dir / bed_file, seconds
+
+
+def observed_densities(logs: Iterable[Union[str, os.PathLike]]
+                       ) -> Generator[Density, None, None]:
+    """
+    Spread the runtime of each shard evenly over the bases of its regions.
+    :param logs: The runtime logs.
+    :return: A generator of the regions of all shards with the cost per base
+    of their shard.
+    """
+    for log in logs:
+        for bed_file, seconds in read_runtime_log(log):
+            regions = list(bed_file_to_regions(bed_file))
+            length = sum(len(region) for region in regions)
+            if length == 0:
+                continue
+            density = seconds / length
+            for contig, start, end in regions:
+                yield contig, start, end, density
+
+
+def build_cost_profile(observations: Iterable[Density],
+                       previous: Iterable[Tuple[str, int, int, float]] = (),
+                       learning_rate: float = DEFAULT_LEARNING_RATE
+                       ) -> List[Tuple[str, int, int, float]]:
+    """
+    Combine observed cost densities into a cost profile. Where observations
+    overlap their densities are averaged. Where a previous profile exists the
+    new density is ``(1 - learning_rate) * previous + learning_rate *
+    observed``, so the profile follows changes in runtime without being
+    dominated by a single run. Parts without new observations keep their
+    previous cost.
+    :param observations: Regions with their observed cost per base.
+    :param previous: The intervals and costs of a previous profile.
+    :param learning_rate: The weight of the new observations.
+    :return: A list of tuples of contig, start, end and cost, with adjacent
+    intervals of equal density merged.
+    """
+    if not 0 < learning_rate <= 1:
+        raise ValueError(f"The learning rate should be larger than 0 and at "
+                         f"most 1, not {learning_rate}.")
+    # Per contig and position the change in the summed previous density, the
+    # number of previous intervals, the summed observed density and the
+    # number of observations.
+    events: Dict[str, Dict[int, List[float]]] = defaultdict(
+        lambda: defaultdict(lambda: [0.0, 0, 0.0, 0]))
+    for contig, start, end, cost in previous:
+        if end > start:
+            density = cost / (end - start)
+            events[contig][start][0] += density
+            events[contig][start][1] += 1
+            events[contig][end][0] -= density
+            events[contig][end][1] -= 1
+    for contig, start, end, density in observations:
+        if end > start:
+            events[contig][start][2] += density
+            events[contig][start][3] += 1
+            events[contig][end][2] -= density
+            events[contig][end][3] -= 1
+
+    profile: List[Tuple[str, int, int, float]] = []
+    for contig, changes in events.items():
+        old_density, old_count, new_density, new_count = 0.0, 0, 0.0, 0
+        current: Optional[List] = None
+        previous_position = 0
+        for position in sorted(changes):
+            if old_count or new_count:
+                if not new_count:
+                    density = old_density
+                elif not old_count:
+                    density = new_density / new_count
+                else:
+                    density = ((1 - learning_rate) * old_density +
+                               learning_rate * new_density / new_count)
+                if (current is not None and current[1] == previous_position
+                        and current[2] == density):
+                    current[1] = position
+                else:
+                    if current is not None:
+                        profile.append(_profile_interval(contig, *current))
+                    current = [previous_position, position, density]
+            delta = changes[position]
+            old_density += delta[0]
+            old_count += int(delta[1])
+            new_density += delta[2]
+            new_count += int(delta[3])
+            previous_position = position
+        if current is not None:
+            profile.append(_profile_interval(contig, *current))
+    return profile
+
+
+def _profile_interval(contig: str, start: int, end: int, density: float
+                      ) -> Tuple[str, int, int, float]:
+    return contig, start, end, density * (end - start)
+
+
+def write_cost_profile(profile: Iterable[Tuple[str, int, int, float]],
+                       out_file: Union[str, os.PathLike]):
+    """
+    Write a cost profile as a bedGraph file. The file is written to a
+    temporary file which is renamed when complete, so the profile can be
+    updated in place.
+    """
+    temp_file = (f"{os.fspath(out_file)}.{os.getpid()}."
+                 f"{threading.get_ident()}.tmp")
+    try:
+        with open(temp_file, "wt") as temp_file_h:
+            temp_file_h.write("".join(f"{contig}\t{start}\t{end}\t{cost:.6g}\n"
+                                      for contig, start, end, cost in profile))
+        os.replace(temp_file, out_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def argument_parser() -> argparse.ArgumentParser:
+    """Argument parser for the build-cost-profile program."""
+    parser = argparse.ArgumentParser(
+        description="Build or update a cost profile from the runtimes of "
+                    "scattered jobs. The profile is a bedGraph file that can "
+                    "be given to safe-scatter with --weights.")
+    parser.add_argument("logs", metavar="LOG", type=str, nargs="+",
+                        help="Runtime logs, or directories which are "
+                             "searched for logs ending in '.tsv'. Each line "
+                             "of a log has the BED file of a scatter and the "
+                             "number of seconds it took to process, "
+                             "separated by a tab. Relative paths are "
+                             "relative to the log.")
+    parser.add_argument("-o", "--output", type=str, required=True,
+                        help="The cost profile to write.")
+    parser.add_argument("-p", "--profile", type=str,
+                        help="A previous cost profile to update. It may be "
+                             "the same file as --output.")
+    parser.add_argument("--learning-rate", type=float,
+                        default=DEFAULT_LEARNING_RATE,
+                        help="The weight of the new runtimes when updating a "
+                             "profile, between 0 and 1. Default: "
+                             "%(default)s.")
+    return parser
+
+
+def main():
+    parser = argument_parser()
+    args = parser.parse_args()
+    if not 0 < args.learning_rate <= 1:
+        parser.error("--learning-rate should be larger than 0 and at most 1")
+    previous = read_cost_profile(args.profile) if args.profile else ()
+    profile = build_cost_profile(
+        observed_densities(find_runtime_logs(args.logs)), previous,
+        args.learning_rate)
+    write_cost_profile(profile, args.output)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
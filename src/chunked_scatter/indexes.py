@@ -0,0 +1,342 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Readers for the indexes used by htslib: the binning indexes (tabix .tbi, BAM
+.bai and .csi) and the CRAM index (.crai).
+
+These read only the index, so information about the indexed file can be
+obtained without decoding any of its records. The formats are described in
+the htslib specifications: https://samtools.github.io/hts-specs/tabix.pdf,
+https://samtools.github.io/hts-specs/CSIv1.pdf and the SAM and CRAM
+specifications.
+"""
+
+import gzip
+import os
+import struct
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+# Index parameters for the .tbi and .bai formats. CSI indexes store their own.
+TABIX_MIN_SHIFT = 14
+TABIX_DEPTH = 5
+
+# Virtual offsets are split in a compressed and an uncompressed part. To
+# estimate the amount of data in a chunk, the uncompressed part is weighted
+# with a typical BGZF compression ratio.
+COMPRESSION_RATIO = 0.25
+# The number of uncompressed bytes in a full BGZF block, as written by htslib.
+BGZF_BLOCK_SIZE = 0xFF00
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Indexes of BAM and CRAM files, in order of preference.
+ALIGNMENT_INDEX_EXTENSIONS = (".csi", ".bai", ".crai")
+
+
+class IndexBin(NamedTuple):
+    """An occupied bin of an index."""
+    start: int
+    end: int
+    # Estimated number of compressed bytes of the records in this bin.
+    # For .crai indexes this is the size of the slice.
+    size: float
+
+
+class IndexedContig(NamedTuple):
+    """The index information for a single contig."""
+    name: str
+    bins: List[IndexBin]
+    # The number of (mapped) records as stored in the pseudo-bin, if present.
+    records: Optional[int]
+
+
+class _Reader:
+    """Sequentially unpack little-endian values from a bytes object."""
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt: str) -> Tuple:
+        values = struct.unpack_from("<" + fmt, self.data, self.offset)
+        self.offset += struct.calcsize("<" + fmt)
+        return values
+
+    def read(self, length: int) -> bytes:
+        value = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return value
+
+
+def bin_span(bin_number: int, min_shift: int, depth: int) -> Tuple[int, int]:
+    """
+    Calculate the 0-based half-open interval covered by a bin.
+    :param bin_number: The number of the bin.
+    :param min_shift: The number of bits of the smallest bins.
+    :param depth: The depth of the binning scheme.
+    :return: A tuple of start and end.
+    """
+    # The first bin on level l is ((1 << 3 * l) - 1) // 7, so the level is
+    # the number of whole factors of 8 in 7 * bin_number + 1.
+    level = ((7 * bin_number + 1).bit_length() - 1) // 3
+    first_bin = ((1 << 3 * level) - 1) // 7
+    size = 1 << (min_shift + 3 * (depth - level))
+    start = (bin_number - first_bin) * size
+    return start, start + size
+
+
+def chunk_size(begin: int, end: int) -> float:
+    """
+    Estimate the number of compressed bytes between two virtual offsets.
+    """
+    compressed = (end >> 16) - (begin >> 16)
+    if compressed == 0:
+        return max(((end & 0xFFFF) - (begin & 0xFFFF)) * COMPRESSION_RATIO,
+                   0.0)
+    # Part of the first block precedes the chunk. The compressed size of the
+    # first block is not known, so it is estimated from a full block, but it
+    # can not be larger than the whole chunk.
+    first_block = min(compressed, BGZF_BLOCK_SIZE * COMPRESSION_RATIO)
+    preceding = first_block * min((begin & 0xFFFF) / BGZF_BLOCK_SIZE, 1.0)
+    return compressed - preceding + (end & 0xFFFF) * COMPRESSION_RATIO
+
+
+def _read_names(names: bytes) -> List[str]:
+    return [name.decode() for name in names.split(b"\0") if name]
+
+
+# The fields that precede the chunks of a bin: the bin number, the offset of
+# the first record in the bin (CSI only) and the number of chunks.
+_BIN_HEADER = struct.Struct("<Ii")
+_CSI_BIN_HEADER = struct.Struct("<IQi")
+
+
+def _read_bins(reader: _Reader, min_shift: int, depth: int, csi: bool,
+               sizes: bool = True) -> Tuple[List[IndexBin], Optional[int]]:
+    # Indexes of large files have hundreds of thousands of bins, so the
+    # fields are unpacked directly from the data with precompiled structs.
+    data = reader.data
+    offset = reader.offset
+    pseudo_bin = ((1 << 3 * (depth + 1)) - 1) // 7 + 1
+    bin_header = _CSI_BIN_HEADER if csi else _BIN_HEADER
+    # The first bin and the shift of the bin size of each level, as in
+    # bin_span, which is inlined here.
+    first_bins = [((1 << 3 * level) - 1) // 7 for level in range(depth + 1)]
+    shifts = [min_shift + 3 * (depth - level) for level in range(depth + 1)]
+    chunk_formats: Dict[int, struct.Struct] = {}
+    bins: List[IndexBin] = []
+    records = None
+    n_bin, = struct.unpack_from("<i", data, offset)
+    offset += 4
+    for _ in range(n_bin):
+        header = bin_header.unpack_from(data, offset)
+        bin_number, n_chunk = header[0], header[-1]
+        offset += bin_header.size
+        chunks_offset = offset
+        offset += 16 * n_chunk
+        if bin_number == pseudo_bin:
+            # The second 'chunk' holds the number of mapped and unmapped
+            # records.
+            records, = struct.unpack_from("<Q", data, chunks_offset + 16)
+            continue
+        level = ((7 * bin_number + 1).bit_length() - 1) // 3
+        start = (bin_number - first_bins[level]) << shifts[level]
+        end = start + (1 << shifts[level])
+        size = 0.0
+        if sizes:
+            chunk_format = chunk_formats.get(n_chunk)
+            if chunk_format is None:
+                chunk_format = struct.Struct(f"<{2 * n_chunk}Q")
+                chunk_formats[n_chunk] = chunk_format
+            chunks = chunk_format.unpack_from(data, chunks_offset)
+            for i in range(0, 2 * n_chunk, 2):
+                size += chunk_size(chunks[i], chunks[i + 1])
+        bins.append(IndexBin(start, end, size))
+    reader.offset = offset
+    return bins, records
+
+
+def read_tabix_index(data: bytes, sizes: bool = True
+                     ) -> List[IndexedContig]:
+    """
+    Read the contents of a (decompressed) .tbi file.
+    :param data: The contents of the index.
+    :param sizes: Estimate the size of each bin. Otherwise the sizes are 0.
+    :return: A list of IndexedContig objects.
+    """
+    reader = _Reader(data)
+    if reader.read(4) != b"TBI\1":
+        raise ValueError("Not a tabix index.")
+    n_ref, = reader.unpack("i")
+    reader.unpack("6i")  # format, col_seq, col_beg, col_end, meta, skip
+    l_nm, = reader.unpack("i")
+    names = _read_names(reader.read(l_nm))
+    contigs = []
+    for name in names[:n_ref]:
+        bins, records = _read_bins(reader, TABIX_MIN_SHIFT, TABIX_DEPTH,
+                                   False, sizes)
+        n_intv, = reader.unpack("i")
+        reader.read(8 * n_intv)  # The linear index is not needed.
+        contigs.append(IndexedContig(name, bins, records))
+    return contigs
+
+
+def _require_names(contig_names: Optional[List[str]], n_ref: int,
+                   index_type: str) -> List[str]:
+    if contig_names is None or len(contig_names) < n_ref:
+        raise ValueError(f"The {index_type} index does not contain contig "
+                         f"names and not enough names were provided.")
+    return contig_names
+
+
+def read_bai_index(data: bytes, contig_names: Optional[List[str]] = None,
+                   sizes: bool = True) -> List[IndexedContig]:
+    """
+    Read the contents of a .bai file. The binning scheme is the same as that
+    of tabix, but the contig names are only stored in the BAM header.
+    :param data: The contents of the index.
+    :param contig_names: The names of the contigs in the order of their
+    reference ids.
+    :param sizes: Estimate the size of each bin. Otherwise the sizes are 0.
+    :return: A list of IndexedContig objects.
+    """
+    reader = _Reader(data)
+    if reader.read(4) != b"BAI\1":
+        raise ValueError("Not a BAI index.")
+    n_ref, = reader.unpack("i")
+    contig_names = _require_names(contig_names, n_ref, "BAI")
+    contigs = []
+    for name in contig_names[:n_ref]:
+        bins, records = _read_bins(reader, TABIX_MIN_SHIFT, TABIX_DEPTH,
+                                   False, sizes)
+        n_intv, = reader.unpack("i")
+        reader.read(8 * n_intv)  # The linear index is not needed.
+        contigs.append(IndexedContig(name, bins, records))
+    return contigs
+
+
+def read_crai_index(data: bytes, contig_names: Optional[List[str]] = None
+                    ) -> List[IndexedContig]:
+    """
+    Read the contents of a (decompressed) .crai file. This is a table with a
+    line per slice of the CRAM file. The slices take the place of the bins,
+    with the size of the slice as their size. The number of records is not
+    stored in the index.
+    :param data: The contents of the index.
+    :param contig_names: The names of the contigs in the order of their
+    reference ids.
+    :return: A list of IndexedContig objects, for the contigs with slices.
+    """
+    slices: Dict[int, List[IndexBin]] = defaultdict(list)
+    for line in data.decode().splitlines():
+        if not line.strip():
+            continue
+        fields = line.split()
+        reference_id, start, span = (int(field) for field in fields[:3])
+        # Multi-reference slices have id -2 and unmapped slices id -1.
+        if reference_id < 0:
+            continue
+        # Alignment starts are 1-based.
+        slices[reference_id].append(
+            IndexBin(start - 1, start - 1 + span, float(fields[5])))
+    contig_names = _require_names(contig_names, max(slices, default=-1) + 1,
+                                  "CRAI")
+    return [IndexedContig(contig_names[reference_id], bins, None)
+            for reference_id, bins in sorted(slices.items())]
+
+
+def read_csi_index(data: bytes, contig_names: Optional[List[str]] = None,
+                   sizes: bool = True) -> List[IndexedContig]:
+    """
+    Read the contents of a (decompressed) .csi file.
+    :param data: The contents of the index.
+    :param contig_names: The names of the contigs in the order of their
+    reference ids. This is needed for indexes that do not store names, such as
+    those of BCF files.
+    :param sizes: Estimate the size of each bin. Otherwise the sizes are 0.
+    :return: A list of IndexedContig objects.
+    """
+    reader = _Reader(data)
+    if reader.read(4) != b"CSI\1":
+        raise ValueError("Not a CSI index.")
+    min_shift, depth, l_aux = reader.unpack("3i")
+    aux = reader.read(l_aux)
+    if l_aux >= 28:
+        # The auxiliary data is a tabix header with the contig names.
+        l_nm, = struct.unpack_from("<i", aux, 24)
+        contig_names = _read_names(aux[28:28 + l_nm])
+    n_ref, = reader.unpack("i")
+    contig_names = _require_names(contig_names, n_ref, "CSI")
+    contigs = []
+    for name in contig_names[:n_ref]:
+        bins, records = _read_bins(reader, min_shift, depth, True, sizes)
+        contigs.append(IndexedContig(name, bins, records))
+    return contigs
+
+
+def find_index(in_file: Union[str, os.PathLike]) -> Optional[str]:
+    """Return the path of the .tbi or .csi index of a file, if it exists."""
+    for extension in (".csi", ".tbi"):
+        index_file = os.fspath(in_file) + extension
+        if os.path.exists(index_file):
+            return index_file
+    return None
+
+
+def find_alignment_index(in_file: Union[str, os.PathLike]) -> Optional[str]:
+    """
+    Return the path of the .csi, .bai or .crai index of a BAM or CRAM file,
+    if it exists. Both 'file.bam.bai' and 'file.bai' are recognized.
+    """
+    path = os.fspath(in_file)
+    for extension in ALIGNMENT_INDEX_EXTENSIONS:
+        for index_file in (path + extension,
+                           os.path.splitext(path)[0] + extension):
+            if os.path.exists(index_file):
+                return index_file
+    return None
+
+
+def read_index(index_file: Union[str, os.PathLike],
+               contig_names: Optional[List[str]] = None,
+               sizes: bool = True) -> List[IndexedContig]:
+    """
+    Read a .tbi, .csi, .bai or .crai index. The format is detected from the
+    contents. Compressed indexes are decompressed first.
+    :param index_file: The path to the index.
+    :param contig_names: Contig names in reference id order. Only used for
+    indexes that do not contain the names themselves.
+    :param sizes: Estimate the size of each bin from its chunks. This is only
+    needed to distribute records over the bins and is skipped otherwise,
+    which makes reading large indexes faster. The sizes are then 0.
+    :return: A list of IndexedContig objects in the order of the index.
+    """
+    with open(index_file, "rb") as index_h:
+        data = index_h.read()
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+    if data[:4] == b"CSI\1":
+        return read_csi_index(data, contig_names, sizes)
+    if data[:4] == b"BAI\1":
+        return read_bai_index(data, contig_names, sizes)
+    if data[:4] == b"TBI\1":
+        return read_tabix_index(data, sizes)
+    return read_crai_index(data, contig_names)
@@ -0,0 +1,114 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
+
+from .regions import BedRegion
+
+
+class IntervalIndex:
+    """
+    Sorted and merged intervals per contig, for fast lookup of the intervals
+    that overlap a region and of the nearest position inside an interval.
+    """
+    def __init__(self, regions: Iterable[BedRegion]):
+        intervals: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for contig, start, end in regions:
+            intervals[contig].append((start, end))
+        self._starts: Dict[str, List[int]] = {}
+        self._ends: Dict[str, List[int]] = {}
+        for contig, contig_intervals in intervals.items():
+            starts: List[int] = []
+            ends: List[int] = []
+            for start, end in sorted(contig_intervals):
+                if ends and start <= ends[-1]:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._starts[contig] = starts
+            self._ends[contig] = ends
+
+    def overlapping(self, contig: str, start: int, end: int
+                    ) -> Generator[Tuple[int, int], None, None]:
+        """Yield the intervals that overlap with the region, in order."""
+        starts = self._starts.get(contig, [])
+        ends = self._ends.get(contig, [])
+        index = bisect_right(ends, start)
+        while index < len(starts) and starts[index] < end:
+            yield starts[index], ends[index]
+            index += 1
+
+    def nearest(self, contig: str, position: int, lowest: int, highest: int
+                ) -> Optional[int]:
+        """
+        Find the position closest to the given position that lies within an
+        interval (including its end) and between lowest and highest.
+        :return: The position, or None if there is no such position.
+        """
+        starts = self._starts.get(contig, [])
+        ends = self._ends.get(contig, [])
+        position = min(max(position, lowest), highest)
+        index = bisect_right(starts, position) - 1
+        if index >= 0 and ends[index] >= position:
+            return position
+        best = None
+        # The interval on the left ends before the position and the one on
+        # the right starts after it.
+        if index >= 0 and ends[index] >= lowest:
+            best = ends[index]
+        if index + 1 < len(starts) and starts[index + 1] <= highest:
+            if best is None or starts[index + 1] - position < position - best:
+                best = starts[index + 1]
+        return best
+
+    def snap(self, contig: str, position: int, lowest: int, highest: int
+             ) -> int:
+        """
+        Move a position to the nearest position within an interval, if there
+        is one between lowest and highest.
+        """
+        nearest = self.nearest(contig, position, lowest, highest)
+        return position if nearest is None else nearest
+
+
+def subtract_regions(regions: Iterable[BedRegion], exclude: IntervalIndex
+                     ) -> Generator[BedRegion, None, None]:
+    """
+    Remove the excluded intervals from the regions. Regions that are partly
+    excluded are split into the parts that remain.
+    :param regions: The regions.
+    :param exclude: The intervals to remove.
+    :return: A generator of the remaining regions.
+    """
+    for region in regions:
+        contig, start, end = region
+        position = start
+        for excluded_start, excluded_end in exclude.overlapping(contig, start,
+                                                                end):
+            if excluded_start > position:
+                yield BedRegion(contig, position, excluded_start)
+            position = max(position, excluded_end)
+        if position == start:
+            yield region
+        elif position < end:
+            yield BedRegion(contig, position, end)
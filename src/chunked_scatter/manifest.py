@@ -0,0 +1,162 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+A manifest holds all scatters in a single BED file, with the scatter number
+in the fourth column. An index with the byte offset and length of each
+scatter allows reading a single scatter with one seek.
+"""
+
+import argparse
+import os
+import struct
+import sys
+import threading
+from pathlib import Path
+from typing import Iterable, List, Union
+
+from .profiling import profiled
+from .regions import BedRegion
+
+MANIFEST_SUFFIX = "manifest.bed"
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"CSIDX\1"
+# Each scatter has an entry with the offset and length of its records.
+INDEX_ENTRY = struct.Struct("<QQ")
+
+
+def manifest_index(manifest: Union[str, os.PathLike]) -> str:
+    """Return the path of the index belonging to a manifest."""
+    return os.fspath(manifest) + INDEX_SUFFIX
+
+
+@profiled("write_manifest", writes_files=True)
+def write_manifest(region_lists: Iterable[List[BedRegion]], prefix: str
+                   ) -> str:
+    """
+    Write region lists to a single '{prefix}manifest.bed' file and its index.
+    Both files are written under a temporary name and renamed when complete.
+    :param region_lists: The region lists to be written.
+    :param prefix: The filename prefix for the manifest.
+    :return: The path of the manifest.
+    """
+    parent_dir = Path(prefix).parent
+    if not parent_dir.exists():
+        parent_dir.mkdir(parents=True)
+    manifest = f"{prefix}{MANIFEST_SUFFIX}"
+    index = manifest_index(manifest)
+    temp_manifest = f"{manifest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    temp_index = f"{index}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_manifest, "wb") as manifest_h, \
+                open(temp_index, "wb") as index_h:
+            index_h.write(INDEX_MAGIC)
+            offset = 0
+            for scatter_number, region_list in enumerate(region_lists):
+                contents = "".join(
+                    f"{contig}\t{start}\t{end}\t{scatter_number}\n"
+                    for contig, start, end in region_list).encode()
+                manifest_h.write(contents)
+                index_h.write(INDEX_ENTRY.pack(offset, len(contents)))
+                offset += len(contents)
+        os.replace(temp_index, index)
+        os.replace(temp_manifest, manifest)
+    except BaseException:
+        for temp_file in (temp_manifest, temp_index):
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        raise
+    return manifest
+
+
+def scatter_count(manifest: Union[str, os.PathLike]) -> int:
+    """Return the number of scatters in a manifest."""
+    index_size = os.path.getsize(manifest_index(manifest))
+    return (index_size - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+
+
+def read_scatter(manifest: Union[str, os.PathLike], scatter_number: int
+                 ) -> List[BedRegion]:
+    """
+    Read the regions of a single scatter from a manifest.
+    :param manifest: The path of the manifest.
+    :param scatter_number: The number of the scatter, starting at 0.
+    :return: The regions of the scatter.
+    """
+    with open(manifest_index(manifest), "rb") as index_h:
+        if index_h.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise ValueError(f"Not a manifest index: "
+                             f"'{manifest_index(manifest)}'.")
+        if scatter_number < 0:
+            raise IndexError(f"Invalid scatter number: {scatter_number}.")
+        index_h.seek(len(INDEX_MAGIC) + scatter_number * INDEX_ENTRY.size)
+        entry = index_h.read(INDEX_ENTRY.size)
+    if len(entry) != INDEX_ENTRY.size:
+        raise IndexError(f"Scatter {scatter_number} is not in the manifest.")
+    offset, length = INDEX_ENTRY.unpack(entry)
+    with open(manifest, "rb") as manifest_h:
+        manifest_h.seek(offset)
+        contents = manifest_h.read(length).decode()
+    regions = []
+    for line in contents.splitlines():
+        contig, start, end, _ = line.split("\t")
+        regions.append(BedRegion(contig, int(start), int(end)))
+    return regions
+
+
+def argument_parser() -> argparse.ArgumentParser:
+    """Argument parser for the extract-scatter program."""
+    parser = argparse.ArgumentParser(
+        description="Extract a single scatter from a manifest written with "
+                    "--manifest and write it as a BED file.")
+    parser.add_argument("manifest", metavar="MANIFEST", type=str,
+                        help="The manifest file. Its index "
+                             f"(MANIFEST{INDEX_SUFFIX}) should be next to "
+                             f"it.")
+    parser.add_argument("scatter_number", metavar="N", type=int, nargs="?",
+                        help="The number of the scatter, starting at 0.")
+    parser.add_argument("-o", "--output", type=str,
+                        help="The output BED file. Defaults to STDOUT.")
+    parser.add_argument("-n", "--count", action="store_true",
+                        help="Print the number of scatters in the manifest "
+                             "instead of extracting one.")
+    return parser
+
+
+def main():
+    parser = argument_parser()
+    args = parser.parse_args()
+    if args.count:
+        print(scatter_count(args.manifest))
+        return
+    if args.scatter_number is None:
+        parser.error("the scatter number N is required unless --count is "
+                     "given")
+    regions = read_scatter(args.manifest, args.scatter_number)
+    contents = "".join(str(region) + "\n" for region in regions)
+    if args.output:
+        with open(args.output, "wt") as out_file_h:
+            out_file_h.write(contents)
+    else:
+        sys.stdout.write(contents)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
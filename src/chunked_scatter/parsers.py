@@ -18,27 +18,142 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import collections
+import contextlib
+import gzip
+import io
+import itertools
 import os
-from typing import Generator, NamedTuple, Optional, Union
+import sys
+import threading
+import zlib
+from array import array
+from typing import BinaryIO, Dict, Generator, Iterable, List, Optional, \
+    TYPE_CHECKING, Tuple, Union, cast
 
-from pysam import VariantFile, VariantRecord
+from .indexes import IndexedContig, find_index, read_index
+from .profiling import profiled
+from .regions import BedRegion, RegionArray
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pysam import VariantFile
 
 # Add extensions here so they can be used troughout the project for messages.
 SUPPORTED_EXTENSIONS = [".bed", ".dict", ".fai", ".vcf", ".vcf.gz", ".bcf"]
 SUPPORTED_EXTENSIONS_STRING = "'" + "', '".join(SUPPORTED_EXTENSIONS) + "'"
+# Any of the text formats can additionally be gzip or bgzip compressed.
+COMPRESSION_EXTENSIONS = (".gz", ".bgz")
+# Input is read from STDIN when this is given as the file name.
+STDIN = "-"
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Large files are read in blocks of this size.
+READ_SIZE = 16 * 1024 * 1024
+
+
+def _stdin() -> io.BufferedReader:
+    return cast(io.BufferedReader, sys.stdin.buffer)
+
+
+@contextlib.contextmanager
+def open_input(in_file: Union[str, os.PathLike], mode: str = "rb"):
+    """
+    Open a file or STDIN for reading. Gzip and bgzip compressed input is
+    detected by its magic bytes and decompressed while reading.
+    :param in_file: The file name, or '-' for STDIN.
+    :param mode: 'rb' for a binary or 'rt' for a text stream.
+    :return: A context manager yielding the stream.
+    """
+    raw = _stdin() if os.fspath(in_file) == STDIN else open(in_file, "rb")
+    stream: Union[io.BufferedReader, gzip.GzipFile] = raw
+    try:
+        if raw.peek(2)[:2] == GZIP_MAGIC:
+            stream = gzip.GzipFile(fileobj=raw, mode="rb")
+        if mode == "rt":
+            text_stream = io.TextIOWrapper(stream)
+            try:
+                yield text_stream
+            finally:
+                # Detach so STDIN is not closed with the wrapper.
+                text_stream.detach()
+        else:
+            yield stream
+    finally:
+        if stream is not raw:
+            stream.close()
+        if raw is not sys.stdin.buffer:
+            raw.close()
+
+
+def sniff_format(head: bytes) -> str:
+    """
+    Determine the format of the input from its first bytes. This is used for
+    STDIN, which has no extension.
+    :param head: The first bytes of the input, possibly compressed.
+    :return: The extension belonging to the format.
+    """
+    if head.startswith(GZIP_MAGIC):
+        try:
+            head = zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(head)
+        except zlib.error:
+            pass
+    if head.startswith(b"BCF"):
+        return ".bcf"
+    if head.startswith(b"##fileformat=VCF"):
+        return ".vcf"
+    if head.startswith((b"@HD", b"@SQ")):
+        return ".dict"
+    fields = head.split(b"\n", 1)[0].split(b"\t")
+    # A fasta index has a name followed by 4 or 5 numeric columns.
+    if len(fields) in (5, 6) and all(field.strip().isdigit()
+                                     for field in fields[1:]):
+        return ".fai"
+    return ".bed"
+
+
+def detect_format(in_file: Union[str, os.PathLike]) -> str:
+    """
+    Determine the format of a file by its extension, ignoring compression
+    extensions. For STDIN the format is determined from the data.
+    :param in_file: The file name, or '-' for STDIN.
+    :return: The extension belonging to the format: '.bed', '.dict', '.fai',
+    '.vcf' or '.bcf'.
+    """
+    path = os.fspath(in_file)
+    if path == STDIN:
+        return sniff_format(_stdin().peek(io.DEFAULT_BUFFER_SIZE))
+    base, extension = os.path.splitext(path)
+    if extension in COMPRESSION_EXTENSIONS:
+        base, extension = os.path.splitext(base)
+    if extension not in (".bed", ".dict", ".fai", ".vcf", ".bcf"):
+        raise NotImplementedError(
+            f"Unkown extension '{extension}' for file: '{in_file}'. Supported "
+            f"extensions are: {SUPPORTED_EXTENSIONS_STRING}.")
+    return extension
 
 
-class BedRegion(NamedTuple):
-    """A class that contains a region described as in the BED file format."""
-    contig: str
-    start: int
-    end: int
+def _stdin_pipe() -> int:
+    """
+    Return a file descriptor that provides the data of STDIN. Data that
+    Python has already buffered (by peeking at it) would be missed when
+    reading file descriptor 0 directly, so a thread copies STDIN into a pipe.
+    """
+    read_fd, write_fd = os.pipe()
 
-    def __str__(self):
-        return f"{self.contig}\t{self.start}\t{self.end}"
+    def copy():
+        try:
+            with open(write_fd, "wb") as pipe:
+                while True:
+                    block = _stdin().read1(READ_SIZE)
+                    if not block:
+                        break
+                    pipe.write(block)
+        except BrokenPipeError:  # The reader stopped early.
+            pass
 
-    def __len__(self):
-        return self.end - self.start
+    threading.Thread(target=copy, daemon=True).start()
+    return read_fd
 
 
 def dict_file_to_regions(in_file: Union[str, os.PathLike]
@@ -48,7 +163,7 @@ def dict_file_to_regions(in_file: Union[str, os.PathLike]
     :param in_file: The sequence dictionary
     :return: A generator of BedRegions
     """
-    with open(in_file, "rt") as in_file_h:
+    with open_input(in_file, "rt") as in_file_h:
         for line in in_file_h:
             fields = line.strip().split()
             if fields[0] != "@SQ":
@@ -65,6 +180,24 @@ def dict_file_to_regions(in_file: Union[str, os.PathLike]
                 yield BedRegion(contig, 0, length)
 
 
+def _read_lines(in_file_h: BinaryIO, read_size: int = READ_SIZE
+                ) -> Generator[List[bytes], None, None]:
+    """
+    Read a binary file in large blocks and yield the complete lines in each
+    block.
+    """
+    remainder = b""
+    while True:
+        block = in_file_h.read(read_size)
+        if not block:
+            break
+        lines = (remainder + block).split(b"\n")
+        remainder = lines.pop()
+        yield lines
+    if remainder:
+        yield [remainder]
+
+
 def bed_file_to_regions(in_file: Union[str, os.PathLike]
                         ) -> Generator[BedRegion, None, None]:
     """
@@ -72,20 +205,57 @@ def bed_file_to_regions(in_file: Union[str, os.PathLike]
     :param in_file: The BED file
     :return: A BedRegion Generator
     """
-    with open(in_file, "rt") as in_file_h:
-        for line in in_file_h:
-            fields = line.strip().split()
-            # Skip browser and track fields and other invalid lines.
-            if fields[0] in ["browser", "track"] or len(fields) < 3:
-                continue
-            # Take the first 3 columns of each line to create a new BedRegion
-            yield BedRegion(fields[0], int(fields[1]), int(fields[2]))
+    # Decode each contig name only once.
+    contigs: Dict[bytes, str] = {}
+    with open_input(in_file) as in_file_h:
+        for lines in _read_lines(in_file_h):
+            for line in lines:
+                # Only split off the first 3 columns.
+                fields = line.split(None, 3)
+                # Skip browser and track fields and other invalid lines.
+                if len(fields) < 3 or fields[0] in (b"browser", b"track"):
+                    continue
+                try:
+                    contig = contigs[fields[0]]
+                except KeyError:
+                    contig = contigs.setdefault(fields[0], fields[0].decode())
+                yield BedRegion(contig, int(fields[1]), int(fields[2]))
+
+
+def bed_file_to_region_array(in_file: Union[str, os.PathLike]
+                             ) -> RegionArray:
+    """
+    Reads a BED file directly into a RegionArray, without creating a
+    BedRegion for each line.
+    :param in_file: The BED file
+    :return: A RegionArray
+    """
+    regions = RegionArray()
+    contig_ids: Dict[bytes, int] = {}
+    add_contig_id = regions.contig_ids.append
+    add_start = regions.starts.append
+    add_end = regions.ends.append
+    with open_input(in_file) as in_file_h:
+        for lines in _read_lines(in_file_h):
+            for line in lines:
+                fields = line.split(None, 3)
+                if len(fields) < 3 or fields[0] in (b"browser", b"track"):
+                    continue
+                try:
+                    contig_id = contig_ids[fields[0]]
+                except KeyError:
+                    contig_id = contig_ids.setdefault(
+                        fields[0], regions.contig_id(fields[0].decode()))
+                add_contig_id(contig_id)
+                add_start(int(fields[1]))
+                add_end(int(fields[2]))
+    return regions
 
 
 def fai_file_to_regions(in_file: Union[str, os.PathLike]
                         ) -> Generator[BedRegion, None, None]:
     # faidx format described here: https://www.htslib.org/doc/faidx.html
-    with open(in_file, "rt") as in_file_h:
+    with open_input(in_file, "rt") as in_file_h:
         for line in in_file_h:
             # faidx has name, length, offset, linebases, linewidth columns. And
             # optionally a qualoffset. By using maxsplit=2, we catch name and
@@ -95,27 +265,205 @@ def fai_file_to_regions(in_file: Union[str, os.PathLike]
             yield BedRegion(name, 0, int(length))
 
 
-def vcf_file_to_regions(in_file: Union[str, os.PathLike]):
-    vcf = VariantFile(in_file, mode="r")
+def index_to_regions(contigs: Iterable[IndexedContig], contig_lengths: dict
+                     ) -> Generator[BedRegion, None, None]:
+    """
+    Converts the occupied bins of an index into regions. Overlapping and
+    adjacent bins are merged and the regions are clipped to the contig length
+    when it is known.
+    :param contigs: The contigs as read from the index.
+    :param contig_lengths: A dictionary with the lengths of the contigs.
+    :return: A generator of BedRegions
+    """
+    for contig in contigs:
+        length = contig_lengths.get(contig.name)
+        region: Optional[BedRegion] = None
+        for start, end, _ in sorted(contig.bins):
+            if length is not None:
+                end = min(end, length)
+                if start >= end:
+                    continue
+            if region is not None and start <= region.end:
+                region = BedRegion(contig.name, region.start,
+                                   max(region.end, end))
+                continue
+            if region is not None:
+                yield region
+            region = BedRegion(contig.name, start, end)
+        if region is not None:
+            yield region
+
+
+def vcf_contig_names(vcf: "VariantFile") -> List[str]:
+    """Return the contig names of a VCF header in the order of their ids."""
+    return [contig.name for contig in
+            sorted(vcf.header.contigs.values(), key=lambda c: c.id)]
+
+
+def vcf_contig_lengths(vcf: "VariantFile") -> Dict[str, int]:
+    """Return the lengths of the contigs of a VCF header that have one."""
+    return {contig.name: contig.length
+            for contig in vcf.header.contigs.values()
+            if contig.length is not None}
+
+
+def vcf_file_to_regions(in_file: Union[str, os.PathLike],
+                        use_index: bool = False,
+                        threads: int = 1
+                        ) -> Generator[BedRegion, None, None]:
+    """
+    Converts a VCF or BCF file to a generator of BED regions. By default a
+    region is returned for each variant.
+    :param in_file: The VCF or BCF file.
+    :param use_index: Derive the regions from the tabix or CSI index instead
+    of decoding each record. The regions then cover the occupied bins of the
+    index (16 kb or larger) rather than the individual variants. If no index
+    is present the records are read anyway.
+    :param threads: The number of threads htslib uses for decompression.
+    :return: A BedRegion Generator
+    """
+    # pysam takes a long time to import, so it is only imported by the
+    # functions that read VCF, BCF and indexed files.
+    from pysam import VariantFile
+    vcf = VariantFile(_stdin_pipe() if os.fspath(in_file) == STDIN
+                      else in_file, mode="r", threads=threads)
     try:  # VariantFile automatically opens file
-        for variant in vcf:  # type: VariantRecord
+        index_file = find_index(in_file) if use_index else None
+        if index_file is not None:
+            # Only the header is read from the file itself.
+            yield from index_to_regions(
+                read_index(index_file, vcf_contig_names(vcf), sizes=False),
+                vcf_contig_lengths(vcf))
+            return
+        for variant in vcf:
             yield BedRegion(variant.contig, variant.start, variant.stop)
     finally:
         # Make sure vcf is always closed
         vcf.close()
 
 
-def file_to_regions(in_file: Union[str, os.PathLike]):
-    base, extension = os.path.splitext(in_file)
-    if extension == ".bed":
+def _fetch_contig(in_file: str, file_format: str, contig: str
+                  ) -> Tuple[array, array]:
+    """
+    Read the regions of a single contig from an indexed file. This runs in a
+    worker process, so only the coordinates are returned.
+    """
+    from pysam import TabixFile, VariantFile
+    starts = array("q")
+    ends = array("q")
+    if file_format == ".bed":
+        with TabixFile(in_file) as tabix_file:
+            for line in tabix_file.fetch(contig):
+                fields = line.split(None, 3)
+                if len(fields) < 3 or fields[0] in ("browser", "track"):
+                    continue
+                starts.append(int(fields[1]))
+                ends.append(int(fields[2]))
+    else:
+        with VariantFile(in_file) as vcf:
+            for variant in vcf.fetch(contig):
+                starts.append(variant.start)
+                ends.append(variant.stop)
+    return starts, ends
+
+
+def _indexed_contigs(in_file: Union[str, os.PathLike], file_format: str
+                     ) -> Optional[List[str]]:
+    """
+    Return the contigs of an indexed BED, VCF or BCF file in the order of the
+    index, or None if the file is not indexed.
+    """
+    if os.fspath(in_file) == STDIN:
+        return None
+    index_file = find_index(in_file)
+    if index_file is None or file_format not in (".bed", ".vcf", ".bcf"):
+        return None
+    contig_names = None
+    if file_format != ".bed":
+        from pysam import VariantFile
+        with VariantFile(in_file) as vcf:
+            contig_names = vcf_contig_names(vcf)
+    return [contig.name for contig in
+            read_index(index_file, contig_names, sizes=False) if contig.bins]
+
+
+def _parallel_fetch(in_file: Union[str, os.PathLike], file_format: str,
+                    contigs: List[str], threads: int
+                    ) -> Generator[Tuple[str, array, array], None, None]:
+    """
+    Fetch the regions of each contig in a process pool. The results are
+    yielded in the order of the contigs, so the output does not depend on
+    which process finishes first. Only threads contigs are fetched ahead of
+    the consumer, so at most that many contigs are held in memory.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    path = os.fspath(in_file)
+    with ProcessPoolExecutor(max_workers=threads) as executor:
+        remaining = iter(contigs)
+        pending = collections.deque(
+            (contig, executor.submit(_fetch_contig, path, file_format, contig))
+            for contig in itertools.islice(remaining, threads))
+        while pending:
+            contig, future = pending.popleft()
+            starts, ends = future.result()
+            for next_contig in itertools.islice(remaining, 1):
+                pending.append((next_contig, executor.submit(
+                    _fetch_contig, path, file_format, next_contig)))
+            yield contig, starts, ends
+
+
+@profiled("file_to_regions", reads_file=True)
+def file_to_regions(in_file: Union[str, os.PathLike],
+                    use_index: bool = False,
+                    threads: int = 1):
+    """
+    Read the regions from a file. The format is detected by the extension.
+    :param in_file: The file name, or '-' for STDIN.
+    :param use_index: For VCF and BCF files, derive the regions from the
+    index.
+    :param threads: When more than 1, the contigs of indexed BED, VCF and BCF
+    files are read in parallel by this number of processes.
+    :return: A BedRegion generator.
+    """
+    file_format = detect_format(in_file)
+    if threads > 1 and not (use_index and file_format != ".bed"):
+        contigs = _indexed_contigs(in_file, file_format)
+        if contigs:
+            return (BedRegion(contig, start, end)
+                    for contig, starts, ends in
+                    _parallel_fetch(in_file, file_format, contigs, threads)
+                    for start, end in zip(starts, ends))
+    if file_format == ".bed":
         return bed_file_to_regions(in_file)
-    elif extension == ".dict":
+    elif file_format == ".dict":
         return dict_file_to_regions(in_file)
-    elif extension == ".fai":
+    elif file_format == ".fai":
         return fai_file_to_regions(in_file)
-    elif extension in (".vcf", ".bcf", ".vcf.gz"):
-        return vcf_file_to_regions(in_file)
     else:
-        raise NotImplementedError(
-            f"Unkown extension '{extension}' for file: '{in_file}'. Supported "
-            f"extensions are: {SUPPORTED_EXTENSIONS_STRING}.")
+        return vcf_file_to_regions(in_file, use_index, threads)
+
+
+@profiled("file_to_region_array", reads_file=True)
+def file_to_region_array(in_file: Union[str, os.PathLike],
+                         use_index: bool = False,
+                         threads: int = 1) -> RegionArray:
+    """
+    Read all regions of a file into a RegionArray. BED files are read
+    directly into the array, as are the contigs of indexed files that are
+    read in parallel.
+    """
+    file_format = detect_format(in_file)
+    if threads > 1 and not (use_index and file_format != ".bed"):
+        contigs = _indexed_contigs(in_file, file_format)
+        if contigs:
+            regions = RegionArray()
+            for contig, starts, ends in _parallel_fetch(
+                    in_file, file_format, contigs, threads):
+                regions.contig_ids.extend(
+                    [regions.contig_id(contig)] * len(starts))
+                regions.starts.extend(starts)
+                regions.ends.extend(ends)
+            return regions
+    if file_format == ".bed":
+        return bed_file_to_region_array(in_file)
+    return RegionArray(file_to_regions(in_file, use_index, threads))
@@ -0,0 +1,291 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Instrumentation of the stages of the scatter programs. When profiling is
+enabled, with --profile or the CHUNKED_SCATTER_PROFILE environment variable,
+each call of an instrumented function is timed and its regions in and out,
+bytes read and written and, when tracemalloc is tracing, its allocations are
+counted. Only the thread that enabled profiling is profiled.
+"""
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+from _thread import get_ident
+from collections.abc import Iterable, Sized
+from types import GeneratorType
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from .report import StageTimer
+
+PROFILE_ENVIRONMENT_VARIABLE = "CHUNKED_SCATTER_PROFILE"
+# Output to STDERR instead of a file.
+STDERR = "-"
+CHROME_TRACE_EXTENSIONS = (".json",)
+PSTATS_EXTENSIONS = (".prof", ".pstats")
+COUNTERS = ("calls", "items_in", "items_out", "bytes_read", "bytes_written",
+            "allocated_bytes")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_profiler: Optional["Profiler"] = None
+
+
+class Profiler(StageTimer):
+    """
+    Collects the time and counters of the instrumented functions. The time of
+    a function excludes the time spent in the instrumented functions it calls
+    or iterates over.
+    """
+    def __init__(self, output: str = STDERR):
+        """
+        :param output: Where the profile is written by write(). '-' prints a
+        summary to STDERR. Files ending in .json get a Chrome trace, which
+        can be opened in chrome://tracing or Perfetto. Files ending in .prof
+        or .pstats get the cProfile statistics of the whole run. Other files
+        get the summary.
+        """
+        super().__init__()
+        self.output = output
+        self.counters: Dict[str, Dict[str, int]] = {}
+        # The calls in the Chrome trace event format.
+        self.events: List[Dict[str, Any]] = []
+        self.thread = get_ident()
+        self._epoch = time.perf_counter()
+        self._previous: Optional[Profiler] = None
+        # The number of calls of functions reading a file that are running.
+        self._reading = 0
+        # For each running stage, the traced memory at its start and the
+        # memory allocated by stages nested in it.
+        self._allocations: List[List[int]] = []
+        import tracemalloc
+        self._traced_memory: Optional[Callable[[], int]] = (
+            (lambda: tracemalloc.get_traced_memory()[0])
+            if tracemalloc.is_tracing() else None)
+        self._cprofile = None
+        if output.endswith(PSTATS_EXTENSIONS):
+            import cProfile
+            self._cprofile = cProfile.Profile()
+
+    def _begin(self) -> float:
+        if self._traced_memory is not None:
+            self._allocations.append([self._traced_memory(), 0])
+        return super()._begin()
+
+    def _end(self, name: str, start: float):
+        super()._end(name, start)
+        if self._traced_memory is not None:
+            memory_start, nested = self._allocations.pop()
+            allocated = self._traced_memory() - memory_start
+            self._stage_counters(name)["allocated_bytes"] += (allocated -
+                                                              nested)
+            if self._allocations:
+                self._allocations[-1][1] += allocated
+
+    def _stage_counters(self, name: str) -> Dict[str, int]:
+        try:
+            return self.counters[name]
+        except KeyError:
+            return self.counters.setdefault(
+                name, dict.fromkeys(COUNTERS, 0))
+
+    def start(self):
+        """Profile the instrumented functions until stop() is called."""
+        global _profiler
+        self._previous, _profiler = _profiler, self
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def stop(self):
+        global _profiler
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        _profiler = self._previous
+
+    def call(self, name: str, function: Callable, args: tuple, kwargs: dict,
+             reads_file: bool = False, writes_files: bool = False) -> Any:
+        """
+        Call an instrumented function and profile it. A generator that is
+        returned is profiled while it is iterated over.
+        :param reads_file: The first argument is the file that is read.
+        :param writes_files: The function returns the file or files it wrote.
+        """
+        call_counters = dict.fromkeys(COUNTERS[1:-1], 0)
+        if args and reads_file:
+            # STDIN has no size. A file read through another reading function
+            # is only counted once.
+            if not self._reading and os.path.isfile(args[0]):
+                call_counters["bytes_read"] = os.path.getsize(args[0])
+        elif args and isinstance(args[0], Sized):
+            call_counters["items_in"] = len(args[0])
+        elif args and isinstance(args[0], Iterable):
+            args = (self._count_input(args[0], call_counters),) + args[1:]
+        call_start = time.perf_counter()
+        start = self._begin()
+        self._reading += reads_file
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            self._reading -= reads_file
+            self._end(name, start)
+        if isinstance(result, GeneratorType):
+            return self._profile_generator(name, result, call_counters,
+                                           call_start)
+        if writes_files:
+            paths = [result] if isinstance(result, str) else result
+            call_counters["bytes_written"] = sum(map(os.path.getsize, paths))
+        elif isinstance(result, Sized):
+            call_counters["items_out"] = len(result)
+        self._end_call(name, call_counters, call_start)
+        return result
+
+    @staticmethod
+    def _count_input(items: Iterable, call_counters: Dict[str, int]
+                     ) -> Iterator:
+        for item in items:
+            call_counters["items_in"] += 1
+            yield item
+
+    def _profile_generator(self, name: str, generator: GeneratorType,
+                           call_counters: Dict[str, int], call_start: float
+                           ) -> Iterator:
+        try:
+            for item in self.timed(name, generator):
+                call_counters["items_out"] += 1
+                yield item
+        finally:
+            self._end_call(name, call_counters, call_start)
+
+    def _end_call(self, name: str, call_counters: Dict[str, int],
+                  call_start: float):
+        stage_counters = self._stage_counters(name)
+        stage_counters["calls"] += 1
+        for counter, value in call_counters.items():
+            stage_counters[counter] += value
+        self.events.append({
+            "name": name, "cat": "stage", "ph": "X", "pid": os.getpid(),
+            "tid": self.thread,
+            "ts": (call_start - self._epoch) * 1e6,
+            "dur": (time.perf_counter() - call_start) * 1e6,
+            "args": call_counters})
+
+    def summary(self) -> str:
+        """A table with the seconds and counters of each stage."""
+        lines = [f"{'stage':<30}{'calls':>8}{'seconds':>10}{'items in':>11}"
+                 f"{'items out':>11}{'bytes read':>13}{'bytes written':>15}"
+                 f"{'allocated':>13}"]
+        for name, counters in self.counters.items():
+            allocated = (str(counters["allocated_bytes"])
+                         if self._traced_memory is not None else "-")
+            lines.append(
+                f"{name:<30}{counters['calls']:>8}"
+                f"{self.seconds.get(name, 0.0):>10.3f}"
+                f"{counters['items_in']:>11}{counters['items_out']:>11}"
+                f"{counters['bytes_read']:>13}"
+                f"{counters['bytes_written']:>15}{allocated:>13}")
+        lines.append(f"total {time.perf_counter() - self._epoch:.3f} "
+                     f"seconds")
+        return "\n".join(lines) + "\n"
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """The calls in the Chrome trace event format."""
+        return {"traceEvents": self.events, "displayTimeUnit": "ms",
+                "otherData": {name: dict(counters,
+                                         seconds=self.seconds.get(name, 0.0))
+                              for name, counters in self.counters.items()}}
+
+    def write(self):
+        """Write the profile to the output given to the constructor."""
+        if self.output == STDERR:
+            sys.stderr.write(self.summary())
+        elif self.output.endswith(CHROME_TRACE_EXTENSIONS):
+            with open(self.output, "wt") as output_h:
+                json.dump(self.chrome_trace(), output_h)
+        elif self._cprofile is not None:
+            self._cprofile.dump_stats(self.output)
+        else:
+            with open(self.output, "wt") as output_h:
+                output_h.write(self.summary())
+
+
+def profiled(name: str, reads_file: bool = False, writes_files: bool = False
+             ) -> Callable[[F], F]:
+    """
+    Instrument a function as a stage. Without a profiler the function is
+    called directly.
+    :param name: The name of the stage.
+    :param reads_file: The first argument is the file that is read.
+    :param writes_files: The function returns the file or files it wrote.
+    """
+    def decorator(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if profiler is None or profiler.thread != get_ident():
+                return function(*args, **kwargs)
+            return profiler.call(name, function, args, kwargs, reads_file,
+                                 writes_files)
+        return wrapper  # type: ignore
+    return decorator
+
+
+@contextlib.contextmanager
+def profile(output: Optional[str]):
+    """
+    Profile the with block and write the profile afterwards.
+    :param output: See Profiler. When None nothing is profiled.
+    """
+    if output is None:
+        yield None
+        return
+    profiler = Profiler(output)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.write()
+
+
+def _profile_from_environment():
+    """
+    Profile the whole process when the environment variable is set, so the
+    library can be profiled without changing the code that uses it. '1'
+    prints a summary to STDERR, other values are the output file.
+    """
+    output = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE)
+    if not output:
+        return
+    profiler = Profiler(STDERR if output == "1" else output)
+    profiler.start()
+
+    def write_profile():
+        profiler.stop()
+        profiler.write()
+
+    atexit.register(write_profile)
+
+
+_profile_from_environment()
@@ -0,0 +1,199 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, Generator, List, Optional, Tuple, Union
+
+from .parsers import READ_SIZE
+from .regions import BedRegion
+
+# Runs of N of at least this length are excluded by default.
+MIN_GAP_SIZE = 1000
+# The number of bases fetched from the FASTA at once.
+FETCH_SIZE = 1024 * 1024
+N_RUNS_SUFFIX = ".nruns.bed"
+N_RUNS_HEADER = "#chunked-scatter N-runs sha256="
+
+N_RUN = re.compile("[Nn]+")
+
+
+def file_checksum(in_file: Union[str, os.PathLike]) -> str:
+    """Calculate the SHA-256 checksum of a file as a hexadecimal string."""
+    checksum = hashlib.sha256()
+    with open(in_file, "rb") as in_file_h:
+        for block in iter(lambda: in_file_h.read(READ_SIZE), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def find_n_runs(fasta: Union[str, os.PathLike], fetch_size: int = FETCH_SIZE
+                ) -> Generator[BedRegion, None, None]:
+    """
+    Find the runs of N in an indexed FASTA file. Each contig is fetched in
+    blocks, so the contigs are never entirely in memory.
+    :param fasta: The FASTA file. It must have a .fai index.
+    :param fetch_size: The number of bases fetched at once.
+    :return: A generator of the N-runs, in the order of the FASTA.
+    """
+    # pysam takes a long time to import, so only import it when needed.
+    from pysam import FastaFile
+    with FastaFile(str(fasta)) as fasta_h:
+        for contig, length in zip(fasta_h.references, fasta_h.lengths):
+            run: Optional[BedRegion] = None
+            for block_start in range(0, length, fetch_size):
+                sequence = fasta_h.fetch(
+                    contig, block_start, min(block_start + fetch_size, length))
+                for match in N_RUN.finditer(sequence):
+                    start = block_start + match.start()
+                    end = block_start + match.end()
+                    # Runs can continue across the blocks.
+                    if run is not None and run.end == start:
+                        run = BedRegion(contig, run.start, end)
+                        continue
+                    if run is not None:
+                        yield run
+                    run = BedRegion(contig, start, end)
+            if run is not None:
+                yield run
+
+
+def _file_stat(in_file: Union[str, os.PathLike]) -> Tuple[int, int]:
+    stat = os.stat(in_file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_n_runs_header(sidecar: Union[str, os.PathLike]
+                       ) -> Optional[Tuple[str, Tuple[int, int]]]:
+    """
+    Read the header of a sidecar file.
+    :return: The checksum of the FASTA file and its size and modification
+    time in nanoseconds when the sidecar was written, or None when the
+    sidecar file does not exist or has another header.
+    """
+    try:
+        with open(sidecar, "rt") as sidecar_h:
+            header = sidecar_h.readline()
+    except FileNotFoundError:
+        return None
+    if not header.startswith(N_RUNS_HEADER):
+        return None
+    try:
+        checksum, size, mtime_ns = header[len(N_RUNS_HEADER):].split()
+        return checksum, (int(size[len("size="):]),
+                          int(mtime_ns[len("mtime_ns="):]))
+    except ValueError:
+        return None
+
+
+def reference_checksum(fasta: Union[str, os.PathLike]) -> str:
+    """
+    Get the checksum of a FASTA file. The checksum in the header of its
+    N-runs sidecar file is used while the size and modification time of the
+    FASTA file are unchanged, so the FASTA file is only read when it changes.
+    Within a process each FASTA file is read at most once.
+    """
+    stat = _file_stat(fasta)
+    key = (os.path.abspath(fasta), stat)
+    try:
+        return _checksums[key]
+    except KeyError:
+        pass
+    header = read_n_runs_header(f"{fasta}{N_RUNS_SUFFIX}")
+    if header is not None and header[1] == stat:
+        checksum = header[0]
+    else:
+        checksum = file_checksum(fasta)
+    return _checksums.setdefault(key, checksum)
+
+
+# Checksums of FASTA files by path, size and modification time.
+_checksums: Dict[Tuple[str, Tuple[int, int]], str] = {}
+
+
+def read_n_runs(sidecar: Union[str, os.PathLike], checksum: str
+                ) -> Optional[List[BedRegion]]:
+    """
+    Read the N-runs from a sidecar file.
+    :return: The N-runs, or None when the sidecar file does not exist or
+    belongs to a FASTA file with another checksum.
+    """
+    header = read_n_runs_header(sidecar)
+    if header is None or header[0] != checksum:
+        return None
+    with open(sidecar, "rt") as sidecar_h:
+        sidecar_h.readline()
+        n_runs = []
+        for line in sidecar_h:
+            contig, start, end = line.rstrip("\n").split("\t")
+            n_runs.append(BedRegion(contig, int(start), int(end)))
+        return n_runs
+
+
+def write_n_runs(sidecar: Union[str, os.PathLike], checksum: str,
+                 stat: Tuple[int, int], n_runs: List[BedRegion]):
+    """
+    Write the N-runs to a sidecar file, with the checksum, size and
+    modification time of the FASTA file in the header. The file is written to
+    a temporary file which is renamed when complete, so concurrent runs never
+    see a partial file.
+    """
+    temp_file = f"{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_file, "wt") as temp_file_h:
+            temp_file_h.write(f"{N_RUNS_HEADER}{checksum} size={stat[0]} "
+                              f"mtime_ns={stat[1]}\n")
+            temp_file_h.write("".join(f"{contig}\t{start}\t{end}\n"
+                                      for contig, start, end in n_runs))
+        os.replace(temp_file, sidecar)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def reference_n_runs(fasta: Union[str, os.PathLike]) -> List[BedRegion]:
+    """
+    Get the N-runs of an indexed FASTA file. The result is cached in a
+    '<FASTA>.nruns.bed' file next to the FASTA file, which is used as long as
+    the checksum of the FASTA file is unchanged. The checksum is only
+    calculated again when the size or modification time of the FASTA file
+    changed. When the directory is not writable the N-runs are not cached.
+    :param fasta: The FASTA file. It must have a .fai index.
+    :return: A list of the N-runs.
+    """
+    sidecar = f"{fasta}{N_RUNS_SUFFIX}"
+    stat = _file_stat(fasta)
+    checksum = reference_checksum(fasta)
+    header = read_n_runs_header(sidecar)
+    n_runs = read_n_runs(sidecar, checksum)
+    if n_runs is None:
+        n_runs = list(find_n_runs(fasta))
+    elif header is not None and header[1] == stat:
+        return n_runs
+    # Also rewrite a sidecar of which only the size or time is outdated, so
+    # the next run does not need to calculate the checksum.
+    try:
+        write_n_runs(sidecar, checksum, stat, n_runs)
+    except OSError:
+        pass
+    return n_runs
@@ -0,0 +1,156 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from array import array
+from typing import Dict, Generator, Iterable, Iterator, List, NamedTuple, \
+    Sequence, Union, overload
+
+from .profiling import profiled
+
+
+class BedRegion(NamedTuple):
+    """A class that contains a region described as in the BED file format."""
+    contig: str
+    start: int
+    end: int
+
+    def __str__(self):
+        return f"{self.contig}\t{self.start}\t{self.end}"
+
+    def __len__(self):
+        return self.end - self.start
+
+
+@profiled("merge_regions")
+def merge_regions(regions: Iterable[BedRegion]
+                  ) -> Generator[BedRegion, None, None]:
+    """
+    Merge regions that overlap or are exactly adjacent
+    :param regions: An iterable of possibly overlapping regions
+    :return: a generator of merged regions
+    """
+    merged_region = None
+    for region in regions:
+        if merged_region is None:
+            merged_region = region
+        else:
+            if (merged_region.contig == region.contig and
+                    merged_region.end >= region.start and
+                    region.end >= merged_region.start):
+                start = min(merged_region.start, region.start)
+                end = max(merged_region.end, region.end)
+                merged_region = BedRegion(merged_region.contig, start, end)
+            else:
+                yield merged_region
+                merged_region = region
+    if merged_region:
+        yield merged_region
+
+
+class RegionArray(Sequence[BedRegion]):
+    """
+    A compact sequence of regions. Instead of a BedRegion object per region,
+    the contigs are stored as indexes into a list of contig names and the
+    starts and ends as arrays of 64-bit integers. This takes about 20 bytes
+    per region. Indexing and iterating yield BedRegion objects.
+    """
+    def __init__(self, regions: Iterable[BedRegion] = ()):
+        self.contigs: List[str] = []
+        self._contig_indexes: Dict[str, int] = {}
+        self.contig_ids = array("I")
+        self.starts = array("q")
+        self.ends = array("q")
+        self.extend(regions)
+
+    def contig_id(self, contig: str) -> int:
+        """Return the index of a contig name, adding it when it is new."""
+        try:
+            return self._contig_indexes[contig]
+        except KeyError:
+            contig_id = len(self.contigs)
+            self.contigs.append(contig)
+            self._contig_indexes[contig] = contig_id
+            return contig_id
+
+    def empty_copy(self) -> "RegionArray":
+        """
+        Return an empty RegionArray with the same contig names, so contig ids
+        can be copied over directly.
+        """
+        result = RegionArray()
+        result.contigs = list(self.contigs)
+        result._contig_indexes = dict(self._contig_indexes)
+        return result
+
+    def add(self, contig: str, start: int, end: int):
+        """Add a region without creating a BedRegion object."""
+        self.contig_ids.append(self.contig_id(contig))
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def append(self, region: BedRegion):
+        self.add(*region)
+
+    def extend(self, regions: Iterable[BedRegion]):
+        if isinstance(regions, RegionArray):
+            self.contig_ids.extend(self.contig_id(contig)
+                                   for contig in regions.contigs_column())
+            self.starts.extend(regions.starts)
+            self.ends.extend(regions.ends)
+            return
+        for contig, start, end in regions:
+            self.add(contig, start, end)
+
+    def contigs_column(self) -> Iterator[str]:
+        """Iterate over the contig name of each region."""
+        contigs = self.contigs
+        return (contigs[contig_id] for contig_id in self.contig_ids)
+
+    def total_length(self) -> int:
+        """Return the sum of the lengths of all regions."""
+        return sum(self.ends) - sum(self.starts)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @overload
+    def __getitem__(self, index: int) -> BedRegion: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "RegionArray": ...
+
+    def __getitem__(self, index: Union[int, slice]
+                    ) -> Union[BedRegion, "RegionArray"]:
+        if isinstance(index, slice):
+            result = self.empty_copy()
+            result.contig_ids = self.contig_ids[index]
+            result.starts = self.starts[index]
+            result.ends = self.ends[index]
+            return result
+        return BedRegion(self.contigs[self.contig_ids[index]],
+                         self.starts[index], self.ends[index])
+
+    def __iter__(self) -> Iterator[BedRegion]:
+        for contig, start, end in zip(self.contigs_column(), self.starts,
+                                      self.ends):
+            yield BedRegion(contig, start, end)
+
+    def __repr__(self) -> str:
+        return f"RegionArray({list(self)!r})"
@@ -0,0 +1,180 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+A report on a scatter run: the size of each scatter, how balanced the
+scatters are and the time spent in each stage of the run.
+"""
+
+import contextlib
+import json
+import math
+import os
+import time
+from typing import Callable, Dict, Generator, Iterable, Iterator, List, \
+    Optional, TYPE_CHECKING, TypeVar, Union
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .regions import BedRegion
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """
+    Measures the time spent in the stages of a run. The stages of the
+    programs are chained generators, so a stage runs each time the next stage
+    asks it for an item. The time of a stage excludes the time spent in the
+    stages it is waiting for.
+    """
+    def __init__(self) -> None:
+        # The seconds spent in each stage.
+        self.seconds: Dict[str, float] = {}
+        # For each running stage, the seconds spent in stages nested in it.
+        self._nested: List[float] = []
+
+    def _begin(self) -> float:
+        """Start a period of a stage and return its start time."""
+        self._nested.append(0.0)
+        return time.perf_counter()
+
+    def _end(self, name: str, start: float):
+        """End the period of stage name that started at start."""
+        elapsed = time.perf_counter() - start
+        self.seconds[name] = (self.seconds.get(name, 0.0) + elapsed -
+                              self._nested.pop())
+        if self._nested:
+            self._nested[-1] += elapsed
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Time the code in the with block as stage name."""
+        start = self._begin()
+        try:
+            yield
+        finally:
+            self._end(name, start)
+
+    def timed(self, name: str, iterable: Iterable[T]
+              ) -> Generator[T, None, None]:
+        """Time the production of the items of an iterable as stage name."""
+        iterator = iter(iterable)
+        while True:
+            start = self._begin()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._end(name, start)
+            yield item
+
+
+def timed(timer: Optional[StageTimer], name: str, iterable: Iterable[T]
+          ) -> Iterable[T]:
+    """Time an iterable as stage name, if there is a timer."""
+    return iterable if timer is None else timer.timed(name, iterable)
+
+
+@contextlib.contextmanager
+def stage(timer: Optional[StageTimer], name: str):
+    """Time the with block as stage name, if there is a timer."""
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name):
+            yield
+
+
+def balance(values: List[float]) -> Dict[str, Optional[float]]:
+    """
+    Describe how balanced values are.
+    :return: The minimum, maximum and mean, the ratio of the maximum to the
+    minimum and the coefficient of variation (the standard deviation divided
+    by the mean). The ratios are None when they are undefined.
+    """
+    if not values:
+        return {"min": None, "max": None, "mean": None, "max_min_ratio": None,
+                "coefficient_of_variation": None}
+    smallest, largest = min(values), max(values)
+    mean = sum(values) / len(values)
+    variance = sum((value - mean) ** 2 for value in values) / len(values)
+    return {"min": smallest, "max": largest, "mean": mean,
+            "max_min_ratio": largest / smallest if smallest else None,
+            "coefficient_of_variation": math.sqrt(variance) / mean
+            if mean else None}
+
+
+class ScatterReport:
+    """Collects the report of a run of one of the scatter programs."""
+    def __init__(self, program: str,
+                 weight: Callable[["BedRegion"], float] = len):
+        """
+        :param program: The name of the program.
+        :param weight: The cost function the scatters are balanced on. When
+        it is not len the cost of each scatter is reported as well.
+        """
+        self.program = program
+        self.weight = weight
+        self.timer = StageTimer()
+        self.shards: List[Dict[str, float]] = []
+        self._start = time.perf_counter()
+
+    def record(self, region_lists: Iterable[List["BedRegion"]]
+               ) -> Iterator[List["BedRegion"]]:
+        """Record the size of each region list while passing it on."""
+        for region_list in region_lists:
+            shard: Dict[str, float] = {
+                "bp": sum(len(region) for region in region_list),
+                "intervals": len(region_list),
+                "contigs": len({region.contig for region in region_list})}
+            if self.weight is not len:
+                shard["cost"] = sum(self.weight(region)
+                                    for region in region_list)
+            self.shards.append(shard)
+            yield region_list
+
+    def to_dict(self, out_files: List[str]) -> dict:
+        """
+        :param out_files: The output files. With a single file (a manifest)
+        all scatters are in it.
+        :return: The report as a dictionary that can be written as JSON.
+        """
+        shards = [dict(shard, scatter=number,
+                       path=out_files[number if len(out_files) > 1 else 0])
+                  for number, shard in enumerate(self.shards)]
+        balances = {"bp": balance([shard["bp"] for shard in self.shards])}
+        if self.weight is not len:
+            balances["cost"] = balance([shard["cost"]
+                                        for shard in self.shards])
+        return {
+            "program": self.program,
+            "scatters": len(shards),
+            "shards": shards,
+            "balance": balances,
+            "stages": self.timer.seconds,
+            "total_seconds": time.perf_counter() - self._start,
+        }
+
+    def write(self, out_file: Union[str, os.PathLike], out_files: List[str]):
+        """Write the report as JSON."""
+        with open(out_file, "wt") as out_file_h:
+            json.dump(self.to_dict(out_files), out_file_h, indent=2)
+            out_file_h.write("\n")
@@ -19,44 +19,33 @@
 # SOFTWARE.
 
 import argparse
+import bisect
+import heapq
+import itertools
 import math
-from typing import Generator, Iterable, List
+from typing import Any, Callable, Generator, Iterable, List, Optional, \
+    Sequence, Tuple
 
-from .chunked_scatter import common_parser, region_lists_to_scatter_files
-from .parsers import BedRegion, file_to_regions
+from .cache import cached_run
+from .chunked_scatter import common_parser, input_regions, \
+    interval_options, write_scatters
+from .intervals import IntervalIndex, subtract_regions
+from .parsers import BedRegion, STDIN, file_to_region_array
+from .profiling import profile, profiled
+from .regions import RegionArray, merge_regions
+from .report import ScatterReport, stage, timed
+from .weights import file_to_weights
 
 
-def merge_regions(regions: Iterable[BedRegion]
-                  ) -> Generator[BedRegion, None, None]:
-    """
-    Merge regions that overlap or are exactly adjacent
-    :param regions: An iterable of possibly overlapping regions
-    :return: a generator of merged regions
-    """
-    merged_region = None
-    for region in regions:
-        if merged_region is None:
-            merged_region = region
-        else:
-            if (merged_region.contig == region.contig and
-                    merged_region.end >= region.start and
-                    region.end >= merged_region.start):
-                start = min(merged_region.start, region.start)
-                end = max(merged_region.end, region.end)
-                merged_region = BedRegion(merged_region.contig, start, end)
-            else:
-                yield merged_region
-                merged_region = region
-    if merged_region:
-        yield merged_region
-
-
-def sum_regions(regions: List[BedRegion]):
-    """ Calculate the total length of all regions """
-    return sum(len(region) for region in regions)
+def sum_regions(regions: Sequence[BedRegion],
+                weight: Callable[[BedRegion], float] = len):
+    """ Calculate the total length (or weight) of all regions """
+    if isinstance(regions, RegionArray) and weight is len:
+        return regions.total_length()
+    return sum(weight(region) for region in regions)
 
 
-def determine_bin_size(regions: List[BedRegion],
+def determine_bin_size(regions: Sequence[BedRegion],
                        scatter_count: int):
     """
     Determine the target scatter size, based on the total size of the regions
@@ -66,6 +55,16 @@ def determine_bin_size(regions: List[BedRegion],
     return int(total_size/scatter_count)
 
 
+def determine_bin_weight(regions: Sequence[BedRegion],
+                         scatter_count: int,
+                         weight: Callable[[BedRegion], float]) -> float:
+    """
+    Determine the target weight of the scatters, based on the total weight of
+    the regions and the number of target regions (scatter_count).
+    """
+    return sum_regions(regions, weight) / scatter_count
+
+
 def mix_small_regions(regions, target_bin_size):
     """ Mix small regions in between large regions
 
@@ -74,8 +73,13 @@ def mix_small_regions(regions, target_bin_size):
         regions and end up with a whole bunch of uninterrupted regular regions.
     """
     # Small regions are regions that are smaller than the target_bin_size
-    regular_regions = [reg for reg in regions if len(reg) >= target_bin_size]
-    small_regions = [reg for reg in regions if len(reg) < target_bin_size]
+    regular_regions = []
+    small_regions = []
+    for region in regions:
+        if len(region) >= target_bin_size:
+            regular_regions.append(region)
+        else:
+            small_regions.append(region)
 
     # Determine the ratio of small regions
     try:
@@ -86,27 +90,28 @@ def mix_small_regions(regions, target_bin_size):
 
     mixed_regions = list()
 
-    while regular_regions or small_regions:
-        # Pick small regions to ratio
-        for _ in range(small_regions_ratio):
-            try:
-                mixed_regions.append(small_regions.pop(0))
-            except IndexError:  # We are out of small regions
-                break
-        # Pick a single regular regio
-        try:
-            mixed_regions.append(regular_regions.pop(0))
-        except IndexError:  # We are out of regular regions
-            pass
+    # Consume the small regions through an iterator, so each region is only
+    # visited once instead of popping from the front of a list.
+    small_iter = iter(small_regions)
+    for regular_region in regular_regions:
+        # Pick small regions to ratio, followed by a single regular region
+        mixed_regions.extend(itertools.islice(small_iter, small_regions_ratio))
+        mixed_regions.append(regular_region)
+    # Add the small regions that are left after the regular regions ran out
+    mixed_regions.extend(small_iter)
 
     return mixed_regions
 
 
-def scatter_regions(regions: List[BedRegion], min_scatter_size: int):
+def scatter_regions(regions: Iterable[BedRegion], min_scatter_size: int,
+                    cut_sites: Optional[IntervalIndex] = None):
     """
     Scatter the regions into chunks. All chunks will be of size
     min_scatter_size, except (possibly) the last region.
     The last region will be >= min_scatter_size < min_scatter_size*2
+    When cut_sites are given, each cut is moved forward to the first cut site
+    within half a min_scatter_size, so chunks can be up to 1.5 times
+    min_scatter_size in size.
     """
     # Make sure we don't get a floating minimum scatter size
     min_scatter_size = int(min_scatter_size)
@@ -115,30 +120,193 @@ def scatter_regions(regions: List[BedRegion], min_scatter_size: int):
         raise RuntimeError("min_scatter_size must be a positive integer")
 
     for region in regions:
-        # How much of the region is still remaining
-        remaining = len(region)
-
         # If the current region is so small we cannot get 2 min_scatter_size
         # from it, just yield the entire region and continue
-        if remaining < 2*min_scatter_size:
+        if len(region) < 2*min_scatter_size:
             yield region
             continue
 
         # We keep looping as long as there are at least 2 min_scatter_size left
         # of the region
-        while remaining >= 2*min_scatter_size:
-            contig, start, end = region
-            new_region = BedRegion(contig, start, start+min_scatter_size)
-            yield new_region
-            region = BedRegion(contig, start+min_scatter_size, end)
-            remaining = len(region)
-        yield BedRegion(contig, start+min_scatter_size, end)
+        contig, start, end = region
+        while end - start >= 2*min_scatter_size:
+            cut = start + min_scatter_size
+            if cut_sites is not None:
+                # Only move forward, so no chunk becomes too small.
+                cut = cut_sites.snap(
+                    contig, cut, cut,
+                    min(cut + min_scatter_size // 2, end - min_scatter_size))
+            yield BedRegion(contig, start, cut)
+            start = cut
+        yield BedRegion(contig, start, end)
+
+
+# The differencing of karmarkar_karp_partition keeps scatter_count totals for
+# each item, so it is only applied to the largest items, at most this many
+# totals in all. The smaller items are added with LPT.
+KK_MAX_TOTALS = 1 << 17
+
+
+def _lpt_assign(sizes: Sequence[float], order: Iterable[int],
+                bins: List[List[int]], totals: List[float]):
+    """
+    Add items, in the given order, to the bin with the smallest total.
+    :param sizes: The size of each item.
+    :param order: The indexes of the items to add.
+    :param bins: For each bin the indexes of its items. This is updated.
+    :param totals: The current total of each bin.
+    """
+    heap = [(total, bin_number) for bin_number, total in enumerate(totals)]
+    heapq.heapify(heap)
+    for index in order:
+        total, bin_number = heapq.heappop(heap)
+        bins[bin_number].append(index)
+        heapq.heappush(heap, (total + sizes[index], bin_number))
+
+
+def lpt_partition(sizes: Sequence[float], scatter_count: int
+                  ) -> List[List[int]]:
+    """
+    Divide items over bins with the longest processing time first heuristic:
+    each item, from large to small, goes to the bin with the smallest total.
+    :param sizes: The size of each item.
+    :param scatter_count: The number of bins.
+    :return: For each bin the indexes of its items.
+    """
+    bins: List[List[int]] = [[] for _ in range(scatter_count)]
+    _lpt_assign(sizes, sorted(range(len(sizes)), key=sizes.__getitem__,
+                              reverse=True),
+                bins, [0.0] * scatter_count)
+    return bins
+
+
+def karmarkar_karp_partition(sizes: Sequence[float], scatter_count: int
+                             ) -> List[List[int]]:
+    """
+    Divide items over bins with the (multiway) Karmarkar-Karp differencing
+    heuristic. Each item starts as a partial partition with the item in one
+    bin. The two partitions with the largest difference between their
+    largest and smallest bin are repeatedly combined, pairing the largest
+    bins of one with the smallest bins of the other. Only the largest items
+    are combined like this, as it takes scatter_count totals per item; the
+    remaining items, from large to small, go to the bin with the smallest
+    total, as in lpt_partition.
+    :param sizes: The size of each item.
+    :param scatter_count: The number of bins.
+    :return: For each bin the indexes of its items.
+    """
+    order = sorted(range(len(sizes)), key=sizes.__getitem__, reverse=True)
+    differenced = max(2 * scatter_count, KK_MAX_TOTALS // scatter_count)
+    # A partition is a list of (total, members) tuples sorted from large to
+    # small. Members are stored as a tree of pairs, so combining partitions
+    # does not copy the member lists.
+    heap: List[Tuple[float, int, List[Tuple[float, Any]]]] = []
+    for index in order[:differenced]:
+        partition = [(sizes[index], index)] + \
+            [(0.0, None)] * (scatter_count - 1)
+        heap.append((-sizes[index], index, partition))
+    heapq.heapify(heap)
+    counter = len(sizes)
+    while len(heap) > 1:
+        first = heapq.heappop(heap)[2]
+        second = heapq.heappop(heap)[2]
+        combined = [(first_total + second_total,
+                     (first_members, second_members))
+                    for (first_total, first_members),
+                        (second_total, second_members)
+                    in zip(first, reversed(second))]
+        combined.sort(key=lambda subset: subset[0], reverse=True)
+        heapq.heappush(heap, (combined[-1][0] - combined[0][0], counter,
+                              combined))
+        counter += 1
+
+    if not heap:
+        return [[] for _ in range(scatter_count)]
+    bins: List[List[int]] = []
+    totals: List[float] = []
+    for total, members in heap[0][2]:
+        indexes = []
+        stack = [members]
+        while stack:
+            member = stack.pop()
+            if isinstance(member, tuple):
+                stack.extend(member)
+            elif member is not None:
+                indexes.append(member)
+        bins.append(indexes)
+        totals.append(total)
+    _lpt_assign(sizes, order[differenced:], bins, totals)
+    return bins
+
+
+def contiguous_partition(sizes: Sequence[float], scatter_count: int
+                         ) -> List[List[int]]:
+    """
+    Divide items over bins without changing their order, so each bin holds
+    a contiguous run of items. The cut points are found by a binary search
+    for the multiples of the average bin size in the cumulative sizes.
+    :param sizes: The size of each item.
+    :param scatter_count: The number of bins.
+    :return: For each bin the indexes of its items.
+    """
+    number_of_items = len(sizes)
+    cumulative = [0.0, *itertools.accumulate(sizes)]
+    total = cumulative[-1]
+    cuts = [0]
+    for bin_number in range(1, scatter_count):
+        target = total * bin_number / scatter_count
+        cut = bisect.bisect_left(cumulative, target)
+        # Use the cut point before the target if it is closer.
+        if cut > 0 and (cut > number_of_items or
+                        target - cumulative[cut - 1] <
+                        cumulative[cut] - target):
+            cut -= 1
+        # Each bin gets at least one item, as long as there are enough.
+        lowest = min(cuts[-1] + 1, number_of_items)
+        highest = max(lowest, number_of_items - (scatter_count - bin_number))
+        cuts.append(min(max(cut, lowest), highest))
+    cuts.append(number_of_items)
+    return [list(range(start, end)) for start, end in zip(cuts, cuts[1:])]
+
+
+PARTITIONERS = {
+    "lpt": lpt_partition,
+    "kk": karmarkar_karp_partition,
+    "contiguous": contiguous_partition,
+}
+STRATEGIES = ["greedy"] + list(PARTITIONERS)
+
+
+def partition_regions(regions: Sequence[BedRegion],
+                      scatter_count: int,
+                      weight: Callable[[BedRegion], float],
+                      strategy: str
+                      ) -> Generator[List[BedRegion], None, None]:
+    """
+    Divide regions over bins with one of the PARTITIONERS. The regions in a
+    bin keep their original order and the bins are ordered by their first
+    region, so adjacent regions in a bin can be merged.
+    :param regions: The regions to divide.
+    :param scatter_count: The maximum number of bins.
+    :param weight: A function returning the cost of a region.
+    :param strategy: The name of the partitioner.
+    :return: Yields the non-empty bins.
+    """
+    sizes = [weight(region) for region in regions]
+    bins = [sorted(indexes) for indexes in
+            PARTITIONERS[strategy](sizes, scatter_count) if indexes]
+    for indexes in sorted(bins):
+        yield list(merge_regions(regions[index] for index in indexes))
 
 
-def safe_scatter(regions: List[BedRegion],
+@profiled("safe_scatter")
+def safe_scatter(regions: Sequence[BedRegion],
                  scatter_count: int,
                  min_scatter_size: int = 10000,
                  mix: bool = False,
+                 weight: Callable[[BedRegion], float] = len,
+                 strategy: str = "greedy",
+                 cut_sites: Optional[IntervalIndex] = None,
                  ) -> Generator[List[BedRegion], None, None]:
     """
     Scatter the regions equally over the specified scatter_count.
@@ -158,6 +326,16 @@ def safe_scatter(regions: List[BedRegion],
     :param scatter_count: The number of bins to create.
     :param min_scatter_size: The minimum size of a scattered region.
     allowed to be split across multiple lists.
+    :param weight: A function returning the cost of a region. The bins are
+    balanced on this cost. Defaults to the length of the region.
+    :param strategy: How the scattered regions are divided over the bins.
+    'greedy' fills the bins one by one in the order of the regions. 'lpt'
+    (longest processing time first) and 'kk' (Karmarkar-Karp) minimize the
+    size of the largest bin, at the cost of bins that are less contiguous.
+    'contiguous' cuts the merged regions into exactly scatter_count
+    contiguous bins of about equal size.
+    :param cut_sites: Allowed cut sites. Regions are cut at the first cut site
+    within half a min_scatter_size after the regular cut.
     :return: Yields lists of BedRegions which can be converted into bed files.
     """
     # What is the target size for the bins?
@@ -173,6 +351,44 @@ def safe_scatter(regions: List[BedRegion],
     if mix:
         regions = mix_small_regions(regions, target_bin_size)
 
+    # When balancing on something else than length, the target for the bins
+    # is expressed in that weight instead.
+    if weight is not len:
+        target_bin_size = determine_bin_weight(regions, scatter_count, weight)
+
+    if strategy == "contiguous":
+        # Overlapping regions would be counted twice when cutting.
+        regions = list(merge_regions(regions))
+
+    if strategy in PARTITIONERS:
+        yield from partition_regions(
+            list(scatter_regions(regions, min_scatter_size, cut_sites)),
+            scatter_count,
+            weight, strategy)
+        return
+    elif strategy != "greedy":
+        raise ValueError(f"Unknown strategy '{strategy}'. Choose from: "
+                         f"{', '.join(STRATEGIES)}.")
+
+    yield from greedy_bins(
+        scatter_regions(regions, min_scatter_size, cut_sites),
+        target_bin_size, scatter_count, weight)
+
+
+def greedy_bins(scattered_regions: Iterable[BedRegion],
+                target_bin_size: float,
+                scatter_count: int,
+                weight: Callable[[BedRegion], float] = len,
+                ) -> Generator[List[BedRegion], None, None]:
+    """
+    Fill the bins one by one in the order of the regions. A bin is yielded as
+    soon as the next region does not fit in it anymore.
+    :param scattered_regions: The regions, as scattered by scatter_regions.
+    :param target_bin_size: The target size (or weight) of a bin.
+    :param scatter_count: The maximum number of bins.
+    :param weight: A function returning the cost of a region.
+    :return: Yields lists of BedRegions which can be converted into bed files.
+    """
     # First time running
     first_time = True
 
@@ -181,29 +397,69 @@ def safe_scatter(regions: List[BedRegion],
     # dividing all regions over the bins.
     bins_left = scatter_count
 
-    for region in scatter_regions(regions, min_scatter_size):
+    for region in scattered_regions:
         # If this is the first ever region we parse, initialise the bin
         if first_time:
             current_bin: List[BedRegion] = [region]
-            current_bin_size = len(region)
+            current_bin_size = weight(region)
             first_time = False
             continue
+        region_size = weight(region)
         # If adding this region would put us over the target bin size,
         # yield the bin and start a new one
-        if current_bin_size + len(region) > target_bin_size and bins_left > 1:
+        if current_bin_size + region_size > target_bin_size and bins_left > 1:
             # Here we merge the chunks back together if they are adjacent
             yield list(merge_regions(current_bin))
             current_bin = [region]
-            current_bin_size = len(region)
+            current_bin_size = region_size
             bins_left -= 1
         # If this region does not put us over the target bin size, add it
         else:
             current_bin.append(region)
-            current_bin_size += len(region)
+            current_bin_size += region_size
     # If we are done, yield the last bin
     yield list(merge_regions(current_bin))
 
 
+@profiled("streaming_safe_scatter")
+def streaming_safe_scatter(regions: Callable[[], Iterable[BedRegion]],
+                           scatter_count: int,
+                           min_scatter_size: int = 10000,
+                           weight: Callable[[BedRegion], float] = len,
+                           cut_sites: Optional[IntervalIndex] = None,
+                           ) -> Generator[List[BedRegion], None, None]:
+    """
+    Scatter the regions like safe_scatter with the greedy strategy, without
+    keeping the regions in memory. The regions are read twice: once to
+    determine the target size of the bins and once to fill the bins. Only
+    a single bin is in memory at a time.
+    :param regions: A function that returns a new iterable of the regions
+    each time it is called.
+    :param scatter_count: The number of bins to create.
+    :param min_scatter_size: The minimum size of a scattered region.
+    :param weight: A function returning the cost of a region.
+    :param cut_sites: Allowed cut sites.
+    :return: Yields lists of BedRegions which can be converted into bed files.
+    """
+    total_size = 0
+    total_weight: float = 0
+    for region in regions():
+        total_size += len(region)
+        if weight is not len:
+            total_weight += weight(region)
+    target_bin_size: float = int(total_size / scatter_count)
+    if target_bin_size < min_scatter_size:
+        msg = (f"--min-scatter-size is not compatible with the provided "
+               f"regions and number of bins ({min_scatter_size} > "
+               f"{target_bin_size})")
+        raise RuntimeError(msg)
+    if weight is not len:
+        target_bin_size = total_weight / scatter_count
+    yield from greedy_bins(
+        scatter_regions(regions(), min_scatter_size, cut_sites),
+        target_bin_size, scatter_count, weight)
+
+
 def argument_parser() -> argparse.ArgumentParser:
     """Argument parser for the scatter-regions program."""
     parser = common_parser()
@@ -237,16 +493,89 @@ def argument_parser() -> argparse.ArgumentParser:
                             "regions that will not be split up by the "
                             "scattering."
                         ))
+    parser.add_argument("-w", "--weights", type=str,
+                        help="Balance the scatters on the cost described in "
+                             "this file instead of on the number of bases. "
+                             "For a VCF or BCF file the cost of a region is "
+                             "the number of variants in it. With --use-index "
+                             "the number of variants is estimated from the "
+                             "index. For an indexed BAM or CRAM file the cost "
+                             "is the number of mapped reads, which is "
+                             "estimated from the index without reading any "
+                             "reads. A BED or bedGraph file (.bed, .bg, "
+                             ".bedgraph) is used as a cost profile: the "
+                             "fourth column holds the cost of each interval, "
+                             "for example as made by build-cost-profile.")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="greedy",
+                        help="How the scattered regions are divided over the "
+                             "scatters. 'greedy' fills the scatters one by "
+                             "one in the order of the input. 'lpt' (longest "
+                             "processing time first) and 'kk' "
+                             "(Karmarkar-Karp) minimize the size of the "
+                             "largest scatter, but the scatters are less "
+                             "contiguous. 'kk' is usually the most even but "
+                             "also the slowest. 'contiguous' cuts the merged "
+                             "regions into exactly --scatter-count "
+                             "contiguous scatters of about equal size, which "
+                             "keeps the number of intervals per scatter "
+                             "low.")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Read the input twice instead of keeping all "
+                             "regions in memory, and write each scatter as "
+                             "soon as it is complete. Only possible with the "
+                             "greedy strategy and without "
+                             "--mix-small-regions. With --threads, the "
+                             "regions of up to --threads contigs are read "
+                             "ahead.")
     return parser
 
 
+def run(args: argparse.Namespace) -> List[str]:
+    """Scatter the input and write the output files."""
+    report = ScatterReport("safe-scatter") if args.report else None
+    timer = report.timer if report is not None else None
+    exclude, cut_sites = interval_options(args, timer)
+    with stage(timer, "weights"):
+        weight = (file_to_weights(args.weights, args.use_index)
+                  if args.weights else len)
+    if report is not None:
+        # Report the cost of each scatter too.
+        report.weight = weight
+    if args.streaming:
+        # Each bin is written as soon as it is complete.
+        return write_scatters(timed(timer, "scatter", streaming_safe_scatter(
+            lambda: input_regions(args, exclude, timer), args.scatter_count,
+            args.min_scatter_size, weight=weight, cut_sites=cut_sites)),
+            args, report)
+    # We need all regions instead of an iterator. They are stored compactly.
+    if args.sort:
+        regions = RegionArray(input_regions(args, exclude, timer))
+    else:
+        with stage(timer, "parse"):
+            regions = file_to_region_array(args.input, args.use_index,
+                                           args.threads)
+        if exclude is not None:
+            with stage(timer, "exclude"):
+                regions = RegionArray(subtract_regions(regions, exclude))
+    with stage(timer, "scatter"):
+        scattered_chunks = list(safe_scatter(regions, args.scatter_count,
+                                             args.min_scatter_size,
+                                             mix=args.mix_small_regions,
+                                             weight=weight,
+                                             strategy=args.strategy,
+                                             cut_sites=cut_sites))
+    return write_scatters(scattered_chunks, args, report)
+
+
 def main():
-    args = argument_parser().parse_args()
-    # We need all regions instead of an iterator
-    regions = list(file_to_regions(args.input))
-    scattered_chunks = list(safe_scatter(regions, args.scatter_count,
-                                         args.min_scatter_size,
-                                         mix=args.mix_small_regions))
-    out_files = region_lists_to_scatter_files(scattered_chunks, args.prefix)
+    parser = argument_parser()
+    args = parser.parse_args()
+    if args.streaming and (args.strategy != "greedy" or
+                           args.mix_small_regions or args.input == STDIN):
+        parser.error("--streaming requires the greedy strategy, can not be "
+                     "combined with --mix-small-regions and can not read "
+                     "from STDIN.")
+    with profile(args.profile):
+        out_files = cached_run("safe-scatter", args, run)
     if args.print_paths:
         print("\n".join(out_files))
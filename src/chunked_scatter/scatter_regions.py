@@ -19,43 +19,25 @@
 # SOFTWARE.
 
 import argparse
-from typing import Generator, Iterable, List
+from typing import Generator, Iterable, List, Optional
 
-from .chunked_scatter import chunked_scatter, common_parser, \
-    region_lists_to_scatter_files
-from .parsers import BedRegion, file_to_regions
+from .cache import cached_run
+from .chunked_scatter import chunked_scatter, common_parser, input_regions, \
+    interval_options, write_scatters
+from .intervals import IntervalIndex
+from .parsers import BedRegion
+from .profiling import profile, profiled
+from .regions import merge_regions
+from .report import ScatterReport, timed
 
 DEFAULT_SCATTER_SIZE = 10**9
 
 
-def merge_regions(regions: Iterable[BedRegion]
-                  ) -> Generator[BedRegion, None, None]:
-    """
-    Merge regions that overlap or are exactly adjacent
-    :param regions: An iterable of possibly overlapping regions
-    :return: a generator of merged regions
-    """
-    merged_region = None
-    for region in regions:
-        if merged_region is None:
-            merged_region = region
-        else:
-            if (merged_region.contig == region.contig and
-                    merged_region.end >= region.start and
-                    region.end >= merged_region.start):
-                start = min(merged_region.start, region.start)
-                end = max(merged_region.end, region.end)
-                merged_region = BedRegion(merged_region.contig, start, end)
-            else:
-                yield merged_region
-                merged_region = region
-    if merged_region:
-        yield merged_region
-
-
+@profiled("scatter_regions")
 def scatter_regions(regions: Iterable[BedRegion],
                     scattersize: int,
                     contigs_can_be_split: bool = False,
+                    cut_sites: Optional[IntervalIndex] = None,
                     ) -> Generator[List[BedRegion], None, None]:
     """
     Interface to chunked_scatter with sane defaults that make it function
@@ -65,6 +47,7 @@ def scatter_regions(regions: Iterable[BedRegion],
     :param scattersize: What the size of the scatter should be.
     :param contigs_can_be_split: Whether contigs (chr1, for example) are
     allowed to be split across multiple lists.
+    :param cut_sites: Allowed cut sites, regions are cut at the nearest one.
     :return: Yields lists of BedRegions which can be converted into bed files.
     """
     region_lists = chunked_scatter(regions,
@@ -72,7 +55,8 @@ def scatter_regions(regions: Iterable[BedRegion],
                                    list_size=scattersize,
                                    overlap=0,
                                    size_is_maximum=True,
-                                   contigs_can_be_split=contigs_can_be_split)
+                                   contigs_can_be_split=contigs_can_be_split,
+                                   cut_sites=cut_sites)
     for region_list in region_lists:
         yield list(merge_regions(region_list))
 
@@ -97,11 +81,20 @@ def argument_parser() -> argparse.ArgumentParser:
     return parser
 
 
+def run(args: argparse.Namespace) -> List[str]:
+    """Scatter the input and write the output files."""
+    report = ScatterReport("scatter-regions") if args.report else None
+    timer = report.timer if report is not None else None
+    exclude, cut_sites = interval_options(args, timer)
+    scattered_chunks = timed(timer, "scatter", scatter_regions(
+        input_regions(args, exclude, timer), args.scatter_size,
+        contigs_can_be_split=args.split_contigs, cut_sites=cut_sites))
+    return write_scatters(scattered_chunks, args, report)
+
+
 def main():
     args = argument_parser().parse_args()
-    scattered_chunks = scatter_regions(file_to_regions(args.input),
-                                       args.scatter_size,
-                                       contigs_can_be_split=args.split_contigs)
-    out_files = region_lists_to_scatter_files(scattered_chunks, args.prefix)
+    with profile(args.profile):
+        out_files = cached_run("scatter-regions", args, run)
     if args.print_paths:
         print("\n".join(out_files))
@@ -0,0 +1,133 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+from typing import Callable, Iterable, List, Optional, Union
+
+from .chunked_scatter import chunked_scatter
+from .intervals import IntervalIndex, subtract_regions
+from .parsers import file_to_region_array, file_to_regions
+from .regions import BedRegion, RegionArray
+from .safe_scatter import safe_scatter
+from .scatter_regions import DEFAULT_SCATTER_SIZE, scatter_regions
+from .weights import file_to_weights
+
+
+class Scatterer:
+    """
+    Regions that are loaded once, from which any number of scatter plans can
+    be made. The plans are returned as lists of regions instead of being
+    written to files.
+    """
+    def __init__(self, regions: Iterable[BedRegion],
+                 exclude: Optional[IntervalIndex] = None,
+                 cut_sites: Optional[IntervalIndex] = None,
+                 weight: Callable[[BedRegion], float] = len):
+        """
+        :param regions: The regions over which to scatter.
+        :param exclude: Regions that are removed from the regions.
+        :param cut_sites: Allowed cut sites, regions are cut at the nearest
+        one.
+        :param weight: A function returning the cost of a region, on which
+        safe_scatter balances the scatters.
+        """
+        if exclude is not None:
+            regions = subtract_regions(regions, exclude)
+        self.regions = (regions if isinstance(regions, RegionArray)
+                        else RegionArray(regions))
+        self.cut_sites = cut_sites
+        self.weight = weight
+
+    @classmethod
+    def from_file(cls, in_file: Union[str, os.PathLike],
+                  use_index: bool = False,
+                  threads: int = 1,
+                  exclude: Optional[Union[str, os.PathLike]] = None,
+                  cut_sites: Optional[Union[str, os.PathLike]] = None,
+                  weights: Optional[Union[str, os.PathLike]] = None
+                  ) -> "Scatterer":
+        """
+        Load the regions from a file, in any of the supported input formats.
+        :param in_file: The input file.
+        :param use_index: Derive the regions of VCF and BCF files from their
+        index.
+        :param threads: The number of processes used to read the file.
+        :param exclude: A file with regions that are removed from the input.
+        :param cut_sites: A file with the allowed cut sites.
+        :param weights: The cost on which safe_scatter balances the
+        scatters: a VCF or BCF file (the variants), a BAM or CRAM file (the
+        reads) or a BED or bedGraph cost profile. See file_to_weights.
+        """
+        return cls(
+            file_to_region_array(in_file, use_index, threads),
+            exclude=IntervalIndex(file_to_regions(exclude)) if exclude
+            else None,
+            cut_sites=IntervalIndex(file_to_regions(cut_sites)) if cut_sites
+            else None,
+            weight=file_to_weights(weights, use_index) if weights else len)
+
+    def chunked_scatter(self, chunk_size: int = 10**6, overlap: int = 150,
+                        minimum_bp_per_file: int = 45 * 10**6,
+                        contigs_can_be_split: bool = False
+                        ) -> List[List[BedRegion]]:
+        """
+        Scatter the regions like the chunked-scatter program.
+        :param chunk_size: The size of each chunk.
+        :param overlap: How much overlap there should be between chunks.
+        :param minimum_bp_per_file: The minimum number of base pairs in each
+        scatter.
+        :param contigs_can_be_split: Whether contigs are allowed to be split
+        across multiple scatters.
+        :return: A list of scatters, each a list of regions.
+        """
+        return list(chunked_scatter(self.regions, chunk_size, overlap,
+                                    minimum_bp_per_file,
+                                    contigs_can_be_split=contigs_can_be_split,
+                                    cut_sites=self.cut_sites))
+
+    def scatter_regions(self, scatter_size: int = DEFAULT_SCATTER_SIZE,
+                        contigs_can_be_split: bool = False
+                        ) -> List[List[BedRegion]]:
+        """
+        Scatter the regions like the scatter-regions program.
+        :param scatter_size: The maximum size of each scatter.
+        :param contigs_can_be_split: Whether contigs are allowed to be split
+        across multiple scatters.
+        :return: A list of scatters, each a list of regions.
+        """
+        return list(scatter_regions(self.regions, scatter_size,
+                                    contigs_can_be_split=contigs_can_be_split,
+                                    cut_sites=self.cut_sites))
+
+    def safe_scatter(self, scatter_count: int, min_scatter_size: int = 10000,
+                     mix: bool = False, strategy: str = "greedy"
+                     ) -> List[List[BedRegion]]:
+        """
+        Scatter the regions like the safe-scatter program.
+        :param scatter_count: The number of scatters to create.
+        :param min_scatter_size: The minimum size of a scattered region.
+        :param mix: Mix small regions in between large regions.
+        :param strategy: How the regions are divided over the scatters.
+        :return: A list of scatters, each a list of regions.
+        """
+        return list(safe_scatter(self.regions, scatter_count,
+                                 min_scatter_size, mix=mix,
+                                 weight=self.weight, strategy=strategy,
+                                 cut_sites=self.cut_sites))
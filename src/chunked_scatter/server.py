@@ -0,0 +1,266 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+A long running server that scatters on request, over a Unix socket. The
+regions of each input are parsed once and kept in memory, so a request only
+has to scatter and write the output files.
+
+Each request is a single line of JSON with the program, its command line
+arguments and the working directory of the client. The response is a single
+line of JSON with the output paths or an error.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from . import chunked_scatter, safe_scatter, scatter_regions
+from .cache import FILE_ARGUMENTS, cached_run
+from .chunked_scatter import input_regions, interval_options, \
+    write_scatters
+from .client import default_socket
+from .parsers import STDIN, file_to_region_array
+from .regions import BedRegion, RegionArray
+from .report import ScatterReport, stage
+from .scatterer import Scatterer
+from .weights import file_to_weights
+
+DEFAULT_LOADED_INPUTS = 16
+# These arguments are paths, which are relative to the directory of the
+# client.
+PATH_ARGUMENTS = FILE_ARGUMENTS | {"prefix", "cache_dir", "report"}
+
+Plan = Callable[[Scatterer, argparse.Namespace], List[List[BedRegion]]]
+
+PROGRAMS: Dict[str, Tuple[Callable[[], argparse.ArgumentParser], Plan]] = {
+    "chunked-scatter": (
+        chunked_scatter.argument_parser,
+        lambda scatterer, args: scatterer.chunked_scatter(
+            args.chunk_size, args.overlap, args.minimum_bp_per_file,
+            args.split_contigs)),
+    "scatter-regions": (
+        scatter_regions.argument_parser,
+        lambda scatterer, args: scatterer.scatter_regions(
+            args.scatter_size, args.split_contigs)),
+    "safe-scatter": (
+        safe_scatter.argument_parser,
+        lambda scatterer, args: scatterer.safe_scatter(
+            args.scatter_count, args.min_scatter_size,
+            args.mix_small_regions, args.strategy)),
+}
+
+
+def parse_request(program: str, arguments: List[str]) -> argparse.Namespace:
+    """
+    Parse the arguments of a request with the parser of the program.
+    :raises ValueError: When the arguments are invalid.
+    """
+    if program not in PROGRAMS:
+        raise ValueError(f"Unknown program '{program}'. Choose from: "
+                         f"{', '.join(PROGRAMS)}.")
+    parser = PROGRAMS[program][0]()
+
+    def error(message: str):
+        raise ValueError(message)
+    # The parser should not print the error and exit the server.
+    setattr(parser, "error", error)
+    try:
+        args = parser.parse_args(arguments)
+    except SystemExit:
+        raise ValueError("--help is not available on the server.")
+    if args.profile is not None:
+        raise ValueError("--profile is not available on the server.")
+    if getattr(args, "streaming", False):
+        # The server keeps the regions in memory, which --streaming avoids.
+        raise ValueError("--streaming is not available on the server.")
+    return args
+
+
+def absolute_paths(args: argparse.Namespace, cwd: str) -> argparse.Namespace:
+    """
+    Return a copy of the arguments in which the paths are absolute, using the
+    directory of the client.
+    :raises ValueError: When the input is read from STDIN.
+    """
+    args = argparse.Namespace(**vars(args))
+    for name in PATH_ARGUMENTS:
+        value = getattr(args, name, None)
+        if value == STDIN:
+            raise ValueError("Reading from STDIN is not possible on the "
+                             "server.")
+        if value is not None:
+            setattr(args, name, os.path.join(cwd, value))
+    return args
+
+
+class ScatterServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    """
+    Serves scatter requests. The most recently used inputs are kept in
+    memory as Scatterer objects.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str,
+                 loaded_inputs: int = DEFAULT_LOADED_INPUTS):
+        super().__init__(socket_path, ScatterRequestHandler)
+        self.loaded_inputs = loaded_inputs
+        self.scatterers: \
+            "collections.OrderedDict[tuple, concurrent.futures.Future]" = \
+            collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def scatterer(self, args: argparse.Namespace) -> Scatterer:
+        """
+        Return the Scatterer for the input files and options of a request.
+        Inputs are identified by their path, size and modification time, so
+        a changed file is read again.
+        """
+        key_parts: List = [args.use_index, args.min_gap_size, args.sort]
+        for name in sorted(FILE_ARGUMENTS):
+            path = getattr(args, name, None)
+            if path is not None:
+                stat = os.stat(path)
+                path = (path, stat.st_size, stat.st_mtime_ns)
+            key_parts.append(path)
+        key = tuple(key_parts)
+        # Only the lookup is done under the lock. The first request for an
+        # input loads it; concurrent requests for the same input wait for
+        # its future, and requests for other inputs do not wait at all.
+        with self.lock:
+            future = self.scatterers.get(key)
+            loading = future is None
+            if future is None:
+                future = concurrent.futures.Future()
+                self.scatterers[key] = future
+                if len(self.scatterers) > self.loaded_inputs:
+                    self.scatterers.popitem(last=False)
+            self.scatterers.move_to_end(key)
+        if loading:
+            try:
+                future.set_result(self.load(args))
+            except BaseException as error:
+                with self.lock:
+                    if self.scatterers.get(key) is future:
+                        del self.scatterers[key]
+                future.set_exception(error)
+        return future.result()
+
+    @staticmethod
+    def load(args: argparse.Namespace) -> Scatterer:
+        """Read the input files of a request into a Scatterer."""
+        exclude, cut_sites = interval_options(args)
+        weights = getattr(args, "weights", None)
+        return Scatterer(
+            RegionArray(input_regions(args)) if args.sort
+            else file_to_region_array(args.input, args.use_index,
+                                      args.threads),
+            exclude, cut_sites,
+            file_to_weights(weights, args.use_index) if weights else len)
+
+    def scatter(self, program: str, arguments: List[str], cwd: str
+                ) -> dict:
+        """
+        Handle a request: scatter the input and write the output files.
+        :return: The response, with the output paths relative to the
+        directory of the client if the prefix was.
+        """
+        client_args = parse_request(program, arguments)
+        args = absolute_paths(client_args, cwd)
+        plan = PROGRAMS[program][1]
+
+        def run(args: argparse.Namespace) -> List[str]:
+            report = ScatterReport(program) if args.report else None
+            timer = report.timer if report is not None else None
+            # Only inputs that are not loaded yet are parsed.
+            with stage(timer, "parse"):
+                scatterer = self.scatterer(args)
+            if report is not None:
+                report.weight = scatterer.weight
+            with stage(timer, "scatter"):
+                region_lists = plan(scatterer, args)
+            return write_scatters(region_lists, args, report)
+
+        out_files = cached_run(program, args, run)
+        return {"paths": [client_args.prefix + path[len(args.prefix):]
+                          for path in out_files],
+                "print_paths": client_args.print_paths}
+
+
+class ScatterRequestHandler(socketserver.StreamRequestHandler):
+    server: ScatterServer
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = self.server.scatter(request["program"],
+                                           request["args"], request["cwd"])
+        except ValueError as error:
+            response = {"error": str(error), "status": 2}
+        except Exception as error:
+            response = {"error": f"{type(error).__name__}: {error}",
+                        "status": 1}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def argument_parser() -> argparse.ArgumentParser:
+    """Argument parser for the scatter-server program."""
+    parser = argparse.ArgumentParser(
+        description="Serve chunked-scatter, scatter-regions and "
+                    "safe-scatter requests from scatter-client over a Unix "
+                    "socket. The regions of each input are read once and "
+                    "kept in memory.")
+    parser.add_argument("--socket", type=str, default=default_socket(),
+                        help="The path of the Unix socket. Defaults to "
+                             "$CHUNKED_SCATTER_SOCKET or a socket in the "
+                             "temporary directory.")
+    parser.add_argument("--loaded-inputs", type=int,
+                        default=DEFAULT_LOADED_INPUTS,
+                        help=f"The number of inputs that are kept in memory. "
+                             f"Default {DEFAULT_LOADED_INPUTS}.")
+    return parser
+
+
+def main():
+    args = argument_parser().parse_args()
+    # A socket that is left behind by a server that was killed.
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    # Remove the socket when the server is stopped by a scheduler.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with ScatterServer(args.socket, args.loaded_inputs) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,120 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import heapq
+import itertools
+import re
+import tempfile
+from typing import Callable, Dict, Generator, Iterable, List, Optional, \
+    Tuple
+
+from .regions import BedRegion
+
+# The number of regions that is sorted in memory. Larger inputs are sorted in
+# parts that are written to temporary files and merged.
+DEFAULT_SORT_BUFFER_SIZE = 10**6
+
+DIGITS = re.compile(r"(\d+)")
+
+
+def natural_key(contig: str) -> tuple:
+    """
+    A sort key that orders the numbers in contig names by value, so chr2
+    comes before chr10.
+    """
+    # re.split with a group alternates text and numbers, so the elements
+    # that are compared always have the same type.
+    parts: List = DIGITS.split(contig)
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+
+def region_sort_key(contig_order: Optional[Iterable[str]] = None
+                    ) -> Callable[[BedRegion], tuple]:
+    """
+    Create a sort key for regions. Regions are sorted on contig, start and
+    end.
+    :param contig_order: The order of the contigs, for example from a
+    sequence dictionary. Contigs that are not in it come after the others,
+    in natural order. When not given all contigs are in natural order.
+    :return: A function that returns the sort key of a region.
+    """
+    order = {contig: index for index, contig in
+             enumerate(contig_order or [])}
+    contig_keys: Dict[str, Tuple[int, tuple]] = {}
+
+    def key(region: BedRegion) -> tuple:
+        contig, start, end = region
+        try:
+            contig_key = contig_keys[contig]
+        except KeyError:
+            contig_key = ((order[contig], ()) if contig in order
+                          else (len(order), natural_key(contig)))
+            contig_keys[contig] = contig_key
+        return contig_key, start, end
+    return key
+
+
+def _write_spill_file(directory: str, regions: List[BedRegion]) -> str:
+    spill_file_h = tempfile.NamedTemporaryFile(
+        "wt", dir=directory, suffix=".bed", delete=False)
+    with spill_file_h:
+        spill_file_h.write("".join(f"{contig}\t{start}\t{end}\n"
+                                   for contig, start, end in regions))
+    return spill_file_h.name
+
+
+def _read_spill_file(spill_file: str) -> Generator[BedRegion, None, None]:
+    with open(spill_file, "rt") as spill_file_h:
+        for line in spill_file_h:
+            contig, start, end = line.rstrip("\n").split("\t")
+            yield BedRegion(contig, int(start), int(end))
+
+
+def sort_regions(regions: Iterable[BedRegion],
+                 contig_order: Optional[Iterable[str]] = None,
+                 buffer_size: int = DEFAULT_SORT_BUFFER_SIZE,
+                 temp_dir: Optional[str] = None
+                 ) -> Generator[BedRegion, None, None]:
+    """
+    Sort regions with an external merge sort. At most buffer_size regions
+    are sorted in memory at a time. When there are more regions, each sorted
+    part is written to a temporary file and the files are merged.
+    :param regions: The regions to sort.
+    :param contig_order: The order of the contigs, see region_sort_key.
+    :param buffer_size: The number of regions that is sorted in memory.
+    :param temp_dir: The directory for the temporary files. Defaults to the
+    temporary directory of the system.
+    :return: A generator of the sorted regions.
+    """
+    key = region_sort_key(contig_order)
+    region_iter = iter(regions)
+    buffer = sorted(itertools.islice(region_iter, buffer_size), key=key)
+    if len(buffer) < buffer_size:
+        yield from buffer
+        return
+    with tempfile.TemporaryDirectory(dir=temp_dir,
+                                     prefix="chunked-scatter-") as directory:
+        spill_files = []
+        while buffer:
+            spill_files.append(_write_spill_file(directory, buffer))
+            buffer = sorted(itertools.islice(region_iter, buffer_size),
+                            key=key)
+        yield from heapq.merge(*map(_read_spill_file, spill_files), key=key)
@@ -0,0 +1,279 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Weights describe the cost of processing genomic intervals. They can be used
+by the scatter functions to balance on cost rather than on length.
+"""
+
+import os
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Dict, Generator, Iterable, List, Optional, Tuple, \
+    Union
+
+from .indexes import find_alignment_index, find_index, read_index
+from .parsers import BedRegion, COMPRESSION_EXTENSIONS, open_input, \
+    vcf_contig_lengths, vcf_contig_names
+
+# Extensions of cost profiles: BED or bedGraph files with the cost of each
+# interval in the fourth column.
+COST_PROFILE_EXTENSIONS = (".bedgraph", ".bg", ".bed")
+
+# Variants are counted in windows of the same size as the smallest bins of a
+# tabix index.
+VARIANT_WINDOW_SIZE = 2**14
+
+
+class RegionWeights:
+    """
+    The cost of genomic intervals. The cost of an interval is assumed to be
+    spread evenly over its length. Calling the object with a region returns
+    the cost of that region, so it can be used in place of ``len``.
+    """
+    def __init__(self, intervals: Iterable[Tuple[str, int, int, float]],
+                 default_density: Optional[float] = 0.0):
+        """
+        :param intervals: Tuples of contig, start, end and cost. The
+        intervals may overlap, in which case the costs add up.
+        :param default_density: The cost per base of bases that are not in
+        any interval. None uses the mean cost per base of the intervals.
+        """
+        # Per contig and position the change in density and in the number of
+        # intervals covering the position.
+        events: Dict[str, Dict[int, List[float]]] = defaultdict(
+            lambda: defaultdict(lambda: [0.0, 0]))
+        self._total = 0.0
+        for contig, start, end, cost in intervals:
+            if end <= start:
+                continue
+            density = cost / (end - start)
+            events[contig][start][0] += density
+            events[contig][start][1] += 1
+            events[contig][end][0] -= density
+            events[contig][end][1] -= 1
+            self._total += cost
+        # For each contig the positions where the cost density changes and
+        # whether the bases after them are covered by an interval.
+        segments: Dict[str, Tuple[List[int], List[float], List[bool]]] = {}
+        covered_bases = 0
+        for contig, changes in events.items():
+            positions = sorted(changes)
+            densities: List[float] = []
+            covered: List[bool] = []
+            density, coverage = 0.0, 0
+            for index, position in enumerate(positions):
+                density += changes[position][0]
+                coverage += int(changes[position][1])
+                densities.append(density)
+                covered.append(coverage > 0)
+                if coverage > 0:
+                    covered_bases += positions[index + 1] - position
+            segments[contig] = (positions, densities, covered)
+        if default_density is None:
+            default_density = (self._total / covered_bases if covered_bases
+                               else 0.0)
+        self.default_density = default_density
+        # For each contig store the positions where the cost density changes,
+        # the cumulative cost at those positions and the density after them.
+        self._contigs: Dict[str, Tuple[List[int], List[float],
+                                       List[float]]] = {}
+        for contig, (positions, densities, covered) in segments.items():
+            densities = [density if is_covered else default_density
+                         for density, is_covered in zip(densities, covered)]
+            cumulative: List[float] = []
+            total = default_density * positions[0]
+            density, previous = default_density, positions[0]
+            for position, next_density in zip(positions, densities):
+                total += density * (position - previous)
+                cumulative.append(total)
+                density, previous = next_density, position
+            self._contigs[contig] = (positions, cumulative, densities)
+
+    def cumulative_cost(self, contig: str, position: int) -> float:
+        """Return the cost of the contig up to the given position."""
+        try:
+            positions, cumulative, densities = self._contigs[contig]
+        except KeyError:
+            return self.default_density * position
+        index = bisect_right(positions, position) - 1
+        if index < 0:
+            return self.default_density * position
+        return (cumulative[index] +
+                densities[index] * (position - positions[index]))
+
+    def __call__(self, region: BedRegion) -> float:
+        return (self.cumulative_cost(region.contig, region.end) -
+                self.cumulative_cost(region.contig, region.start))
+
+    def total(self) -> float:
+        """Return the total cost of all intervals."""
+        return self._total
+
+
+def index_weights(index_file: Union[str, os.PathLike],
+                  contig_names: List[str],
+                  contig_lengths: Optional[Dict[str, int]] = None
+                  ) -> RegionWeights:
+    """
+    Estimate the number of records per index bin. The number of records of
+    each contig is divided over its bins according to the amount of data in
+    each bin. For indexes without record counts, such as .crai, the amount of
+    data is used as the weight.
+    :param index_file: The tabix, CSI, BAI or CRAI index.
+    :param contig_names: The contig names in the order of the file header.
+    :param contig_lengths: The lengths of the contigs, when known. Bins are
+    clipped to the contig, so the records of a bin that reaches past the end
+    of a short contig, such as a bin that htslib merged into its parent, are
+    not spread over bases that do not exist.
+    :return: A RegionWeights object.
+    """
+    if contig_lengths is None:
+        contig_lengths = {}
+    intervals = []
+    for contig in read_index(index_file, contig_names):
+        total_size = sum(size for _, _, size in contig.bins)
+        if total_size == 0:
+            continue
+        records = (contig.records if contig.records is not None
+                   else total_size)
+        length = contig_lengths.get(contig.name)
+        for start, end, size in contig.bins:
+            if length is not None and start < length:
+                end = min(end, length)
+            intervals.append((contig.name, start, end,
+                              records * size / total_size))
+    return RegionWeights(intervals)
+
+
+def vcf_file_to_weights(in_file: Union[str, os.PathLike],
+                        use_index: bool = False) -> RegionWeights:
+    """
+    Use the number of variants in a VCF or BCF file as weights.
+    :param in_file: The VCF or BCF file.
+    :param use_index: Estimate the number of variants from the index rather
+    than counting the records. When no index is present the records are
+    counted anyway.
+    :return: A RegionWeights object.
+    """
+    # pysam takes a long time to import, so only import it when needed.
+    from pysam import VariantFile
+    vcf = VariantFile(in_file, mode="r")
+    try:
+        index_file = find_index(in_file) if use_index else None
+        contig_lengths = vcf_contig_lengths(vcf)
+        if index_file is not None:
+            return index_weights(index_file, vcf_contig_names(vcf),
+                                 contig_lengths)
+        counts: Dict[Tuple[str, int], int] = defaultdict(int)
+        for variant in vcf:
+            counts[(variant.contig,
+                    variant.start // VARIANT_WINDOW_SIZE)] += 1
+    finally:
+        vcf.close()
+    intervals = []
+    for (contig, window), count in counts.items():
+        start = window * VARIANT_WINDOW_SIZE
+        end = start + VARIANT_WINDOW_SIZE
+        # The last window of a contig is clipped to its length.
+        length = contig_lengths.get(contig)
+        if length is not None and start < length:
+            end = min(end, length)
+        intervals.append((contig, start, end, count))
+    return RegionWeights(intervals)
+
+
+def alignment_file_to_weights(in_file: Union[str, os.PathLike]
+                              ) -> RegionWeights:
+    """
+    Use the number of mapped reads in a BAM or CRAM file as weights. The
+    number of reads is estimated from the index, so no reads are decoded.
+    Only the header of the file is read, for the contig names and lengths.
+    :param in_file: The BAM or CRAM file. It must have a .bai, .csi or .crai
+    index.
+    :return: A RegionWeights object.
+    """
+    index_file = find_alignment_index(in_file)
+    if index_file is None:
+        raise FileNotFoundError(f"No .bai, .csi or .crai index found for: "
+                                f"'{os.fspath(in_file)}'.")
+    # pysam takes a long time to import, so only import it when needed.
+    from pysam import AlignmentFile
+    with AlignmentFile(os.fspath(in_file)) as alignment_file:
+        contig_names = list(alignment_file.references)
+        contig_lengths = dict(zip(alignment_file.references,
+                                  alignment_file.lengths))
+    return index_weights(index_file, contig_names, contig_lengths)
+
+
+def read_cost_profile(in_file: Union[str, os.PathLike]
+                      ) -> Generator[Tuple[str, int, int, float], None, None]:
+    """
+    Read a cost profile: a BED or bedGraph file with the cost of each interval
+    (for example the number of seconds it takes to process) in the fourth
+    column. Track, browser and comment lines are skipped.
+    :param in_file: The cost profile. It may be gzip compressed.
+    :return: A generator of tuples of contig, start, end and cost.
+    """
+    with open_input(in_file, "rt") as in_file_h:
+        for line in in_file_h:
+            fields = line.split(None, 4)
+            if (len(fields) < 4 or fields[0] in ("browser", "track") or
+                    fields[0].startswith("#")):
+                continue
+            yield fields[0], int(fields[1]), int(fields[2]), float(fields[3])
+
+
+def cost_profile_to_weights(in_file: Union[str, os.PathLike]
+                            ) -> RegionWeights:
+    """
+    Use a cost profile as weights. The cost of each interval is spread evenly
+    over its length. Bases outside the profile, such as new targets or
+    contigs, get the mean cost per base of the profile, so they are spread
+    over the scatters like the rest.
+    :param in_file: The BED or bedGraph file, see read_cost_profile.
+    :return: A RegionWeights object.
+    """
+    return RegionWeights(read_cost_profile(in_file), default_density=None)
+
+
+def file_to_weights(in_file: Union[str, os.PathLike],
+                    use_index: bool = False) -> RegionWeights:
+    """
+    Read weights from a file. The format is detected by the extension.
+    :param in_file: The file describing the weights.
+    :param use_index: Use the index of the file, when that is possible.
+    :return: A RegionWeights object.
+    """
+    path = os.fspath(in_file)
+    if path.endswith((".vcf", ".vcf.gz", ".bcf")):
+        return vcf_file_to_weights(in_file, use_index)
+    if path.endswith((".bam", ".cram")):
+        return alignment_file_to_weights(in_file)
+    uncompressed = path
+    for extension in COMPRESSION_EXTENSIONS:
+        if uncompressed.endswith(extension):
+            uncompressed = uncompressed[:-len(extension)]
+    if uncompressed.lower().endswith(COST_PROFILE_EXTENSIONS):
+        return cost_profile_to_weights(in_file)
+    raise NotImplementedError(
+        f"Unknown weights format for file: '{path}'. Supported extensions "
+        f"are: '.vcf', '.vcf.gz', '.bcf', '.bam', '.cram', '.bedgraph', "
+        f"'.bg', '.bed'.")
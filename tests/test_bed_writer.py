@@ -21,7 +21,9 @@ from pathlib import Path
 from typing import List
 
 from chunked_scatter.chunked_scatter import BedRegion, \
-    region_lists_to_scatter_files
+    region_lists_to_scatter_files, write_bed_file
+
+import pytest
 
 
 def test_bed_writer(tmpdir):
@@ -42,3 +44,28 @@ def test_bed_writer(tmpdir):
     assert Path(temp, "scatter-1.bed").exists()
     assert Path(temp, "scatter-1.bed").read_text() == (
         "sparta_and_allies\t0\t4300\npersian_casualties\t0\t20000\n")
+
+
+def test_bed_writer_threads(tmpdir):
+    temp = Path(str(tmpdir))
+    region_lists = ([BedRegion("chr1", i, i + 10)] * (i + 1)
+                    for i in range(20))
+    out_files = region_lists_to_scatter_files(region_lists,
+                                              str(temp / "scatter-"),
+                                              threads=4)
+    assert out_files == [str(temp / f"scatter-{i}.bed") for i in range(20)]
+    assert Path(out_files[2]).read_text() == "chr1\t2\t12\n" * 3
+    # No temporary files are left behind.
+    assert sorted(path.name for path in temp.iterdir()) == sorted(
+        Path(out_file).name for out_file in out_files)
+
+
+def test_write_bed_file_failure(tmpdir):
+    def failing_regions():
+        yield BedRegion("chr1", 0, 10)
+        raise RuntimeError("Failed")
+
+    out_file = Path(str(tmpdir), "scatter-0.bed")
+    with pytest.raises(RuntimeError):
+        write_bed_file(str(out_file), failing_regions())
+    assert list(Path(str(tmpdir)).iterdir()) == []
@@ -0,0 +1,130 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+from pathlib import Path
+
+from chunked_scatter import cache
+from chunked_scatter.cache import cache_key, cached_run, evict
+from chunked_scatter.safe_scatter import argument_parser, run
+
+DATA_DIR = Path(__file__).parent / Path("data")
+REF_DICT = str(Path(DATA_DIR, "ref.dict"))
+
+
+def parse(*arguments: str):
+    return argument_parser().parse_args(list(arguments))
+
+
+def test_cache_key():
+    key = cache_key("safe-scatter", parse("-c", "3", REF_DICT))
+    # Output options do not change the scatters.
+    assert key == cache_key("safe-scatter",
+                            parse("-c", "3", REF_DICT, "-p", "out-", "-P",
+                                  "-t", "4"))
+    assert key != cache_key("safe-scatter", parse("-c", "4", REF_DICT))
+    assert key != cache_key("scatter-regions", parse("-c", "3", REF_DICT))
+    assert cache_key("safe-scatter", parse("-c", "3", "-")) is None
+
+
+def test_cache_key_input_contents(tmpdir):
+    bed = tmpdir / "regions.bed"
+    bed.write("chr1\t0\t100000\n")
+    key = cache_key("safe-scatter", parse("-c", "3", str(bed)))
+    bed.write("chr1\t0\t200000\n")
+    assert key != cache_key("safe-scatter", parse("-c", "3", str(bed)))
+
+
+def test_cache_key_indexed_input(tmpdir, monkeypatch):
+    vcf = str(tmpdir / "bins.vcf.gz")
+    shutil.copyfile(str(DATA_DIR / "bins.vcf.gz"), vcf)
+    shutil.copyfile(str(DATA_DIR / "bins.vcf.gz.tbi"), vcf + ".tbi")
+    checksummed = []
+
+    def recording_checksum(in_file):
+        checksummed.append(in_file)
+        return os.path.basename(in_file)
+
+    monkeypatch.setattr(cache, "file_checksum", recording_checksum)
+    key = cache_key("safe-scatter", parse("-c", "3", "--use-index", vcf))
+    # Only the index of an indexed input is read.
+    assert checksummed == [vcf + ".tbi"]
+    assert key == cache_key("safe-scatter",
+                            parse("-c", "3", "--use-index", vcf))
+    os.utime(vcf, ns=(0, 0))
+    assert key != cache_key("safe-scatter",
+                            parse("-c", "3", "--use-index", vcf))
+    # Without --use-index the whole input is read.
+    cache_key("safe-scatter", parse("-c", "3", vcf))
+    assert checksummed[-1] == vcf
+
+
+def test_cache_key_reference_index(tmpdir):
+    bed = tmpdir / "regions.bed"
+    bed.write("chr1\t0\t100000\n")
+    fasta = tmpdir / "ref.fasta"
+    fasta.write(">chr1\nACGTNNNNACGT\n")
+    key = cache_key("safe-scatter",
+                    parse("-c", "3", "--reference", str(fasta), str(bed)))
+    (tmpdir / "ref.fasta.fai").write("chr1\t12\t6\t12\t13\n")
+    assert key != cache_key("safe-scatter",
+                            parse("-c", "3", "--reference", str(fasta),
+                                  str(bed)))
+
+
+def test_cached_run(tmpdir):
+    cache_dir = str(tmpdir / "cache")
+    runs = []
+
+    def counting_run(args):
+        runs.append(args)
+        return run(args)
+
+    first = cached_run("safe-scatter", parse(
+        "-c", "3", REF_DICT, "-p", str(tmpdir / "first-"),
+        "--cache-dir", cache_dir), counting_run)
+    second = cached_run("safe-scatter", parse(
+        "-c", "3", REF_DICT, "-p", str(tmpdir / "second-"),
+        "--cache-dir", cache_dir), counting_run)
+    assert len(runs) == 1
+    assert second == [str(tmpdir / f"second-{i}.bed") for i in range(3)]
+    for first_file, second_file in zip(first, second):
+        assert Path(first_file).read_text() == Path(second_file).read_text()
+
+
+def test_cached_run_manifest(tmpdir):
+    cache_dir = str(tmpdir / "cache")
+    for prefix in ("first-", "second-"):
+        out_files = cached_run("safe-scatter", parse(
+            "-c", "3", REF_DICT, "--manifest", "-p", str(tmpdir / prefix),
+            "--cache-dir", cache_dir), run)
+    assert out_files == [str(tmpdir / "second-manifest.bed")]
+    assert Path(tmpdir, "second-manifest.bed.idx").exists()
+
+
+def test_evict(tmpdir):
+    for age, name in enumerate(("old", "recent")):
+        entry = tmpdir.ensure("cache", name, dir=True)
+        (entry / "0.bed").write("x" * 100)
+        os.utime(str(entry), (age, age))
+    evict(str(tmpdir / "cache"), 150)
+    assert not (tmpdir / "cache" / "old").exists()
+    assert (tmpdir / "cache" / "recent").exists()
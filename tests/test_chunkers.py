@@ -17,8 +17,12 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from chunked_scatter.chunked_scatter import BedRegion, chunked_scatter, \
-    region_chunker
+import random
+
+from chunked_scatter.chunked_scatter import BedRegion, chunk_boundaries, \
+    chunk_region_array, chunked_scatter, region_chunker
+from chunked_scatter.intervals import IntervalIndex
+from chunked_scatter.regions import RegionArray
 
 import pytest
 
@@ -90,3 +94,75 @@ def test_chunked_scatter_split_contigs():
         [BedRegion("chr1", 11850, 16000),
          BedRegion("chr2", 5000, 10000)],
     ]
+
+
+def test_chunked_scatter_weighted():
+    # Each chunk on chr1 weighs 1 and chr2 weighs 3, so a new list is
+    # started once 2 is reached.
+    weights = {"chr1": 1, "chr2": 3}
+    result = list(chunked_scatter(BED_REGIONS, 5000, 150, 2,
+                                  contigs_can_be_split=True,
+                                  weight=lambda chunk: weights[chunk.contig]))
+    assert result == [
+        [BedRegion("chr1", 100, 1000),
+         BedRegion("chr1", 2000, 7000)],
+        [BedRegion("chr1", 6850, 12000),
+         BedRegion("chr1", 11850, 16000)],
+        [BedRegion("chr2", 5000, 10000)],
+    ]
+
+
+def reference_region_chunker(regions, chunk_size, overlap):
+    """The original incremental implementation of region_chunker."""
+    for contig, start, end in regions:
+        position = start
+        while position + chunk_size * 1.5 < end:
+            if position - overlap <= start:
+                yield BedRegion(contig, start, int(position + chunk_size))
+            else:
+                yield BedRegion(contig, int(position - overlap),
+                                int(position + chunk_size))
+            position += chunk_size
+        if position - overlap <= start:
+            yield BedRegion(contig, start, end)
+        else:
+            yield BedRegion(contig, int(position - overlap), end)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_region_chunker_matches_reference(seed):
+    rng = random.Random(seed)
+    chunk_size = rng.choice([1, 2, 3, 7, 100, 999, 1000, 5000, 1e3, 2.5])
+    overlap = rng.choice([0, 1, 150, 999, 1000, 4000, 20_000, -3])
+    regions = []
+    for _ in range(50):
+        start = rng.randrange(0, 10_000)
+        # Regions span from less than one to about twenty chunks.
+        length = rng.randrange(0, int(chunk_size * 20) + 2)
+        regions.append(BedRegion("chr1", start, start + length))
+    assert (list(region_chunker(regions, chunk_size, overlap)) ==
+            list(reference_region_chunker(regions, chunk_size, overlap)))
+
+
+@pytest.mark.parametrize(["regions", "chunk_size", "overlap", "result"],
+                         REGION_TESTS)
+def test_chunk_region_array(regions, chunk_size, overlap, result):
+    chunks = chunk_region_array(RegionArray(regions), chunk_size, overlap)
+    assert list(chunks) == result
+
+
+def test_chunk_boundaries_invalid():
+    with pytest.raises(ValueError):
+        chunk_boundaries(0, 100, 0, 0)
+
+
+def test_region_chunker_cut_sites():
+    cut_sites = IntervalIndex([BedRegion("chr1", 6000, 6500),
+                               BedRegion("chr1", 16000, 17000)])
+    chunks = region_chunker([BedRegion("chr1", 0, 20000)], 5000, 100,
+                            cut_sites)
+    # There is no cut site near 10000, so that cut stays in place.
+    assert list(chunks) == [BedRegion("chr1", 0, 6000),
+                            BedRegion("chr1", 5900, 10000),
+                            BedRegion("chr1", 9900, 16000),
+                            BedRegion("chr1", 15900, 20000)]
@@ -0,0 +1,171 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+from pathlib import Path
+
+from chunked_scatter.cost_profile import build_cost_profile, \
+    find_runtime_logs, main, observed_densities, read_runtime_log
+from chunked_scatter.regions import BedRegion
+from chunked_scatter.safe_scatter import safe_scatter
+from chunked_scatter.weights import file_to_weights
+
+import pytest
+
+
+def write_shards(directory: Path):
+    """Write two shards and a runtime log in a directory."""
+    (directory / "scatter-0.bed").write_text("chr1\t0\t100\nchr1\t200\t300\n")
+    (directory / "scatter-1.bed").write_text("chr1\t50\t250\n")
+    (directory / "runtimes.tsv").write_text(
+        "# shard\tseconds\n"
+        "scatter-0.bed\t20\n"
+        "scatter-1.bed\t100\n")
+
+
+def test_read_runtime_log(tmpdir):
+    directory = Path(str(tmpdir))
+    write_shards(directory)
+    assert list(read_runtime_log(directory / "runtimes.tsv")) == [
+        (directory / "scatter-0.bed", 20.0),
+        (directory / "scatter-1.bed", 100.0)]
+
+
+def test_read_runtime_log_invalid(tmpdir):
+    log = Path(str(tmpdir / "runtimes.tsv"))
+    log.write_text("scatter-0.bed\tslow\n")
+    with pytest.raises(ValueError):
+        list(read_runtime_log(log))
+
+
+def test_find_runtime_logs(tmpdir):
+    directory = Path(str(tmpdir))
+    (directory / "logs").mkdir()
+    (directory / "logs" / "b.tsv").write_text("")
+    (directory / "logs" / "a.tsv").write_text("")
+    (directory / "logs" / "notes.txt").write_text("")
+    (directory / "extra.log").write_text("")
+    assert find_runtime_logs([directory / "logs", directory / "extra.log"]) \
+        == [directory / "logs" / "a.tsv", directory / "logs" / "b.tsv",
+            directory / "extra.log"]
+
+
+def test_observed_densities(tmpdir):
+    directory = Path(str(tmpdir))
+    write_shards(directory)
+    assert list(observed_densities([directory / "runtimes.tsv"])) == [
+        ("chr1", 0, 100, 0.1), ("chr1", 200, 300, 0.1),
+        ("chr1", 50, 250, 0.5)]
+
+
+def test_build_cost_profile():
+    observations = [("chr1", 0, 100, 0.1), ("chr1", 200, 300, 0.1),
+                    ("chr1", 50, 250, 0.5)]
+    profile = build_cost_profile(observations)
+    assert [interval[:3] for interval in profile] == [
+        ("chr1", 0, 50), ("chr1", 50, 100), ("chr1", 100, 200),
+        ("chr1", 200, 250), ("chr1", 250, 300)]
+    assert [interval[3] for interval in profile] == pytest.approx(
+        [5, 15, 50, 15, 5])
+
+
+def test_build_cost_profile_update():
+    previous = [("chr1", 0, 100, 100), ("chr2", 0, 10, 1)]
+    observations = [("chr1", 50, 150, 3.0)]
+    profile = build_cost_profile(observations, previous, learning_rate=0.5)
+    assert [interval[:3] for interval in profile] == [
+        ("chr1", 0, 50), ("chr1", 50, 100), ("chr1", 100, 150),
+        ("chr2", 0, 10)]
+    # Only the observed part changes, observations without a previous cost
+    # are used as they are.
+    assert [interval[3] for interval in profile] == pytest.approx(
+        [50, 100, 150, 1])
+
+
+def test_build_cost_profile_merges_equal_densities():
+    profile = build_cost_profile([("chr1", 0, 10, 1.0), ("chr1", 10, 20, 1.0),
+                                  ("chr1", 30, 40, 1.0)])
+    assert profile == [("chr1", 0, 20, 20.0), ("chr1", 30, 40, 10.0)]
+
+
+@pytest.mark.parametrize("learning_rate", [0, 1.5])
+def test_build_cost_profile_invalid_learning_rate(learning_rate):
+    with pytest.raises(ValueError):
+        build_cost_profile([], learning_rate=learning_rate)
+
+
+def test_main_builds_and_updates_profile(tmpdir):
+    directory = Path(str(tmpdir))
+    write_shards(directory)
+    profile = directory / "profile.bedgraph"
+    sys.argv = ["build-cost-profile", "-o", str(profile), str(directory)]
+    main()
+    assert profile.read_text() == ("chr1\t0\t50\t5\n"
+                                   "chr1\t50\t100\t15\n"
+                                   "chr1\t100\t200\t50\n"
+                                   "chr1\t200\t250\t15\n"
+                                   "chr1\t250\t300\t5\n")
+    # Updating with the same runtimes leaves the profile unchanged.
+    sys.argv = ["build-cost-profile", "-o", str(profile), "-p", str(profile),
+                "--learning-rate", "0.25", str(directory / "runtimes.tsv")]
+    main()
+    assert profile.read_text().splitlines()[2] == "chr1\t100\t200\t50"
+
+
+def test_main_invalid_learning_rate(tmpdir, capsys):
+    sys.argv = ["build-cost-profile", "-o", str(tmpdir / "profile.bg"),
+                "--learning-rate", "2", str(tmpdir)]
+    with pytest.raises(SystemExit):
+        main()
+    assert "--learning-rate" in capsys.readouterr().err
+
+
+def test_safe_scatter_balances_on_cost_profile(tmpdir):
+    profile = Path(str(tmpdir / "profile.bedgraph"))
+    # The first half of chr1 is nine times as expensive as the second half.
+    profile.write_text("chr1\t0\t50000\t90\nchr1\t50000\t100000\t10\n")
+    scatters = list(safe_scatter([BedRegion("chr1", 0, 100000)], 2, 1000,
+                                 weight=file_to_weights(profile)))
+    assert len(scatters) == 2
+    first_end = scatters[0][-1].end
+    assert first_end < 50000
+    assert first_end == pytest.approx(50000 * 5 / 9, abs=1000)
+
+
+@pytest.mark.parametrize("strategy", ["greedy", "lpt", "kk", "contiguous"])
+def test_safe_scatter_partial_cost_profile(tmpdir, strategy):
+    profile = Path(str(tmpdir / "profile.bedgraph"))
+    # The profile only covers half of chr1, not chr2.
+    profile.write_text("chr1\t0\t50000\t50\n")
+    regions = [BedRegion("chr1", 0, 100000), BedRegion("chr2", 0, 100000)]
+    scatters = list(safe_scatter(regions, 4, 1000, strategy=strategy,
+                                 weight=file_to_weights(profile)))
+    assert len(scatters) == 4
+    for scatter in scatters:
+        assert sum(len(region) for region in scatter) == \
+            pytest.approx(50000, abs=2000)
+
+
+def test_safe_scatter_outside_cost_profile(tmpdir):
+    profile = Path(str(tmpdir / "profile.bedgraph"))
+    profile.write_text("chr3\t0\t50000\t50\n")
+    scatters = list(safe_scatter([BedRegion("chr1", 0, 100000)], 4, 1000,
+                                 weight=file_to_weights(profile)))
+    assert len(scatters) == 4
@@ -0,0 +1,156 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import shutil
+import struct
+from pathlib import Path
+
+from chunked_scatter import indexes
+from chunked_scatter.indexes import IndexBin, bin_span, chunk_size, \
+    find_alignment_index, find_index, read_bai_index, read_index
+
+import pysam
+
+import pytest
+
+datadir = Path(__file__).parent / Path("data")
+
+BIN_SPAN_TESTS = [
+    (0, 14, 5, (0, 2**29)),
+    (1, 14, 5, (0, 2**26)),
+    (2, 14, 5, (2**26, 2**27)),
+    (4681, 14, 5, (0, 2**14)),
+    (4684, 14, 5, (3 * 2**14, 4 * 2**14)),
+    (9, 14, 6, (0, 2**26)),
+    (37448, 14, 5, (2**29 - 2**14, 2**29)),
+    (299592, 14, 6, (2**32 - 2**14, 2**32)),
+]
+
+
+@pytest.mark.parametrize(["bin_number", "min_shift", "depth", "result"],
+                         BIN_SPAN_TESTS)
+def test_bin_span(bin_number, min_shift, depth, result):
+    assert bin_span(bin_number, min_shift, depth) == result
+
+
+def test_find_index():
+    assert find_index(datadir / "bins.vcf.gz") == str(
+        datadir / "bins.vcf.gz.tbi")
+    assert find_index(datadir / "bins.bcf") == str(datadir / "bins.bcf.csi")
+    assert find_index(datadir / "example.vcf") is None
+
+
+def test_read_tabix_index():
+    contigs = read_index(datadir / "bins.vcf.gz.tbi")
+    assert [contig.name for contig in contigs] == ["chr1", "chr2"]
+    assert [contig.records for contig in contigs] == [4, 2]
+    assert [(start, end) for start, end, _ in sorted(contigs[0].bins)] == [
+        (0, 16384), (49152, 65536), (147456, 163840)]
+
+
+def test_read_index_without_sizes(monkeypatch):
+    with_sizes = read_index(datadir / "bins.bcf.csi", ["chr1", "chr2", "chr3"])
+
+    def no_chunk_size(begin, end):
+        raise AssertionError("chunk sizes are not needed")
+
+    monkeypatch.setattr(indexes, "chunk_size", no_chunk_size)
+    without_sizes = read_index(datadir / "bins.bcf.csi",
+                               ["chr1", "chr2", "chr3"], sizes=False)
+    assert [contig.records for contig in without_sizes] == \
+        [contig.records for contig in with_sizes]
+    for contig, sized_contig in zip(without_sizes, with_sizes):
+        assert [(start, end) for start, end, _ in contig.bins] == \
+            [(start, end) for start, end, _ in sized_contig.bins]
+        assert all(size == 0.0 for _, _, size in contig.bins)
+
+
+def test_read_bins_multiple_chunks():
+    # A BAI index with one contig: bin 4681 with two chunks, bin 4682 with
+    # one, the pseudo-bin with 7 mapped reads and an empty linear index.
+    chunks = [(100, 500), (1000 << 16, (1500 << 16) + 400)]
+    data = b"BAI\1" + struct.pack("<ii", 1, 3)
+    data += struct.pack("<Ii", 4681, 2) + struct.pack(
+        "<4Q", *(offset for chunk in chunks for offset in chunk))
+    data += struct.pack("<Ii2Q", 4682, 1, 0, 1 << 16)
+    data += struct.pack("<Ii4Q", 37450, 2, 0, 0, 7, 0)
+    data += struct.pack("<i", 0)
+    contig, = read_bai_index(data, ["chr1"])
+    assert contig.records == 7
+    assert contig.bins == [
+        IndexBin(0, 2**14, sum(chunk_size(*chunk) for chunk in chunks)),
+        IndexBin(2**14, 2**15, chunk_size(0, 1 << 16))]
+
+
+def test_read_csi_index():
+    contigs = read_index(datadir / "bins.bcf.csi", ["chr1", "chr2", "chr3"])
+    assert [contig.name for contig in contigs] == ["chr1", "chr2", "chr3"]
+    assert [contig.records for contig in contigs] == [4, 2, None]
+    assert all(isinstance(bin, IndexBin) for bin in contigs[0].bins)
+
+
+def test_read_csi_index_no_names():
+    with pytest.raises(ValueError):
+        read_index(datadir / "bins.bcf.csi")
+
+
+def test_chunk_size():
+    assert chunk_size(100, 500) == 100
+    assert chunk_size(1000 << 16, (1500 << 16) + 400) == 600
+    # The chunk starts at the end of a poorly compressed block.
+    assert chunk_size((1000 << 16) + 60000, 6000 << 16) > 0
+
+
+def test_find_alignment_index(tmpdir):
+    assert find_alignment_index(datadir / "reads.bam") == str(
+        datadir / "reads.bam.bai")
+    assert find_alignment_index(datadir / "reads.cram") == str(
+        datadir / "reads.cram.crai")
+    bam = str(tmpdir / "reads.bam")
+    shutil.copy(str(datadir / "reads.bam"), bam)
+    assert find_alignment_index(bam) is None
+    shutil.copy(str(datadir / "reads.bam.bai"), str(tmpdir / "reads.bai"))
+    assert find_alignment_index(bam) == str(tmpdir / "reads.bai")
+
+
+def test_read_bai_index():
+    contigs = read_index(datadir / "reads.bam.bai", ["chr1", "chr2", "chr3"])
+    assert [contig.name for contig in contigs] == ["chr1", "chr2", "chr3"]
+    assert [contig.records for contig in contigs] == [1050, 20, None]
+    assert [(start, end) for start, end, _ in sorted(contigs[0].bins)] == [
+        (0, 16384), (147456, 163840)]
+    with pytest.raises(ValueError):
+        read_index(datadir / "reads.bam.bai")
+
+
+def test_read_bam_csi_index(tmpdir):
+    bam = str(tmpdir / "reads.bam")
+    shutil.copy(str(datadir / "reads.bam"), bam)
+    pysam.index("-c", bam)
+    contigs = read_index(bam + ".csi", ["chr1", "chr2", "chr3"])
+    assert [contig.records for contig in contigs] == [1050, 20, None]
+
+
+def test_read_crai_index():
+    contigs = read_index(datadir / "reads.cram.crai", ["chr1", "chr2", "chr3"])
+    assert [contig.name for contig in contigs] == ["chr1", "chr2"]
+    assert [contig.records for contig in contigs] == [None, None]
+    # A slice is a bin, with the size of the slice.
+    assert contigs[1].bins == [IndexBin(500, 569, 195.0)]
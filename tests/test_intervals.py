@@ -0,0 +1,66 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from chunked_scatter.intervals import IntervalIndex, subtract_regions
+from chunked_scatter.regions import BedRegion
+
+INTERVALS = IntervalIndex([
+    BedRegion("chr1", 500, 600),
+    BedRegion("chr1", 100, 200),
+    BedRegion("chr1", 150, 300),
+    BedRegion("chr2", 0, 10),
+])
+
+
+def test_interval_index_merges():
+    assert list(INTERVALS.overlapping("chr1", 0, 1000)) == [
+        (100, 300), (500, 600)]
+
+
+def test_interval_index_overlapping():
+    assert list(INTERVALS.overlapping("chr1", 300, 500)) == []
+    assert list(INTERVALS.overlapping("chr1", 299, 501)) == [
+        (100, 300), (500, 600)]
+    assert list(INTERVALS.overlapping("chr3", 0, 1000)) == []
+
+
+def test_interval_index_nearest():
+    assert INTERVALS.nearest("chr1", 250, 0, 1000) == 250
+    assert INTERVALS.nearest("chr1", 350, 0, 1000) == 300
+    assert INTERVALS.nearest("chr1", 450, 0, 1000) == 500
+    # The interval on the left is out of bounds.
+    assert INTERVALS.nearest("chr1", 350, 320, 1000) == 500
+    assert INTERVALS.nearest("chr1", 350, 320, 480) is None
+    assert INTERVALS.nearest("chr3", 350, 0, 1000) is None
+
+
+def test_interval_index_snap():
+    assert INTERVALS.snap("chr1", 450, 400, 1000) == 500
+    assert INTERVALS.snap("chr1", 450, 400, 480) == 450
+
+
+def test_subtract_regions():
+    regions = [BedRegion("chr1", 0, 1000), BedRegion("chr1", 120, 280),
+               BedRegion("chr1", 250, 550), BedRegion("chr2", 5, 20),
+               BedRegion("chr3", 0, 100)]
+    assert list(subtract_regions(regions, INTERVALS)) == [
+        BedRegion("chr1", 0, 100), BedRegion("chr1", 300, 500),
+        BedRegion("chr1", 600, 1000), BedRegion("chr1", 300, 500),
+        BedRegion("chr2", 10, 20), BedRegion("chr3", 0, 100)]
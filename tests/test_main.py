@@ -25,6 +25,8 @@ from chunked_scatter.chunked_scatter import main, parse_args
 from chunked_scatter.safe_scatter import main as safe_scatter_main
 from chunked_scatter.scatter_regions import main as scatter_regions_main
 
+import pytest
+
 DATA_DIR = Path(__file__).parent / Path("data")
 
 
@@ -49,6 +51,21 @@ def test_bed_input(tmpdir, capsys):
     assert str(tmpdir / Path("test_result_0.bed")) in capsys.readouterr().out
 
 
+def test_exclude_and_cut_sites(tmpdir):
+    exclude = tmpdir / "exclude.bed"
+    exclude.write("chr1\t3000\t4000\n")
+    cut_sites = tmpdir / "cut_sites.bed"
+    cut_sites.write("chr1\t9500\t9600\n")
+    sys.argv = ["script", "-p", "{}/test_result_".format(tmpdir),
+                str(Path(DATA_DIR, "regions.bed")), "-c", "5000", "-m", "1",
+                "--exclude", str(exclude), "--cut-sites", str(cut_sites)]
+    main()
+    assert (tmpdir / "test_result_0.bed").read() == ("chr1\t100\t1000\n"
+                                                     "chr1\t2000\t3000\n"
+                                                     "chr1\t4000\t9500\n"
+                                                     "chr1\t9350\t16000\n")
+
+
 def test_dict_input(tmpdir):
     sys.argv = ["script", "-p", "{}/test_result_".format(tmpdir),
                 str(Path(DATA_DIR, "ref.dict"))]
@@ -108,3 +125,51 @@ def test_safe_scatter_main(tmpdir, capsys):
     )
     captured = capsys.readouterr()
     assert str(Path(str(tmpdir), "scatters", "scatter-0.bed")) in captured.out
+
+
+def test_safe_scatter_main_weights(tmpdir):
+    sys.argv = ["safe-scatter", "-p",
+                str(Path(str(tmpdir), "scatters", "scatter-")),
+                "--scatter-count", "2", "--min-scatter-size", "1000",
+                "--use-index",
+                "--weights", str(Path(DATA_DIR, "bins.vcf.gz")),
+                str(Path(DATA_DIR, "bins.vcf.gz"))]
+    safe_scatter_main()
+    # The variant dense first bin of chr1 takes up most of the first scatter,
+    # which holds three of the six variants.
+    assert Path(str(tmpdir), "scatters", "scatter-0.bed").read_text() == (
+        "chr1\t0\t16384\n"
+        "chr1\t49152\t65536\n"
+        "chr1\t147456\t148456\n"
+    )
+
+
+def test_safe_scatter_main_streaming(tmpdir):
+    for prefix, streaming in (("memory-", []),
+                              ("streaming-", ["--streaming"])):
+        sys.argv = (["safe-scatter", "-p", str(Path(str(tmpdir), prefix)),
+                     "--scatter-count", "4", "--min-scatter-size", "1000",
+                     str(Path(DATA_DIR, "regions.bed"))] + streaming)
+        safe_scatter_main()
+    for i in range(4):
+        assert (Path(str(tmpdir), f"streaming-{i}.bed").read_text() ==
+                Path(str(tmpdir), f"memory-{i}.bed").read_text())
+
+
+def test_safe_scatter_main_streaming_strategy():
+    sys.argv = ["safe-scatter", "--scatter-count", "4", "--streaming",
+                "--strategy", "lpt", str(Path(DATA_DIR, "regions.bed"))]
+    with pytest.raises(SystemExit):
+        safe_scatter_main()
+
+
+def test_safe_scatter_main_bam_weights(tmpdir):
+    bed = tmpdir / "chr1.bed"
+    bed.write("chr1\t0\t200000\n")
+    sys.argv = ["safe-scatter", "-p", str(Path(str(tmpdir), "scatter-")),
+                "--scatter-count", "2", "--min-scatter-size", "1000",
+                "--weights", str(Path(DATA_DIR, "reads.bam")), str(bed)]
+    safe_scatter_main()
+    # Most reads are in the first 16 kb, so half of them is in a short
+    # first scatter.
+    assert (tmpdir / "scatter-0.bed").read() == "chr1\t0\t8000\n"
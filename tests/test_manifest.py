@@ -0,0 +1,87 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+from pathlib import Path
+
+from chunked_scatter.manifest import main, read_scatter, scatter_count, \
+    write_manifest
+from chunked_scatter.regions import BedRegion
+from chunked_scatter.safe_scatter import main as safe_scatter_main
+
+import pytest
+
+REGION_LISTS = [
+    [BedRegion("chr1", 0, 300), BedRegion("chr2", 0, 100_000)],
+    [],
+    [BedRegion("chr3", 0, 4300)],
+]
+
+DATA_DIR = Path(__file__).parent / Path("data")
+
+
+def test_write_manifest(tmp_path):
+    manifest = write_manifest(REGION_LISTS, str(tmp_path / "out" / "s-"))
+    assert manifest == str(tmp_path / "out" / "s-manifest.bed")
+    assert Path(manifest).read_text() == ("chr1\t0\t300\t0\n"
+                                          "chr2\t0\t100000\t0\n"
+                                          "chr3\t0\t4300\t2\n")
+    assert sorted(path.name for path in (tmp_path / "out").iterdir()) == [
+        "s-manifest.bed", "s-manifest.bed.idx"]
+
+
+def test_read_scatter(tmp_path):
+    manifest = write_manifest(REGION_LISTS, str(tmp_path / "s-"))
+    assert scatter_count(manifest) == 3
+    for scatter_number, region_list in enumerate(REGION_LISTS):
+        assert read_scatter(manifest, scatter_number) == region_list
+
+
+@pytest.mark.parametrize("scatter_number", [3, -1])
+def test_read_scatter_out_of_range(tmp_path, scatter_number):
+    manifest = write_manifest(REGION_LISTS, str(tmp_path / "s-"))
+    with pytest.raises(IndexError):
+        read_scatter(manifest, scatter_number)
+
+
+def test_extract_scatter_main(tmp_path, capsys):
+    manifest = write_manifest(REGION_LISTS, str(tmp_path / "s-"))
+    sys.argv = ["extract-scatter", manifest, "0"]
+    main()
+    assert capsys.readouterr().out == "chr1\t0\t300\nchr2\t0\t100000\n"
+    sys.argv = ["extract-scatter", manifest, "2", "-o",
+                str(tmp_path / "2.bed")]
+    main()
+    assert (tmp_path / "2.bed").read_text() == "chr3\t0\t4300\n"
+    sys.argv = ["extract-scatter", "--count", manifest]
+    main()
+    assert capsys.readouterr().out == "3\n"
+
+
+def test_safe_scatter_main_manifest(tmp_path, capsys):
+    sys.argv = ["safe-scatter", "-p", str(tmp_path / "scatter-"),
+                "--scatter-count", "3", "--manifest", "--print-paths",
+                str(Path(DATA_DIR, "ref.dict"))]
+    safe_scatter_main()
+    manifest = tmp_path / "scatter-manifest.bed"
+    assert capsys.readouterr().out == f"{manifest}\n"
+    assert not (tmp_path / "scatter-0.bed").exists()
+    assert scatter_count(manifest) == 3
+    assert read_scatter(manifest, 1) == [BedRegion("chr1", 1160000, 2320000)]
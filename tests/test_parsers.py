@@ -18,9 +18,19 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import concurrent.futures
+import gzip
+import io
+import sys
+from array import array
 from pathlib import Path
 
-from chunked_scatter.parsers import BedRegion, file_to_regions
+from chunked_scatter import parsers
+from chunked_scatter.parsers import BedRegion, _read_lines, \
+    bed_file_to_region_array, file_to_region_array, file_to_regions
+from chunked_scatter.regions import RegionArray
+
+import pysam
 
 import pytest
 
@@ -68,3 +78,134 @@ def test_file_to_regions_wrong_ext(capsys):
         file_to_regions("input")
     error.match("Unkown extension '' for file: 'input'. Supported extensions "
                 "are:")
+
+
+BINS_REGIONS = [
+    BedRegion("chr1", 0, 16384),
+    BedRegion("chr1", 49152, 65536),
+    BedRegion("chr1", 147456, 163840),
+    BedRegion("chr2", 0, 20000)
+]
+
+
+@pytest.mark.parametrize("in_file", ["bins.vcf.gz", "bins.bcf"])
+def test_file_to_regions_vcf_index(in_file):
+    result = list(file_to_regions(datadir / in_file, use_index=True))
+    assert result == BINS_REGIONS
+
+
+def test_file_to_regions_vcf_index_clipped():
+    result = list(file_to_regions(datadir / "example.vcf.gz", use_index=True))
+    assert result == [BedRegion("22", 0, 10000)]
+
+
+def test_file_to_regions_vcf_no_index():
+    result = list(file_to_regions(datadir / "example.vcf", use_index=True))
+    assert len(result) == 4
+
+
+def test_bed_file_to_region_array():
+    result = bed_file_to_region_array(datadir / "regions.bed")
+    assert isinstance(result, RegionArray)
+    assert list(result) == list(file_to_regions(datadir / "regions.bed"))
+
+
+def test_file_to_region_array():
+    result = file_to_region_array(datadir / "ref.dict")
+    assert list(result) == [
+        BedRegion("chr1", 0, 3000000),
+        BedRegion("chr2", 0, 500000)
+    ]
+
+
+@pytest.mark.parametrize("read_size", [1, 2, 7, 1024])
+def test_read_lines(read_size):
+    data = b"chr1\t1\t2\n\nchr2\t3\t4\r\nchr3\t5\t6"
+    lines = [line for block in _read_lines(io.BytesIO(data), read_size)
+             for line in block]
+    assert lines == [b"chr1\t1\t2", b"", b"chr2\t3\t4\r", b"chr3\t5\t6"]
+
+
+def compressed_copy(in_file: Path, tmp_path: Path, extension: str) -> Path:
+    out_file = tmp_path / (in_file.name + extension)
+    out_file.write_bytes(gzip.compress(in_file.read_bytes()))
+    return out_file
+
+
+@pytest.mark.parametrize(["in_file", "extension"], [
+    ("regions.bed", ".gz"), ("ref.dict", ".gz"),
+    ("reference.fasta.fai", ".bgz")])
+def test_file_to_regions_compressed(tmp_path, in_file, extension):
+    compressed = compressed_copy(datadir / in_file, tmp_path, extension)
+    assert (list(file_to_regions(compressed)) ==
+            list(file_to_regions(datadir / in_file)))
+
+
+def test_file_to_regions_bgzipped_bed(tmp_path):
+    compressed = tmp_path / "regions.bed.gz"
+    pysam.tabix_compress(str(datadir / "regions.bed"), str(compressed))
+    assert (list(file_to_regions(compressed)) ==
+            list(file_to_regions(datadir / "regions.bed")))
+
+
+@pytest.mark.parametrize(["in_file", "compress"], [
+    ("regions.bed", False), ("regions.bed", True), ("ref.dict", False),
+    ("reference.fasta.fai", False), ("reference.fasta.fai", True),
+    ("example.vcf", False), ("example.vcf.gz", False), ("bins.bcf", False)])
+def test_file_to_regions_stdin(monkeypatch, in_file, compress):
+    data = (datadir / in_file).read_bytes()
+    if compress:
+        data = gzip.compress(data)
+    monkeypatch.setattr(sys, "stdin",
+                        io.TextIOWrapper(io.BufferedReader(io.BytesIO(data))))
+    assert (list(file_to_regions("-")) ==
+            list(file_to_regions(datadir / in_file)))
+
+
+@pytest.fixture
+def indexed_bed(tmp_path) -> Path:
+    bed = tmp_path / "regions.bed"
+    bed.write_text("chr1\t100\t1000\nchr1\t2000\t16000\nchr2\t5000\t10000\n"
+                   "chr3\t0\t10\tname\n")
+    return Path(pysam.tabix_index(str(bed), preset="bed"))
+
+
+@pytest.mark.parametrize("in_file", ["bins.vcf.gz", "bins.bcf"])
+def test_file_to_regions_threads(in_file):
+    assert (list(file_to_regions(datadir / in_file, threads=2)) ==
+            list(file_to_regions(datadir / in_file)))
+
+
+def test_file_to_regions_threads_bed(indexed_bed):
+    result = list(file_to_regions(indexed_bed, threads=3))
+    assert result == list(file_to_regions(indexed_bed))
+    assert len(result) == 4
+
+
+def test_parallel_fetch_reads_ahead_lazily(monkeypatch):
+    submitted = []
+
+    class RecordingExecutor(concurrent.futures.ThreadPoolExecutor):
+        # Threads instead of processes, so the fake function can be used.
+        def submit(self, function, *args):
+            submitted.append(args[-1])
+            return super().submit(function, *args)
+
+    def fake_fetch_contig(in_file, file_format, contig):
+        return array("q", [0]), array("q", [10])
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor",
+                        RecordingExecutor)
+    monkeypatch.setattr(parsers, "_fetch_contig", fake_fetch_contig)
+    contigs = [f"chr{number}" for number in range(1, 11)]
+    results = parsers._parallel_fetch("in.bed", ".bed", contigs, 2)
+    assert next(results)[0] == "chr1"
+    # Only two contigs are read ahead of the consumer.
+    assert submitted == ["chr1", "chr2", "chr3"]
+    assert [contig for contig, _, _ in results] == contigs[1:]
+
+
+@pytest.mark.parametrize("in_file", ["bins.vcf.gz", "regions.bed"])
+def test_file_to_region_array_threads(in_file):
+    assert (list(file_to_region_array(datadir / in_file, threads=2)) ==
+            list(file_to_regions(datadir / in_file)))
@@ -0,0 +1,155 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import pstats
+import subprocess
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+
+from chunked_scatter.chunked_scatter import chunked_scatter, region_chunker
+from chunked_scatter.profiling import PROFILE_ENVIRONMENT_VARIABLE, \
+    Profiler, profile, profiled
+from chunked_scatter.regions import BedRegion, merge_regions
+from chunked_scatter.safe_scatter import main as safe_scatter_main
+
+import pytest
+
+DATA_DIR = Path(__file__).parent / Path("data")
+REF_DICT = str(Path(DATA_DIR, "ref.dict"))
+REGIONS = [BedRegion("chr1", 0, 1000), BedRegion("chr1", 900, 2000),
+           BedRegion("chr2", 0, 500)]
+
+
+def test_profiled_without_profiler():
+    @profiled("double")
+    def double(value):
+        return value * 2
+
+    assert double(2) == 4
+    assert double.__name__ == "double"
+
+
+def test_profiler_counts_regions():
+    with profile(os.devnull) as profiler:
+        assert len(list(merge_regions(REGIONS))) == 2
+        lists = list(chunked_scatter(iter(REGIONS), 500, 0, 1000))
+    assert sum(len(chunks) for chunks in lists) == 5
+    assert profiler.counters["merge_regions"]["items_in"] == 3
+    assert profiler.counters["merge_regions"]["items_out"] == 2
+    assert profiler.counters["region_chunker"]["items_in"] == 3
+    assert profiler.counters["region_chunker"]["items_out"] == 5
+    assert profiler.counters["chunked_scatter"]["items_out"] == len(lists)
+    assert set(profiler.seconds) == {"merge_regions", "region_chunker",
+                                     "chunked_scatter"}
+    # Only the calls made while profiling are counted.
+    list(merge_regions(REGIONS))
+    assert profiler.counters["merge_regions"]["calls"] == 1
+
+
+def test_profiler_counts_allocations():
+    tracemalloc.start()
+    try:
+        with profile(os.devnull) as profiler:
+            list(region_chunker(REGIONS, 10, 0))
+    finally:
+        tracemalloc.stop()
+    assert profiler.counters["region_chunker"]["allocated_bytes"] > 0
+    assert "-" not in profiler.summary().splitlines()[1]
+
+
+def test_profiler_ignores_other_threads():
+    with profile(os.devnull) as profiler:
+        thread = threading.Thread(target=lambda: list(merge_regions(REGIONS)))
+        thread.start()
+        thread.join()
+    assert profiler.counters == {}
+
+
+def test_profiler_restores_previous():
+    outer = Profiler(os.devnull)
+    outer.start()
+    with profile(os.devnull):
+        pass
+    list(merge_regions(REGIONS))
+    outer.stop()
+    assert outer.counters["merge_regions"]["calls"] == 1
+
+
+def run_safe_scatter(tmpdir, *arguments):
+    sys.argv = ["safe-scatter", "-c", "3", "-p", str(tmpdir / "scatter-"),
+                REF_DICT] + list(arguments)
+    safe_scatter_main()
+
+
+def test_main_profile(tmpdir, capsys):
+    run_safe_scatter(tmpdir, "--profile")
+    lines = capsys.readouterr().err.splitlines()
+    assert lines[0].split()[:3] == ["stage", "calls", "seconds"]
+    stages = {line.split()[0]: line.split()[1:] for line in lines[1:-1]}
+    assert set(stages) == {"file_to_regions", "file_to_region_array",
+                           "safe_scatter", "merge_regions",
+                           "region_lists_to_scatter_files"}
+    bytes_read = int(stages["file_to_region_array"][4])
+    assert bytes_read == os.path.getsize(REF_DICT)
+    bytes_written = int(stages["region_lists_to_scatter_files"][5])
+    assert bytes_written == sum(
+        os.path.getsize(str(tmpdir / f"scatter-{i}.bed")) for i in range(3))
+    assert lines[-1].startswith("total")
+
+
+def test_main_profile_chrome_trace(tmpdir):
+    trace_file = tmpdir / "trace.json"
+    run_safe_scatter(tmpdir, "--manifest", "--profile-output",
+                     str(trace_file))
+    trace = json.loads(trace_file.read())
+    events = trace["traceEvents"]
+    assert {event["name"] for event in events} >= {"safe_scatter",
+                                                   "write_manifest"}
+    for event in events:
+        assert event["ph"] == "X"
+        assert event["dur"] >= 0
+    assert trace["otherData"]["write_manifest"]["bytes_written"] == \
+        os.path.getsize(str(tmpdir / "scatter-manifest.bed"))
+
+
+def test_main_profile_pstats(tmpdir):
+    stats_file = tmpdir / "scatter.prof"
+    run_safe_scatter(tmpdir, "--profile-output", str(stats_file))
+    functions = {function for _, _, function in
+                 pstats.Stats(str(stats_file)).stats}
+    assert "safe_scatter" in functions
+
+
+@pytest.mark.parametrize(["value", "output"], [("1", None),
+                                               ("profile.txt", "profile.txt")])
+def test_environment_variable(tmpdir, value, output):
+    code = ("from chunked_scatter.regions import BedRegion, merge_regions\n"
+            "list(merge_regions([BedRegion('chr1', 0, 10)]))\n")
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=str(tmpdir),
+        env=dict(os.environ, **{PROFILE_ENVIRONMENT_VARIABLE: value}),
+        stderr=subprocess.PIPE, check=True, universal_newlines=True)
+    summary = (result.stderr if output is None
+               else Path(str(tmpdir), output).read_text())
+    assert summary.splitlines()[1].split()[:2] == ["merge_regions", "1"]
@@ -0,0 +1,106 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+from pathlib import Path
+
+from chunked_scatter import reference
+from chunked_scatter.chunked_scatter import main
+from chunked_scatter.reference import N_RUNS_HEADER, N_RUNS_SUFFIX, \
+    file_checksum, find_n_runs, reference_checksum, reference_n_runs
+from chunked_scatter.regions import BedRegion
+
+import pysam
+
+import pytest
+
+SEQUENCES = {
+    "chr1": "ACGT" * 5 + "N" * 6 + "ACGT" * 4 + "nN" + "ACGT" * 5 + "NNN",
+    "chr2": "ACGT" * 10,
+}
+N_RUNS = [BedRegion("chr1", 20, 26), BedRegion("chr1", 42, 44),
+          BedRegion("chr1", 64, 67)]
+
+
+@pytest.fixture
+def fasta(tmpdir) -> str:
+    fasta = str(tmpdir / "reference.fasta")
+    with open(fasta, "wt") as fasta_h:
+        for name, sequence in SEQUENCES.items():
+            fasta_h.write(f">{name}\n")
+            for i in range(0, len(sequence), 10):
+                fasta_h.write(sequence[i:i + 10] + "\n")
+    pysam.faidx(fasta)
+    return fasta
+
+
+@pytest.mark.parametrize("fetch_size", [1, 7, 22, 1024])
+def test_find_n_runs(fasta, fetch_size):
+    assert list(find_n_runs(fasta, fetch_size)) == N_RUNS
+
+
+def test_reference_n_runs_cached(fasta):
+    assert reference_n_runs(fasta) == N_RUNS
+    sidecar = Path(fasta + N_RUNS_SUFFIX)
+    stat = os.stat(fasta)
+    assert sidecar.read_text().splitlines()[0] == (
+        f"{N_RUNS_HEADER}{file_checksum(fasta)} size={stat.st_size} "
+        f"mtime_ns={stat.st_mtime_ns}")
+    # The sidecar file is used as long as the checksum matches.
+    sidecar.write_text(sidecar.read_text() + "chr2\t0\t1\n")
+    assert reference_n_runs(fasta) == N_RUNS + [BedRegion("chr2", 0, 1)]
+    with open(fasta, "at") as fasta_h:
+        fasta_h.write("\n")
+    assert reference_n_runs(fasta) == N_RUNS
+
+
+def test_reference_checksum_not_recalculated(fasta, monkeypatch):
+    checksum = file_checksum(fasta)
+    reference_n_runs(fasta)
+    monkeypatch.setattr(reference, "_checksums", {})
+    calls = []
+    monkeypatch.setattr(reference, "file_checksum",
+                        lambda path: calls.append(path) or checksum)
+    # The checksum in the sidecar is used while the FASTA is unchanged.
+    assert reference_checksum(fasta) == checksum
+    assert reference_n_runs(fasta) == N_RUNS
+    assert calls == []
+    # A new modification time makes it check the contents once. The sidecar
+    # is updated, so later runs need no checksum again.
+    stat = os.stat(fasta)
+    os.utime(fasta, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert reference_n_runs(fasta) == N_RUNS
+    monkeypatch.setattr(reference, "_checksums", {})
+    assert reference_n_runs(fasta) == N_RUNS
+    assert calls == [fasta]
+
+
+def test_reference_option(fasta, tmpdir):
+    bed = tmpdir / "regions.bed"
+    bed.write("chr1\t0\t70\n")
+    sys.argv = ["script", "-p", "{}/test_result_".format(tmpdir), str(bed),
+                "-c", "20", "-o", "0", "--reference", fasta,
+                "--min-gap-size", "5"]
+    main()
+    # The 6 base run is excluded, the cut is moved to the 2 base run.
+    assert (tmpdir / "test_result_0.bed").read() == ("chr1\t0\t20\n"
+                                                     "chr1\t26\t44\n"
+                                                     "chr1\t44\t70\n")
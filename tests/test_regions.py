@@ -0,0 +1,60 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+from chunked_scatter.regions import BedRegion, RegionArray
+
+from .test_chunkers import BED_REGIONS
+
+
+def test_region_array_iter():
+    regions = RegionArray(BED_REGIONS)
+    assert len(regions) == 3
+    assert list(regions) == BED_REGIONS
+    assert regions.contigs == ["chr1", "chr2"]
+
+
+def test_region_array_getitem():
+    regions = RegionArray(BED_REGIONS)
+    assert regions[0] == BedRegion("chr1", 100, 1000)
+    assert regions[-1] == BedRegion("chr2", 5000, 10000)
+    assert isinstance(regions[1:], RegionArray)
+    assert list(regions[1:]) == BED_REGIONS[1:]
+    assert BedRegion("chr1", 2000, 16000) in regions
+
+
+def test_region_array_add_extend():
+    regions = RegionArray()
+    regions.add("chr2", 0, 10)
+    regions.extend(RegionArray(BED_REGIONS))
+    assert regions.contigs == ["chr2", "chr1"]
+    assert list(regions) == [BedRegion("chr2", 0, 10)] + BED_REGIONS
+
+
+def test_region_array_total_length():
+    assert RegionArray(BED_REGIONS).total_length() == 19900
+
+
+def test_region_array_memory():
+    regions = RegionArray(BedRegion("chr1", i, i + 1) for i in range(10000))
+    size = (sys.getsizeof(regions.contig_ids) + sys.getsizeof(regions.starts) +
+            sys.getsizeof(regions.ends))
+    assert size < 10000 * 24
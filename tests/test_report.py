@@ -0,0 +1,159 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import sys
+from pathlib import Path
+
+from chunked_scatter.cache import cached_run
+from chunked_scatter.chunked_scatter import main
+from chunked_scatter.regions import BedRegion
+from chunked_scatter.report import ScatterReport, StageTimer, balance
+from chunked_scatter.safe_scatter import argument_parser, run
+from chunked_scatter.safe_scatter import main as safe_scatter_main
+from chunked_scatter.scatter_regions import main as scatter_regions_main
+
+import pytest
+
+DATA_DIR = Path(__file__).parent / Path("data")
+REF_DICT = str(Path(DATA_DIR, "ref.dict"))
+
+
+class FakeClock:
+    """A perf_counter that only advances when the test says so."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr("chunked_scatter.report.time.perf_counter",
+                        fake_clock)
+    return fake_clock
+
+
+def slow(items, seconds, clock):
+    for item in items:
+        clock.now += seconds
+        yield item
+
+
+def test_stage_timer_excludes_nested_stages(clock):
+    timer = StageTimer()
+    parsed = timer.timed("parse", slow(range(3), 1.0, clock))
+    chunked = timer.timed("chunk", slow(parsed, 2.0, clock))
+    with timer.stage("write"):
+        assert list(slow(chunked, 0.5, clock)) == [0, 1, 2]
+    assert timer.seconds == {"parse": 3.0, "chunk": 6.0, "write": 1.5}
+
+
+def test_stage_timer_accumulates(clock):
+    timer = StageTimer()
+    for _ in range(2):
+        with timer.stage("parse"):
+            clock.now += 1.0
+    assert timer.seconds == {"parse": 2.0}
+
+
+@pytest.mark.parametrize(["values", "result"], [
+    ([10, 10, 10], {"min": 10, "max": 10, "mean": 10, "max_min_ratio": 1,
+                    "coefficient_of_variation": 0}),
+    ([5, 15], {"min": 5, "max": 15, "mean": 10, "max_min_ratio": 3,
+               "coefficient_of_variation": 0.5}),
+    ([0, 10], {"min": 0, "max": 10, "mean": 5, "max_min_ratio": None,
+               "coefficient_of_variation": 1}),
+    ([], {"min": None, "max": None, "mean": None, "max_min_ratio": None,
+          "coefficient_of_variation": None}),
+])
+def test_balance(values, result):
+    assert balance(values) == pytest.approx(result)
+
+
+def test_scatter_report_records_shards():
+    report = ScatterReport("safe-scatter", weight=lambda region: 2)
+    region_lists = [[BedRegion("chr1", 0, 100), BedRegion("chr2", 0, 50)],
+                    [BedRegion("chr2", 50, 200)]]
+    assert list(report.record(region_lists)) == region_lists
+    result = report.to_dict(["scatter-0.bed", "scatter-1.bed"])
+    assert result["program"] == "safe-scatter"
+    assert result["scatters"] == 2
+    assert result["shards"] == [
+        {"scatter": 0, "path": "scatter-0.bed", "bp": 150, "intervals": 2,
+         "contigs": 2, "cost": 4},
+        {"scatter": 1, "path": "scatter-1.bed", "bp": 150, "intervals": 1,
+         "contigs": 1, "cost": 2}]
+    assert result["balance"]["bp"]["max_min_ratio"] == 1
+    assert result["balance"]["cost"]["max_min_ratio"] == 2
+
+
+@pytest.mark.parametrize(["program", "arguments", "stages"], [
+    (main, ["-c", "500000"], {"intervals", "parse", "chunk", "write"}),
+    (scatter_regions_main, ["-s", "1000000", "--sort"],
+     {"intervals", "parse", "sort", "merge", "scatter", "write"}),
+    (safe_scatter_main, ["-c", "3"],
+     {"intervals", "weights", "parse", "scatter", "write"}),
+    (safe_scatter_main, ["-c", "3", "--streaming"],
+     {"intervals", "weights", "parse", "scatter", "write"}),
+])
+def test_main_report(tmpdir, program, arguments, stages):
+    report_file = tmpdir / "report.json"
+    sys.argv = ["script", "-p", str(tmpdir / "scatter-"), "--report",
+                str(report_file), REF_DICT] + arguments
+    program()
+    report = json.loads(report_file.read())
+    assert set(report["stages"]) == stages
+    shards = report["shards"]
+    assert [shard["path"] for shard in shards] == [
+        str(tmpdir / f"scatter-{number}.bed") for number in range(len(shards))]
+    assert sum(shard["bp"] for shard in shards) >= 3_500_000
+    assert report["balance"]["bp"]["max"] == max(shard["bp"]
+                                                 for shard in shards)
+    assert report["total_seconds"] >= sum(report["stages"].values())
+
+
+def test_main_report_manifest(tmpdir):
+    report_file = tmpdir / "report.json"
+    sys.argv = ["safe-scatter", "-p", str(tmpdir / "scatter-"), "-c", "3",
+                "--manifest", "--report", str(report_file), REF_DICT]
+    safe_scatter_main()
+    report = json.loads(report_file.read())
+    assert [shard["path"] for shard in report["shards"]] == \
+        [str(tmpdir / "scatter-manifest.bed")] * 3
+
+
+def test_cached_run_with_report_runs(tmpdir):
+    cache_dir = str(tmpdir / "cache")
+    runs = []
+
+    def counting_run(args):
+        runs.append(args)
+        return run(args)
+
+    for prefix, report in [("first-", []),
+                           ("second-", ["--report", str(tmpdir / "r.json")])]:
+        cached_run("safe-scatter", argument_parser().parse_args(
+            ["-c", "3", REF_DICT, "-p", str(tmpdir / prefix),
+             "--cache-dir", cache_dir] + report), counting_run)
+    assert len(runs) == 2
+    assert (tmpdir / "r.json").exists()
@@ -18,8 +18,14 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import math
+import sys
+import tracemalloc
+
 from chunked_scatter import safe_scatter
 from chunked_scatter.chunked_scatter import BedRegion
+from chunked_scatter.intervals import IntervalIndex
+from chunked_scatter.weights import RegionWeights
 
 import pytest
 
@@ -176,3 +182,281 @@ def test_mix_regions(regions, small_cutoff, result):
     original_total = safe_scatter.sum_regions(regions)
     assert mixed_total == original_total
     assert mixed_regions == result
+
+
+def test_safe_scatter_weighted():
+    # All cost is in the first 100 bases, so they should be spread over two
+    # bins, and all other bases end up in the final bin.
+    regions = [BedRegion("chr1", 0, 400)]
+    weights = RegionWeights([("chr1", 0, 100, 100)])
+    scattered_regions = list(safe_scatter.safe_scatter(regions, 3, 50,
+                             weight=weights))
+    assert scattered_regions == [
+        [BedRegion("chr1", 0, 50)],
+        [BedRegion("chr1", 50, 100)],
+        [BedRegion("chr1", 100, 400)]
+    ]
+
+
+def baseline_mix_small_regions(regions, target_bin_size):
+    """The original, quadratic, implementation of mix_small_regions."""
+    regular_regions = [reg for reg in regions if len(reg) >= target_bin_size]
+    small_regions = [reg for reg in regions if len(reg) < target_bin_size]
+    try:
+        small_regions_ratio = math.ceil(len(small_regions) /
+                                        len(regular_regions))
+    except ZeroDivisionError:
+        small_regions_ratio = 1
+    mixed_regions = list()
+    while regular_regions or small_regions:
+        for _ in range(small_regions_ratio):
+            try:
+                mixed_regions.append(small_regions.pop(0))
+            except IndexError:
+                break
+        try:
+            mixed_regions.append(regular_regions.pop(0))
+        except IndexError:
+            pass
+    return mixed_regions
+
+
+def mix_test_regions(small_per_regular, number_of_regions):
+    """
+    Return number_of_regions regions, in groups of one regular region of 100
+    bases followed by small_per_regular small regions of 50 bases.
+    """
+    period = small_per_regular + 1
+    return [BedRegion("chr1", i * 100,
+                      i * 100 + (100 if i % period == 0 else 50))
+            for i in range(number_of_regions)]
+
+
+@pytest.mark.parametrize("regions", [
+    # Exactly two small regions for every regular region.
+    mix_test_regions(2, 3000),
+    # The small regions run out before the regular regions.
+    mix_test_regions(2, 3001)[:-500] + mix_test_regions(0, 500),
+    mix_test_regions(1, 3000) + mix_test_regions(0, 7),
+    # The last regular region before the small regions run out gets fewer
+    # than the ratio of small regions.
+    mix_test_regions(3, 3000) + mix_test_regions(1000, 1000),
+    mix_test_regions(7, 2999),
+    # The ratio is rounded up, so small regions are only left after the
+    # regular regions when there are no regular regions at all.
+    [BedRegion("chr1", i * 100, i * 100 + 50) for i in range(1000)],
+    mix_test_regions(0, 1000),
+    [],
+], ids=["exact", "leftover_regular", "leftover_regular_ratio_1",
+        "partial_group", "partial_group_ratio_7", "small_only",
+        "regular_only", "empty"])
+def test_mix_regions_large(regions):
+    assert safe_scatter.mix_small_regions(regions, 100) == \
+        baseline_mix_small_regions(regions, 100)
+
+
+def count_operations(function, *args) -> int:
+    """
+    Count the lines that function executes, plus the elements that are
+    shifted by the list methods that move all elements after the one they
+    change. Unlike the time taken, this count is deterministic.
+    """
+    operations = 0
+
+    def trace(frame, event, arg):
+        nonlocal operations
+        if event == "line":
+            operations += 1
+        return trace
+
+    def profile(frame, event, arg):
+        nonlocal operations
+        if event == "c_call" and arg.__name__ in ("pop", "insert", "remove") \
+                and isinstance(getattr(arg, "__self__", None), list):
+            operations += len(arg.__self__)
+
+    sys.settrace(trace)
+    sys.setprofile(profile)
+    try:
+        function(*args)
+    finally:
+        sys.setprofile(None)
+        sys.settrace(None)
+    return operations
+
+
+def test_mix_regions_scales_linearly():
+    def scaling(function):
+        return (count_operations(function, mix_test_regions(3, 40_000), 100) /
+                count_operations(function, mix_test_regions(3, 4_000), 100))
+
+    # Ten times as many regions should take about ten times as many
+    # operations. The original implementation took a hundred times as many.
+    assert scaling(safe_scatter.mix_small_regions) < 15
+    assert scaling(baseline_mix_small_regions) > 50
+
+
+# partitioner, sizes, scatter_count, sizes of the resulting bins
+PARTITION_TESTS = [
+    (safe_scatter.lpt_partition, [8, 7, 6, 5, 4], 2, [17, 13]),
+    (safe_scatter.karmarkar_karp_partition, [8, 7, 6, 5, 4], 2, [16, 14]),
+    (safe_scatter.lpt_partition, [10, 1, 1, 1], 3, [10, 2, 1]),
+    (safe_scatter.karmarkar_karp_partition, [10, 1, 1, 1], 3, [10, 2, 1]),
+    (safe_scatter.lpt_partition, [5], 3, [5, 0, 0]),
+    (safe_scatter.karmarkar_karp_partition, [5], 3, [5, 0, 0]),
+    (safe_scatter.lpt_partition, [], 2, [0, 0]),
+    (safe_scatter.karmarkar_karp_partition, [], 2, [0, 0]),
+    (safe_scatter.contiguous_partition, [8, 7, 6, 5, 4], 2, [15, 15]),
+    (safe_scatter.contiguous_partition, [10, 1, 1, 1], 3, [10, 2, 1]),
+    (safe_scatter.contiguous_partition, [1, 1, 1, 10], 3, [10, 2, 1]),
+    (safe_scatter.contiguous_partition, [5], 3, [5, 0, 0]),
+    (safe_scatter.contiguous_partition, [], 2, [0, 0]),
+]
+
+# sizes, scatter_count, resulting bins
+CONTIGUOUS_PARTITION_TESTS = [
+    ([1] * 10, 3, [[0, 1, 2], [3, 4, 5, 6], [7, 8, 9]]),
+    ([4, 4, 1, 1, 1, 1], 3, [[0], [1], [2, 3, 4, 5]]),
+    ([1, 1, 1, 1, 100], 2, [[0, 1, 2, 3], [4]]),
+    ([100, 1, 1, 1, 1], 4, [[0], [1], [2], [3, 4]]),
+]
+
+
+@pytest.mark.parametrize(["partitioner", "sizes", "scatter_count", "result"],
+                         PARTITION_TESTS)
+def test_partition(partitioner, sizes, scatter_count, result):
+    bins = partitioner(sizes, scatter_count)
+    assert len(bins) == scatter_count
+    assert sorted(index for indexes in bins for index in indexes) == list(
+        range(len(sizes)))
+    assert sorted((sum(sizes[index] for index in indexes)
+                   for indexes in bins), reverse=True) == result
+
+
+def test_karmarkar_karp_partition_large(monkeypatch):
+    # Only the largest items are differenced, the others are added with LPT.
+    monkeypatch.setattr(safe_scatter, "KK_MAX_TOTALS", 40)
+    sizes = [100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 5, 5, 3, 2]
+    bins = safe_scatter.karmarkar_karp_partition(sizes, 4)
+    # 40 totals are 10 items of 4 bins.
+    expected = safe_scatter.karmarkar_karp_partition(sizes[:10], 4)
+    totals = [sum(sizes[index] for index in indexes) for indexes in expected]
+    safe_scatter._lpt_assign(sizes, range(10, len(sizes)), expected, totals)
+    assert bins == expected
+    assert sorted(index for indexes in bins for index in indexes) == list(
+        range(len(sizes)))
+
+
+def test_karmarkar_karp_partition_scales():
+    # A GRCh38 sized genome in pieces of 10 kb. Differencing all of them
+    # would keep 50 totals for each of the 300000 pieces.
+    sizes = [10_000 + i % 7 for i in range(300_000)]
+    tracemalloc.start()
+    try:
+        bins = safe_scatter.karmarkar_karp_partition(sizes, 50)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 50 * 1024 ** 2
+    totals = [sum(sizes[index] for index in indexes) for indexes in bins]
+    assert max(totals) - min(totals) <= max(sizes)
+
+
+@pytest.mark.parametrize("strategy", ["lpt", "kk"])
+def test_safe_scatter_strategy(strategy):
+    regions = [BedRegion("chr1", 0, 720), BedRegion("chr2", 0, 113)]
+    greedy = list(safe_scatter.safe_scatter(regions, 3, 100))
+    balanced = list(safe_scatter.safe_scatter(regions, 3, 100,
+                                              strategy=strategy))
+    assert len(balanced) == 3
+    # Each bin is a sorted list of merged regions.
+    for bin in balanced:
+        assert bin == sorted(bin)
+        assert bin == list(safe_scatter.merge_regions(bin))
+    sizes = [sum(len(region) for region in bin) for bin in balanced]
+    assert sum(sizes) == 833
+    # The greedy strategy leaves 433 bases for the final bin.
+    assert max(sum(len(region) for region in bin) for bin in greedy) == 433
+    assert max(sizes) == 313
+
+
+@pytest.mark.parametrize(["sizes", "scatter_count", "result"],
+                         CONTIGUOUS_PARTITION_TESTS)
+def test_contiguous_partition(sizes, scatter_count, result):
+    assert safe_scatter.contiguous_partition(sizes, scatter_count) == result
+
+
+def test_safe_scatter_contiguous():
+    regions = [BedRegion("chr1", 0, 1000), BedRegion("chr1", 500, 1200),
+               BedRegion("chr2", 0, 450), BedRegion("chr3", 0, 350)]
+    result = list(safe_scatter.safe_scatter(regions, 4, 100,
+                                            strategy="contiguous"))
+    # The overlapping regions on chr1 are merged before cutting, and the
+    # total of 2000 bases is cut into contiguous scatters of 500.
+    assert result == [
+        [BedRegion("chr1", 0, 500)],
+        [BedRegion("chr1", 500, 1000)],
+        [BedRegion("chr1", 1000, 1200), BedRegion("chr2", 0, 300)],
+        [BedRegion("chr2", 300, 450), BedRegion("chr3", 0, 350)],
+    ]
+
+
+def test_safe_scatter_unknown_strategy():
+    with pytest.raises(ValueError):
+        next(safe_scatter.safe_scatter([BedRegion("chr1", 0, 100)], 1, 10,
+                                       strategy="random"))
+
+
+def test_scatter_regions_cut_sites():
+    cut_sites = IntervalIndex([BedRegion("chr1", 130, 140)])
+    chunks = list(safe_scatter.scatter_regions([BedRegion("chr1", 0, 1000)],
+                                               100, cut_sites))
+    assert chunks[:3] == [BedRegion("chr1", 0, 130),
+                          BedRegion("chr1", 130, 230),
+                          BedRegion("chr1", 230, 330)]
+    assert chunks[-1] == BedRegion("chr1", 830, 1000)
+    assert all(len(chunk) >= 100 for chunk in chunks)
+
+
+@pytest.mark.parametrize(["regions", "scatter_count", "min_scatter_size",
+                          "result"], SAFE_SCATTER_TESTS)
+def test_streaming_safe_scatter(regions, scatter_count, min_scatter_size,
+                                result):
+    assert list(safe_scatter.streaming_safe_scatter(
+        lambda: iter(regions), scatter_count, min_scatter_size)) == result
+
+
+@pytest.mark.parametrize(["regions", "scatter_count", "min_scatter_size"],
+                         SAFE_SCATTER_INVALID)
+def test_streaming_safe_scatter_invalid(regions, scatter_count,
+                                        min_scatter_size):
+    with pytest.raises(RuntimeError):
+        next(safe_scatter.streaming_safe_scatter(
+            lambda: iter(regions), scatter_count, min_scatter_size))
+
+
+def test_streaming_safe_scatter_matches():
+    regions = [BedRegion(f"chr{i % 5}", i * 1000, i * 1000 + (i * 7919) % 5000)
+               for i in range(200)]
+    weights = RegionWeights([("chr1", 0, 50000, 1000),
+                             ("chr3", 0, 200000, 100)])
+    for weight in (len, weights):
+        assert list(safe_scatter.streaming_safe_scatter(
+            lambda: iter(regions), 7, 100, weight=weight)) == list(
+            safe_scatter.safe_scatter(regions, 7, 100, weight=weight))
+
+
+def test_streaming_safe_scatter_yields_early():
+    passes = []
+
+    def regions():
+        passes.append(0)
+        for i in range(10):
+            passes[-1] += 1
+            yield BedRegion("chr1", i * 100, i * 100 + 100)
+
+    bins = safe_scatter.streaming_safe_scatter(regions, 5, 100)
+    assert next(bins) == [BedRegion("chr1", 0, 200)]
+    # The second pass only read the regions of the first bin and the first
+    # region of the next bin.
+    assert passes == [10, 3]
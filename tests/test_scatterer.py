@@ -0,0 +1,64 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from pathlib import Path
+
+from chunked_scatter import Scatterer
+from chunked_scatter.chunked_scatter import chunked_scatter
+from chunked_scatter.intervals import IntervalIndex
+from chunked_scatter.parsers import file_to_regions
+from chunked_scatter.regions import BedRegion
+from chunked_scatter.safe_scatter import safe_scatter
+from chunked_scatter.scatter_regions import scatter_regions
+
+import pytest
+
+DATA_DIR = Path(__file__).parent / Path("data")
+REF_DICT = Path(DATA_DIR, "ref.dict")
+
+
+@pytest.fixture(scope="module")
+def scatterer():
+    return Scatterer.from_file(REF_DICT)
+
+
+@pytest.mark.parametrize("chunk_size", [300_000, 10**6])
+def test_scatterer_chunked_scatter(scatterer, chunk_size):
+    assert scatterer.chunked_scatter(chunk_size, 150, 10**6) == list(
+        chunked_scatter(file_to_regions(REF_DICT), chunk_size, 150, 10**6))
+
+
+@pytest.mark.parametrize("scatter_size", [1_100_000, 3_200_000])
+def test_scatterer_scatter_regions(scatterer, scatter_size):
+    assert scatterer.scatter_regions(scatter_size, True) == list(
+        scatter_regions(file_to_regions(REF_DICT), scatter_size, True))
+
+
+@pytest.mark.parametrize("scatter_count", [1, 3, 7])
+def test_scatterer_safe_scatter(scatterer, scatter_count):
+    assert scatterer.safe_scatter(scatter_count) == list(
+        safe_scatter(list(file_to_regions(REF_DICT)), scatter_count))
+
+
+def test_scatterer_exclude():
+    scatterer = Scatterer([BedRegion("chr1", 0, 1000)],
+                          exclude=IntervalIndex([BedRegion("chr1", 400, 600)]))
+    assert scatterer.scatter_regions(10_000) == [
+        [BedRegion("chr1", 0, 400), BedRegion("chr1", 600, 1000)]]
@@ -0,0 +1,182 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+
+from chunked_scatter.client import ServerError, main, request
+from chunked_scatter.safe_scatter import main as safe_scatter_main
+from chunked_scatter.server import ScatterServer, absolute_paths, \
+    parse_request
+
+import pytest
+
+DATA_DIR = Path(__file__).parent / Path("data")
+
+
+@pytest.fixture
+def server(tmpdir):
+    socket_path = str(tmpdir / "server.sock")
+    server = ScatterServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+@pytest.fixture
+def work_dir(tmpdir):
+    shutil.copy(str(Path(DATA_DIR, "ref.dict")), str(tmpdir))
+    return str(tmpdir)
+
+
+def test_server_matches_program(server, work_dir, monkeypatch):
+    monkeypatch.chdir(work_dir)
+    sys.argv = ["safe-scatter", "-c", "3", "-p", "program/scatter-",
+                "ref.dict"]
+    safe_scatter_main()
+    response = request("safe-scatter", ["-c", "3", "-p", "server/scatter-",
+                                        "ref.dict"],
+                       work_dir, server.server_address)
+    assert response["paths"] == [f"server/scatter-{i}.bed" for i in range(3)]
+    for i in range(3):
+        assert (Path(work_dir, "server", f"scatter-{i}.bed").read_text() ==
+                Path(work_dir, "program", f"scatter-{i}.bed").read_text())
+
+
+def test_server_keeps_regions(server, work_dir):
+    for program, arguments in [("safe-scatter", ["-c", "3"]),
+                               ("safe-scatter", ["-c", "4"]),
+                               ("scatter-regions", ["-s", "1000000"]),
+                               ("chunked-scatter", ["-c", "500000"])]:
+        request(program, arguments + ["ref.dict"], work_dir,
+                server.server_address)
+    assert len(server.scatterers) == 1
+    # A changed input is read again.
+    with open(os.path.join(work_dir, "ref.dict"), "at") as ref_dict:
+        ref_dict.write("@SQ\tSN:chr3\tLN:1000\n")
+    request("safe-scatter", ["-c", "3", "ref.dict"], work_dir,
+            server.server_address)
+    assert len(server.scatterers) == 2
+
+
+@pytest.mark.parametrize(["program", "arguments"], [
+    ("safe-scatter", ["ref.dict"]),
+    ("safe-scatter", ["-c", "3", "-"]),
+    ("split", ["ref.dict"]),
+    ("safe-scatter", ["-c", "3", "--profile", "ref.dict"]),
+    ("safe-scatter", ["-c", "3", "--streaming", "ref.dict"]),
+])
+def test_server_invalid_request(server, work_dir, program, arguments):
+    with pytest.raises(ServerError) as error:
+        request(program, arguments, work_dir, server.server_address)
+    assert error.value.status == 2
+
+
+def test_client_main(server, work_dir, monkeypatch, capsys):
+    monkeypatch.chdir(work_dir)
+    sys.argv = ["scatter-client", "--socket", server.server_address,
+                "scatter-regions", "-s", "1000000", "-P", "ref.dict"]
+    main()
+    assert capsys.readouterr().out.splitlines()[0] == "scatter-0.bed"
+
+
+def test_server_report(server, work_dir):
+    request("safe-scatter", ["-c", "3", "--report", "report.json",
+                             "ref.dict"], work_dir, server.server_address)
+    report = json.loads(Path(work_dir, "report.json").read_text())
+    assert report["scatters"] == 3
+    assert set(report["stages"]) == {"parse", "scatter", "write"}
+
+
+def test_server_loads_inputs_concurrently(server, work_dir, monkeypatch):
+    shutil.copy(os.path.join(work_dir, "ref.dict"),
+                os.path.join(work_dir, "other.dict"))
+    load = ScatterServer.load
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def blocking_load(args):
+        loads.append(args.input)
+        if args.input.endswith("ref.dict"):
+            started.set()
+            release.wait(5)
+        return load(args)
+
+    monkeypatch.setattr(server, "load", blocking_load)
+
+    def args(path):
+        return absolute_paths(parse_request("safe-scatter", ["-c", "3", path]),
+                              work_dir)
+
+    waiting = [threading.Thread(target=server.scatterer,
+                                args=(args("ref.dict"),))
+               for _ in range(2)]
+    for thread in waiting:
+        thread.start()
+    assert started.wait(5)
+    # Another input is loaded while ref.dict is still loading.
+    server.scatterer(args("other.dict"))
+    assert not release.is_set()
+    release.set()
+    for thread in waiting:
+        thread.join()
+    # Concurrent requests for the same input load it once.
+    assert sorted(os.path.basename(path) for path in loads) == \
+        ["other.dict", "ref.dict"]
+
+
+@pytest.mark.parametrize("arguments", [[], ["--manifest"]])
+def test_server_concurrent_same_prefix(server, work_dir, monkeypatch,
+                                       arguments):
+    # Both requests have written their temporary files before either
+    # renames them, so they would clash if the names were the same.
+    barrier = threading.Barrier(2, timeout=5)
+    replace = os.replace
+
+    def synchronized_replace(source, destination):
+        barrier.wait()
+        replace(source, destination)
+
+    monkeypatch.setattr(os, "replace", synchronized_replace)
+    errors = []
+
+    def scatter():
+        try:
+            request("safe-scatter", ["-c", "3", *arguments, "ref.dict"],
+                    work_dir, server.server_address)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=scatter) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert not [name for name in os.listdir(work_dir)
+                if name.endswith(".tmp")]
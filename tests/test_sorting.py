@@ -0,0 +1,72 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import random
+import sys
+
+from chunked_scatter.chunked_scatter import main
+from chunked_scatter.regions import BedRegion
+from chunked_scatter.sorting import natural_key, region_sort_key, \
+    sort_regions
+
+import pytest
+
+
+def test_natural_key():
+    contigs = ["chr10", "chrX", "chr2", "chr1_random", "chr1", "HLA-A*01:01"]
+    assert sorted(contigs, key=natural_key) == [
+        "HLA-A*01:01", "chr1", "chr1_random", "chr2", "chr10", "chrX"]
+
+
+def test_region_sort_key_contig_order():
+    regions = [BedRegion("chr10", 0, 10), BedRegion("chrM", 0, 10),
+               BedRegion("chr2", 5, 10), BedRegion("chr2", 0, 10),
+               BedRegion("chrY", 0, 10)]
+    key = region_sort_key(["chrM", "chr2"])
+    assert sorted(regions, key=key) == [
+        BedRegion("chrM", 0, 10), BedRegion("chr2", 0, 10),
+        BedRegion("chr2", 5, 10), BedRegion("chr10", 0, 10),
+        BedRegion("chrY", 0, 10)]
+
+
+@pytest.mark.parametrize("buffer_size", [1, 7, 100, 1000])
+def test_sort_regions(tmpdir, buffer_size):
+    random.seed(buffer_size)
+    regions = [BedRegion(f"chr{random.randint(1, 12)}", start, start + 10)
+               for start in random.sample(range(10000), 500)]
+    sorted_regions = list(sort_regions(regions, buffer_size=buffer_size,
+                                       temp_dir=str(tmpdir)))
+    assert sorted_regions == sorted(regions, key=region_sort_key())
+    # The temporary files are removed.
+    assert tmpdir.listdir() == []
+
+
+def test_sort_option(tmpdir):
+    bed = tmpdir / "unsorted.bed"
+    bed.write("chr2\t0\t100\n"
+              "chr1\t500\t1000\n"
+              "chr10\t0\t100\n"
+              "chr1\t0\t600\n")
+    sys.argv = ["script", "-p", "{}/test_result_".format(tmpdir), str(bed),
+                "--sort", "--sort-buffer-size", "2", "-m", "10000"]
+    main()
+    assert (tmpdir / "test_result_0.bed").read() == ("chr1\t0\t1000\n"
+                                                     "chr2\t0\t100\n"
+                                                     "chr10\t0\t100\n")
@@ -0,0 +1,69 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+DATA_DIR = Path(__file__).parent / Path("data")
+PROGRAMS = ["chunked_scatter.chunked_scatter", "chunked_scatter.safe_scatter",
+            "chunked_scatter.scatter_regions", "chunked_scatter.manifest"]
+# These modules take a long time to import and are only needed for some
+# inputs or options.
+SLOW_MODULES = ["pysam", "multiprocessing", "concurrent.futures", "logging"]
+
+
+def import_times(code: str) -> Dict[str, int]:
+    """
+    Run python -X importtime and return the cumulative import time in
+    microseconds of each imported module.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            stderr=subprocess.PIPE, check=True,
+                            universal_newlines=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("program", PROGRAMS)
+def test_no_slow_imports(program):
+    times = import_times(f"import {program}")
+    assert program in times
+    for module in SLOW_MODULES:
+        assert module not in times
+
+
+def test_no_pysam_for_dict_input(tmpdir):
+    prefix = str(tmpdir / "scatter-")
+    code = (f"import sys\n"
+            f"from chunked_scatter.safe_scatter import main\n"
+            f"sys.argv = ['safe-scatter', '-c', '3', '-p', {prefix!r}, "
+            f"{str(Path(DATA_DIR, 'ref.dict'))!r}]\n"
+            f"main()\n")
+    assert "pysam" not in import_times(code)
+    assert Path(tmpdir, "scatter-2.bed").exists()
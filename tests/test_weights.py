@@ -0,0 +1,162 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gzip
+import shutil
+from pathlib import Path
+
+from chunked_scatter.indexes import read_index
+from chunked_scatter.parsers import BedRegion
+from chunked_scatter.weights import RegionWeights, file_to_weights
+
+import pysam
+
+import pytest
+
+datadir = Path(__file__).parent / Path("data")
+
+WEIGHTS = RegionWeights([("chr1", 0, 100, 10), ("chr1", 50, 150, 20),
+                         ("chr2", 10, 20, 5), ("chr2", 20, 20, 7)])
+
+# region, weight
+REGION_WEIGHT_TESTS = [
+    (BedRegion("chr1", 0, 100), 20),
+    (BedRegion("chr1", 0, 50), 5),
+    (BedRegion("chr1", 50, 100), 15),
+    (BedRegion("chr1", 100, 1000), 10),
+    (BedRegion("chr2", 0, 15), 2.5),
+    (BedRegion("chr3", 0, 100), 0),
+]
+
+
+@pytest.mark.parametrize(["region", "result"], REGION_WEIGHT_TESTS)
+def test_region_weights(region, result):
+    assert WEIGHTS(region) == pytest.approx(result)
+
+
+def test_region_weights_default_density():
+    weights = RegionWeights([("chr1", 100, 200, 10), ("chr1", 300, 400, 30)],
+                            default_density=1)
+    assert weights(BedRegion("chr1", 0, 100)) == pytest.approx(100)
+    assert weights(BedRegion("chr1", 150, 350)) == pytest.approx(120)
+    assert weights(BedRegion("chr1", 400, 500)) == pytest.approx(100)
+    assert weights(BedRegion("chr2", 0, 10)) == pytest.approx(10)
+    assert weights.total() == pytest.approx(40)
+    assert RegionWeights([("chr1", 100, 200, 10), ("chr1", 150, 250, 10)],
+                         default_density=None).default_density == \
+        pytest.approx(0.1333333)
+
+
+def test_region_weights_total():
+    assert WEIGHTS.total() == pytest.approx(35)
+
+
+@pytest.mark.parametrize(["in_file", "use_index"], [
+    ("bins.vcf.gz", False), ("bins.vcf.gz", True), ("bins.bcf", True)])
+def test_vcf_file_to_weights(in_file, use_index):
+    weights = file_to_weights(datadir / in_file, use_index)
+    assert weights.total() == pytest.approx(6)
+    assert weights(BedRegion("chr1", 0, 200000)) == pytest.approx(4)
+    assert weights(BedRegion("chr2", 0, 40000)) == pytest.approx(2)
+
+
+def test_file_to_weights_unknown():
+    with pytest.raises(NotImplementedError):
+        file_to_weights("weights.txt")
+
+
+@pytest.mark.parametrize("in_file", ["reads.bam", "reads.cram"])
+def test_alignment_file_to_weights(in_file):
+    weights = file_to_weights(datadir / in_file)
+    # Most reads are in the first 16 kb of chr1, a few further on chr1 and
+    # on chr2.
+    first_bin = weights(BedRegion("chr1", 0, 16384))
+    assert first_bin > weights(BedRegion("chr1", 16384, 200000)) > 0
+    assert weights(BedRegion("chr2", 0, 20000)) > 0
+    assert weights(BedRegion("chr3", 0, 10000)) == 0
+
+
+def test_bam_weights_read_counts():
+    weights = file_to_weights(datadir / "reads.bam")
+    assert weights.total() == 1070
+    assert weights(BedRegion("chr2", 0, 20000)) == pytest.approx(20)
+
+
+@pytest.fixture
+def chrm_bam(tmpdir):
+    # 1640 reads on a 16569 bp contig. htslib merges the bins of so few
+    # reads into a single bin of 131072 bp.
+    bam = str(tmpdir / "chrM.bam")
+    header = {"HD": {"VN": "1.6", "SO": "coordinate"},
+              "SQ": [{"SN": "chrM", "LN": 16569}]}
+    with pysam.AlignmentFile(bam, "wb", header=header) as bam_h:
+        for number in range(1640):
+            read = pysam.AlignedSegment(bam_h.header)
+            read.query_name = f"read{number}"
+            read.reference_id = 0
+            read.reference_start = number * 10
+            read.cigarstring = "100M"
+            read.query_sequence = "A" * 100
+            bam_h.write(read)
+    pysam.index(bam)
+    return bam
+
+
+def test_alignment_file_to_weights_clipped_bins(chrm_bam):
+    bins = read_index(chrm_bam + ".bai", ["chrM"])[0].bins
+    assert [(start, end) for start, end, _ in bins] == [(0, 131072)]
+    weights = file_to_weights(chrm_bam)
+    assert weights(BedRegion("chrM", 0, 16569)) == pytest.approx(1640)
+
+
+def test_vcf_file_to_weights_clipped_bins():
+    # The second bin of chr2 covers 16384-32768, but chr2 is 20000 bp, so
+    # all of its variants are within the contig.
+    for use_index in (False, True):
+        weights = file_to_weights(datadir / "bins.vcf.gz", use_index)
+        assert weights(BedRegion("chr2", 0, 20000)) == pytest.approx(2)
+
+
+def test_alignment_file_to_weights_no_index(tmpdir):
+    shutil.copy(str(datadir / "reads.bam"), str(tmpdir))
+    with pytest.raises(FileNotFoundError):
+        file_to_weights(tmpdir / "reads.bam")
+
+
+@pytest.mark.parametrize("name", ["profile.bedgraph", "profile.bg.gz",
+                                  "profile.bed"])
+def test_cost_profile_to_weights(tmpdir, name):
+    contents = ("track type=bedGraph\n"
+                "# runtimes\n"
+                "chr1\t0\t100\t10\n"
+                "chr1\t100\t200\t30.5\n")
+    path = Path(str(tmpdir / name))
+    if name.endswith(".gz"):
+        with gzip.open(str(path), "wt") as path_h:
+            path_h.write(contents)
+    else:
+        path.write_text(contents)
+    weights = file_to_weights(path)
+    assert weights.total() == pytest.approx(40.5)
+    assert weights(BedRegion("chr1", 50, 150)) == pytest.approx(20.25)
+    # Bases outside the profile get its mean cost per base.
+    assert weights(BedRegion("chr2", 0, 100)) == pytest.approx(20.25)
+    assert weights(BedRegion("chr1", 150, 300)) == pytest.approx(
+        15.25 + 20.25)